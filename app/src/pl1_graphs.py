@@ -2,7 +2,7 @@ from app.utils.make_heatmap_labels import make_labels, split_labels
 from app.utils.shell_cmds import shell
 from app.utils.dist_mat_to_tree import DistMat2Tree
 from app.utils.gomdb_constructor import GOMDB_Constructor
-from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor
+from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor, GOMScoringPool
 from app.utils.taxo_label_constructor import TaxoLabel_Constructor
 from app.utils.similarity_matrix_constructor import SimilarityMat_Constructor
 from app.utils.virus_grouping_estimator import VirusGrouping_Estimator
@@ -47,7 +47,9 @@ class GRAViTyDendrogramAndHeatmapConstruction:
                                            self.payload["PphmmSigScoreThreshold"],
                                            self.payload['SimilarityMeasurementScheme'],
                                            self.payload['p'],
-                                           self.fnames
+                                           self.fnames,
+                                           N_CPUs=self.payload["N_CPUs"],
+                                           BlockSize=self.payload.get("SimilarityBlockSize", 256)
                                            )
         DistMat = 1 - SimMat
         DistMat[DistMat < 0] = 0
@@ -74,44 +76,47 @@ class GRAViTyDendrogramAndHeatmapConstruction:
             '''Compute bootstrap support'''
             progress_msg("Computing Dendrogram Bootstrap Support")
             N_PPHMMs = self.ref_annotations["PPHMMSignatureTable"].shape[1]
-            for Bootstrap_i in range(0, self.payload['N_Bootstrap']):
-                print(f"Round {Bootstrap_i+1}/{self.payload['N_Bootstrap']}")
-                '''Construct bootstrapped PPHMMSignatureTable and PPHMMLocationTable'''
-                PPHMM_IndexList = np.random.choice(
-                    list(range(N_PPHMMs)), N_PPHMMs, replace=True)
-                BootstrappedPPHMMSignatureTable = self.ref_annotations[
-                    "PPHMMSignatureTable"][:, PPHMM_IndexList]
-                BootstrappedPPHMMLocationTable = self.ref_annotations[
-                    "PPHMMSignatureTable"][:, PPHMM_IndexList]
-                BootstrappedGOMSignatureTable = None
-
-                if "G" in self.payload['SimilarityMeasurementScheme']:
-                    '''Construct bootstrapped GOMSignatureTable'''
-                    BootstrappedGOMDB = GOMDB_Constructor(TaxoGroupingList=self.genomes["TaxoGroupingList"],
-                                                          PPHMMLocationTable=BootstrappedPPHMMLocationTable,
-                                                          GOMIDList=self.ref_annotations["GOMIDList"]
-                                                          )
-                    BootstrappedGOMSignatureTable = GOMSignatureTable_Constructor(PPHMMLocationTable=BootstrappedPPHMMLocationTable,
-                                                                                  GOMDB=BootstrappedGOMDB,
-                                                                                  GOMIDList=self.ref_annotations["GOMIDList"],
-                                                                                  bootstrap=Bootstrap_i
-                                                                                  )
-
-                '''Construct a dendrogram from the bootstrapped data'''
-                BootstrappedDistMat = self.dist_mat_constructor(BootstrappedPPHMMSignatureTable,
-                                                               BootstrappedGOMSignatureTable,
-                                                               BootstrappedPPHMMLocationTable,
-                                                               interim_Rscheme_matrix
+            with GOMScoringPool(self.payload["N_CPUs"]) as GOMPool:
+                for Bootstrap_i in range(0, self.payload['N_Bootstrap']):
+                    print(f"Round {Bootstrap_i+1}/{self.payload['N_Bootstrap']}")
+                    '''Construct bootstrapped PPHMMSignatureTable and PPHMMLocationTable'''
+                    PPHMM_IndexList = np.random.choice(
+                        list(range(N_PPHMMs)), N_PPHMMs, replace=True)
+                    BootstrappedPPHMMSignatureTable = self.ref_annotations[
+                        "PPHMMSignatureTable"][:, PPHMM_IndexList]
+                    BootstrappedPPHMMLocationTable = self.ref_annotations[
+                        "PPHMMSignatureTable"][:, PPHMM_IndexList]
+                    BootstrappedGOMSignatureTable = None
+
+                    if "G" in self.payload['SimilarityMeasurementScheme']:
+                        '''Construct bootstrapped GOMSignatureTable'''
+                        BootstrappedGOMDB = GOMDB_Constructor(TaxoGroupingList=self.genomes["TaxoGroupingList"],
+                                                              PPHMMLocationTable=BootstrappedPPHMMLocationTable,
+                                                              GOMIDList=self.ref_annotations["GOMIDList"]
+                                                              )
+                        BootstrappedGOMSignatureTable = GOMSignatureTable_Constructor(PPHMMLocationTable=BootstrappedPPHMMLocationTable,
+                                                                                      GOMDB=BootstrappedGOMDB,
+                                                                                      GOMIDList=self.ref_annotations["GOMIDList"],
+                                                                                      bootstrap=Bootstrap_i,
+                                                                                      N_CPUs=self.payload["N_CPUs"],
+                                                                                      GOMPool=GOMPool
+                                                                                      )
+
+                    '''Construct a dendrogram from the bootstrapped data'''
+                    BootstrappedDistMat = self.dist_mat_constructor(BootstrappedPPHMMSignatureTable,
+                                                                   BootstrappedGOMSignatureTable,
+                                                                   BootstrappedPPHMMLocationTable,
+                                                                   interim_Rscheme_matrix
+                                                                   )
+
+                    '''Generate bs dist matrix tree'''
+                    BootstrappedVirusDendrogram = DistMat2Tree(DistMat=BootstrappedDistMat,
+                                                               LeafList=TaxoLabelList,
+                                                               Dendrogram_LinkageMethod=self.payload['Dendrogram_LinkageMethod']
                                                                )
-
-                '''Generate bs dist matrix tree'''
-                BootstrappedVirusDendrogram = DistMat2Tree(DistMat=BootstrappedDistMat,
-                                                           LeafList=TaxoLabelList,
-                                                           Dendrogram_LinkageMethod=self.payload['Dendrogram_LinkageMethod']
-                                                           )
-                with open(self.fnames['VirusDendrogramDistFile'], "a") as VirusDendrogramDist_txt:
-                    VirusDendrogramDist_txt.write(
-                        BootstrappedVirusDendrogram+"\n")
+                    with open(self.fnames['VirusDendrogramDistFile'], "a") as VirusDendrogramDist_txt:
+                        VirusDendrogramDist_txt.write(
+                            BootstrappedVirusDendrogram+"\n")
 
             if os.path.isfile(self.fnames['BootstrappedDendrogramFile']):
                 '''Bootstrap gets upset if trying to overwrite existing file'''
@@ -1,7 +1,5 @@
 from ete3 import Tree
 from Bio import SeqIO, AlignIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
 from collections import Counter
 from alive_progress import alive_it
 import numpy as np
@@ -17,10 +15,17 @@ from app.utils.line_count import LineCount
 from app.utils.dist_mat_to_tree import DistMat2Tree
 from app.utils.download_genbank_file import DownloadGenBankFile
 from app.utils.console_messages import section_header
-from app.utils.orf_identifier import get_orf_trasl_table, no_orf_match, find_orfs
+from app.utils.orf_identifier import get_orf_trasl_table, no_orf_match
+from app.utils.orf_catalogue import get_orf_catalogue
+from app.utils.protein_extraction import extract_proteins
+from app.utils.protein_catalogue import ProteinCatalogue
+from app.utils.accession_index import get_accession_index, normalise_accession
+from app.utils.sequence_store import get_sequence_store
+from app.utils.vmr_changeset import record_sequence_changes
 from app.utils.stdout_utils import clean_stdout, progress_msg, warning_msg
 from app.utils.retrieve_pickle import retrieve_genome_vars
 from app.utils.shell_cmds import shell
+from app.utils.compressed_io import append_file
 from app.utils.mkdirs import mkdir_pphmmdbc
 from app.utils.error_handlers import raise_gravity_error, raise_gravity_warning, error_handler_hmmbuild, error_handle_mafft, error_handler_mash_sketch, error_handler_mash_dist, error_handler_mcl
 from app.utils.taxo_label_constructor import TaxoLabel_Constructor
@@ -47,130 +52,73 @@ class PPHMMDBConstruction:
             '''If no gb file provided, attempt to pull seqs'''
             progress_msg("You didn't specify an input genbank filename that exists. Downloading sequences from Genbank")
             DownloadGenBankFile(self.GenomeSeqFile, # RM < TODO We should give users option to provide their own gb file if not on genbank
-                                self.genomes["SeqIDLists"], self.payload["genbank_email"])
+                                self.genomes["SeqIDLists"], self.payload["genbank_email"], self.payload)
 
-        '''Parse gb file'''
-        GenBankDict = SeqIO.index(self.GenomeSeqFile, "genbank")
-        CleanGenbankDict = {}
-        for i in GenBankDict.items():
-            if "u" in str(i[1].seq).lower():
-                i[1].seq = i[1].seq.back_transcribe()
-            CleanGenbankDict[i[0].split(".")[0]] = i[1]
+        '''Index gb file; built once per input file and reused by later stages and runs'''
+        GenBankIndex = get_accession_index(self.GenomeSeqFile, self.fnames)
 
         '''Check if gb file is missing any seqs from the VMR'''
-        gb_missing_seqs = []
-        for vmr_seq_id in self.genomes["SeqIDLists"]:
-            match = False
-            for gb_seq_id in CleanGenbankDict.keys():
-                if vmr_seq_id[0].upper() == gb_seq_id.upper():
-                    match = True
-                    break
-            if not match:
-                gb_missing_seqs.append(vmr_seq_id[0].upper())
+        gb_seq_ids = {gb_seq_id.upper() for gb_seq_id in GenBankIndex.keys()}
+        gb_missing_seqs = [vmr_seq_id[0].upper() for vmr_seq_id in self.genomes["SeqIDLists"] if vmr_seq_id[0].upper() not in gb_seq_ids]
 
         if len(gb_missing_seqs) > 0:
             '''If missing seqs in gb file, attempt to get them from genbank'''
             progress_msg(f"GRAViTy detected a mismatch in sequence numbers between input genbank and VMR files. Attempting to fix with a genbank pull...")
             shell("rm data/temp.gb")
-            DownloadGenBankFile("data/temp.gb", [[i] for i in gb_missing_seqs], self.payload["genbank_email"])
+            DownloadGenBankFile("data/temp.gb", [[i] for i in gb_missing_seqs], self.payload["genbank_email"], self.payload)
             SecondGenBankDict = SeqIO.index("data/temp.gb", "genbank")
-            CleanSecondGenbankDict = {}
-            for i in SecondGenBankDict.items():
-                CleanSecondGenbankDict[i[0].split(".")[0]] = i[1]
+            second_gb_seq_ids = {normalise_accession(second_gb_seq_id) for second_gb_seq_id in SecondGenBankDict.keys()}
 
             '''Check if seqs are still missing'''
-            still_missing_seqs = []
-            for missing_seq in gb_missing_seqs:
-                match = False
-                for second_gb_seq_id in CleanSecondGenbankDict.keys():
-                    if second_gb_seq_id == missing_seq:
-                        match = True
-                        CleanGenbankDict[missing_seq] = CleanSecondGenbankDict[missing_seq]
-                        break
-                if not match:
-                    still_missing_seqs.append(second_gb_seq_id)
+            still_missing_seqs = [missing_seq for missing_seq in gb_missing_seqs if missing_seq not in second_gb_seq_ids]
             if len(still_missing_seqs) > 0:
                 '''If still missing seqs, warn user'''
                 raise_gravity_error(f"There was a mismatch between the number of sequences in your VMR and the sequences you provided."
                                     f"GRAViTy-V2 attempted to pull the additional sequences from GenBank, but didn't find them"
                                     f"This means that some of your sequences are not on GenBank: please manually make a GenBank file containing all of your sequences and point GRAViTy-V2 to its path with the 'GenomeSeqFile' parameter.")
             else:
-                '''If missing seqs found, concat the new genome seq file and tidy'''
-                shell(f"cat data/temp.gb >> {self.GenomeSeqFile}")
+                '''If missing seqs found, concat the new genome seq file and tidy; file has changed, so re-index'''
+                append_file("data/temp.gb", self.GenomeSeqFile)
                 shell(f"rm data/temp.gb")
-        return {k.split(".")[0]: v for k, v in CleanGenbankDict.items()}
+                GenBankIndex = get_accession_index(self.GenomeSeqFile, self.fnames)
+        return GenBankIndex.records()
 
     def sequence_extraction(self, GenBankDict):
         '''4/10: Extract protein sequences from VMR using GenBank data; manually annotate ORFs if needed'''
         progress_msg(
             f"- Extract/predict protein sequences from virus genomes, excluding proteins with lengthes <{self.payload['ProteinLength_Cutoff']} aa")
-        ProtList, ProtIDList = [
-        ], []
-        raw_seqs = {}
-
-        for SeqIDList, TranslTable, BaltimoreGroup, Order, Family, SubFam, Genus, VirusName, TaxoGrouping in alive_it(zip(self.genomes["SeqIDLists"], self.genomes["TranslTableList"], self.genomes["BaltimoreList"], self.genomes["OrderList"], self.genomes["FamilyList"], self.genomes["SubFamList"], self.genomes["GenusList"], self.genomes["VirusNameList"], self.genomes["TaxoGroupingList"]), total=self.genomes["TaxoGroupingList"].shape[0]):
+        ProtCatalogue = ProteinCatalogue()
+        orf_catalogue = get_orf_catalogue(self.payload, self.fnames)
+        SeqStore = get_sequence_store(self.GenomeSeqFile, self.fnames)
+        '''Sequence file is final now (downloaded or extended if needed): record any sequence revisions in the changeset'''
+        record_sequence_changes(self.fnames, self.genomes, SeqStore)
+
+        '''Sometimes an Acc ID doesn't have a matching record (usually when multiple seqs for 1 virus); check before farming out genomes'''
+        for SeqIDList in self.genomes["SeqIDLists"]:
             for SeqID in SeqIDList:
-                '''Sometimes an Acc ID doesn't have a matching record (usually when multiple seqs for 1 virus)... - skip if true'''
-                try:
-                    GenBankRecord = GenBankDict[SeqID]
-                except KeyError as ex:
-                    raise_gravity_error(f"{ex}\n"
+                if SeqID not in GenBankDict:
+                    raise_gravity_error(f"'{SeqID}'\n"
                                         f"ERROR: I couldn't extract a sequence ID from the input Genbank file.\n"
                                         f"This usually happens when you've tried to re-run the experiment with an old .gb file, or if you didn't provide an accession number for sequences in your input VMR.\n"
                                         f"Try deleting your input .gb file ({self.GenomeSeqFile}), then starting again. "
                                         f"Otherwise it might be because your genbank file names don't match your VMR names, if you've provided your own file rather than downloading it automatically from genbank.")
 
-                GenBankID = GenBankRecord.name
-                GenBankFeatures = GenBankRecord.features
-
-                allow_genbank_annotations = False # RM < TODO PARAMETERISE
-                ContainProtAnnotation = False
-                if allow_genbank_annotations:
-                    '''Extract protein sequences'''
-                    for Feature in GenBankFeatures:
-                        if(Feature.type == 'CDS' and "protein_id" in Feature.qualifiers and "translation" in Feature.qualifiers):
-                            ContainProtAnnotation = True
-                            try: # TODO Triple exception makes me sad
-                                ProtName = Feature.qualifiers["product"][0]
-                            except KeyError:
-                                try:
-                                    ProtName = Feature.qualifiers["gene"][0]
-                                except KeyError:
-                                    try:
-                                        ProtName = Feature.qualifiers["note"][0]
-                                    except KeyError:
-                                        ProtName = "Hypothetical protein"
-                            ProtID = Feature.qualifiers["protein_id"][0]
-                            ProtSeq = Feature.qualifiers["translation"][0]
-                            if len(ProtSeq) >= self.payload['ProteinLength_Cutoff']:
-                                ProtRecord = SeqRecord(Seq(ProtSeq),
-                                                        id=f"{GenBankID}|{ProtID}",
-                                                        name=f"{GenBankID}|{ProtID}",
-                                                        description=ProtName,
-                                                        annotations={'taxonomy': [BaltimoreGroup, Order, Family, SubFam, Genus, VirusName, TaxoGrouping]})
-                                ProtList.append(ProtRecord)
-                                ProtIDList.append(f"{GenBankID}|{ProtID}")
-
-                '''If the genome isn't annotated with any ORFs, find some'''
-                if not ContainProtAnnotation:
-                    prots, prot_ids, raw_nas = find_orfs(GenBankID, GenBankRecord.seq, TranslTable, self.payload['ProteinLength_Cutoff'],
-                                                    taxonomy_annots=[BaltimoreGroup, Order, Family, SubFam, Genus, VirusName, TaxoGrouping])
-                    if len(prots) == 0:
-                        raise_gravity_warning(f"Sequence {SeqID} doesn't code for any ORFs!")
-                    ProtList += prots
-                    ProtIDList += prot_ids
-                    raw_seqs.update(raw_nas)
+        '''One job per genome; proteins come back in VMR order and are streamed to the Mash subject file'''
+        Jobs = list(zip(self.genomes["SeqIDLists"], self.genomes["TranslTableList"]))
+        TaxoLists = zip(self.genomes["BaltimoreList"], self.genomes["OrderList"], self.genomes["FamilyList"], self.genomes["SubFamList"], self.genomes["GenusList"], self.genomes["VirusNameList"], self.genomes["TaxoGroupingList"])
+        with open(self.fnames['MashSubjectFile'], "w") as MashSubject_txt:
+            for (prot_ids, prot_seqs, prot_descs), TaxoList in zip(alive_it(extract_proteins(Jobs, GenBankDict, SeqStore, orf_catalogue, self.payload), total=len(Jobs)), TaxoLists):
+                FirstRow = len(ProtCatalogue)
+                ProtCatalogue.add_genome(list(TaxoList), prot_ids, prot_seqs, prot_descs)
+                ProtCatalogue.write_fasta(MashSubject_txt, rows=range(FirstRow, len(ProtCatalogue)))
         clean_stdout()
 
-        if len(ProtList) == 0:
+        if len(ProtCatalogue) == 0:
             raise_gravity_error(f"No protein sequences could be extracted from input sequences. Did you input untranslated RNA sequences?")
 
-        with open(self.fnames['MashSubjectFile'], "w") as MashSubject_txt:
-            SeqIO.write(ProtList, MashSubject_txt, "fasta") # RM < TODO Swap to pure py?
-
         # TODO < Break out into new fn
         '''Save ref seqs for comparative analysis'''
-        ref_seqs = [[i, str(GenBankDict[i].seq)] for i in GenBankDict.keys()]
+        ref_seqs = [[i, SeqStore.seq_str(i)] for i in GenBankDict.keys()]
         TaxoLabelList = TaxoLabel_Constructor(SeqIDLists=self.genomes["SeqIDLists"],
                                               FamilyList=self.genomes["FamilyList"],
                                               GenusList=self.genomes["GenusList"],
@@ -189,16 +137,16 @@ class PPHMMDBConstruction:
                 if seq_id[0] in output_seq[0]:
                     sorted_seqs.append(output_seq)
         with open(self.fnames['RefSeqFile'], "w") as f: [f.write(f">{i[0]}\n{i[1]}\n") for i in sorted_seqs]
-        return ProtList, np.array(ProtIDList)
+        return ProtCatalogue
 
-    def mash_analysis(self, ProtList):
+    def mash_analysis(self, ProtCatalogue):
         '''6/10: Perform ALL-VERSUS-ALL Mash analysis'''
         progress_msg("Creating Mash sketches")
-        SeenPair, SeenPair_i, MashMatrix, N_ProtSeqs = {}, 0, [], len(ProtList)
+        SeenPair, SeenPair_i, MashMatrix, N_ProtSeqs = {}, 0, [], len(ProtCatalogue)
 
         if self.payload["UseBlast"]:
             '''Use BLASTp instead of Mash, if user specifies'''
-            MashMatrix = blastp_analysis(ProtList, self.fnames, self.payload)
+            MashMatrix = blastp_analysis(ProtCatalogue, self.fnames, self.payload)
 
         else:
             '''Do Mash'''
@@ -206,9 +154,8 @@ class PPHMMDBConstruction:
             error_handler_mash_sketch(out, "Mash (PPHMMDB Construction, mash_analysis(), initial sketch)")
             for ProtSeq_i in alive_it(range(N_ProtSeqs)):
                 '''Mash query fasta file'''
-                MashQuery = ProtList[ProtSeq_i]
                 with open(self.fnames['MashQueryFile'], "w") as MashQuery_txt:
-                    MashQuery_txt.write(f">{MashQuery.name} {MashQuery.description}\n{str(MashQuery.seq)}")
+                    MashQuery_txt.write(f">{ProtCatalogue.ids[ProtSeq_i]} {ProtCatalogue.descs[ProtSeq_i]}\n{ProtCatalogue.seq(ProtSeq_i)}")
 
                 mash_fname = f'{"/".join(self.fnames["MashOutputFile"].split("/")[:-1])}/mashup_scores.tab'
                 out = shell(f"mash sketch -p {self.payload['N_CPUs']} -a -i {self.fnames['MashQueryFile']}", ret_output=True)
@@ -229,7 +176,7 @@ class PPHMMDBConstruction:
                     '''If 1 return, this is self vs self and can be ignored'''
                     continue
                 else:
-                    mash_df["query"] = ProtList[ProtSeq_i].id
+                    mash_df["query"] = ProtCatalogue.ids[ProtSeq_i]
                     mash_df = mash_df[mash_df["orf"] != mash_df["query"]]
                     mash_df["p"] = mash_df["p"].astype(float)
                     mash_df["mash_sim"] = np.abs(1 - mash_df["dist"])
@@ -237,7 +184,7 @@ class PPHMMDBConstruction:
                     mash_iter = mash_df.to_dict(orient="records")
                     for i in mash_iter:
                         '''Query must: not match subject, have identity > thresh, have query coverage > thresh and query coverage normalised to subject length > thresh'''
-                        pair = ", ".join(sorted([ProtList[ProtSeq_i].id, i["orf"]]))
+                        pair = ", ".join(sorted([ProtCatalogue.ids[ProtSeq_i], i["orf"]]))
                         if pair in SeenPair:
                             '''If the pair has already been seen...'''
                             if i["mash_sim"] > MashMatrix[SeenPair[pair]][2]:
@@ -253,7 +200,7 @@ class PPHMMDBConstruction:
 
             if MashMatrix.shape[0] == 0:
                 try:
-                    MashMatrix = blastp_analysis(ProtList, self.fnames, self.payload)
+                    MashMatrix = blastp_analysis(ProtCatalogue, self.fnames, self.payload)
                 except:
                     raise_gravity_error(f"No Mash results were extracted from protein sequences, then failed to run BLASTp as a failover. "
                                         f"Check Mash is installed and that your parameters aren't too restrictive."
@@ -284,7 +231,7 @@ class PPHMMDBConstruction:
             MashProtCluster_txt.write(
                 "\n".join(list(set(ProtIDList)-set(SeenProtIDList))))
 
-    def make_alignments(self, ProtList, ProtIDList):
+    def make_alignments(self, ProtCatalogue):
         '''8/10: Do protein alignments with Mafft, make cluster alignment annotations'''
         progress_msg("- Make protein alignments")
         _, Cluster_i, Cluster_MetaDataDict = LineCount(
@@ -294,16 +241,15 @@ class PPHMMDBConstruction:
                 HitList, TaxoLists, DescList, Cluster = [], [], [], Cluster.split("\n")[
                     0].split("\t")
                 for ProtID in Cluster:
-                    HitList.append(
-                        ProtList[np.where(ProtIDList == ProtID)[0][0]])
-                    TaxoLists.append(HitList[-1].annotations['taxonomy'])
-                    DescList.append(HitList[-1].description.replace(", ", " ").replace(",", " ").replace(": ", "_").replace(
+                    HitList.append(ProtCatalogue.row(ProtID))
+                    TaxoLists.append(ProtCatalogue.taxonomy_of(HitList[-1]))
+                    DescList.append(ProtCatalogue.descs[HitList[-1]].replace(", ", " ").replace(",", " ").replace(": ", "_").replace(
                         ":", "_").replace("; ", " ").replace(";", " ").replace(" (", "/").replace("(", "/").replace(")", ""))
 
                 '''Cluster file; remove 'X's for bad sequences'''
                 AlnClusterFile = f"{self.fnames['ClustersDir']}/Cluster_{Cluster_i}.fasta"
                 with open(AlnClusterFile, "w") as UnAlnClusterTXT:
-                    [UnAlnClusterTXT.write(f">{i.name} {i.description}\n{str(i.seq).replace('X','')}\n") for i in HitList]
+                    [UnAlnClusterTXT.write(f">{ProtCatalogue.ids[i]} {ProtCatalogue.descs[i]}\n{ProtCatalogue.seq(i).replace('X','')}\n") for i in HitList]
                 temp_aln_fname = f"{self.fnames['ClustersDir']}/temp.fasta"
 
                 if len(HitList) > 1:
@@ -717,17 +663,16 @@ class PPHMMDBConstruction:
         GenBankDict = self.get_genbank()
 
         '''4/10: Sequence extraction'''
-        ProtList, ProtIDList = self.sequence_extraction(GenBankDict)
+        ProtCatalogue = self.sequence_extraction(GenBankDict)
 
         '''6/10: Do Mash analysis, save output'''
-        self.mash_analysis(ProtList)
+        self.mash_analysis(ProtCatalogue)
 
         '''7/10: Cluster using Mcl'''
-        self.mcl_clustering(ProtIDList)
+        self.mcl_clustering(ProtCatalogue.ids)
 
         '''8/10: Make Alignments'''
-        Cluster_MetaDataDict = self.make_alignments(
-            ProtList, ProtIDList)
+        Cluster_MetaDataDict = self.make_alignments(ProtCatalogue)
 
         '''9/10: Make PPHMMs, DB and Merge Alignments'''
         if self.payload['N_AlignmentMerging'] != 0:
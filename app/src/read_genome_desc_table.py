@@ -1,6 +1,10 @@
 from app.utils.console_messages import section_header
 from app.utils.generate_fnames import generate_file_names
 from app.utils.error_handlers import raise_gravity_error, raise_gravity_warning
+from app.utils.compressed_io import csv_compression
+from app.utils.vmr_snapshot import VMR_COLUMNS, vmr_snapshot_fname, save_vmr_snapshot, load_vmr_snapshot
+from app.utils.vmr_changeset import compute_vmr_changeset, record_sequence_changes
+from app.utils.sequence_store import get_sequence_store
 
 import pandas as pd
 import numpy as np
@@ -8,7 +12,26 @@ from collections import Counter
 import os
 import re
 import pickle
-import csv
+import shutil
+
+'''Accession number formats: GenBank/ENA, WGS, RefSeq-like, SRA'''
+ACCESSION_PATTERN = re.compile(r"[A-Z]{1,2}[0-9]{5,6}|[A-Z]{4}[0-9]{6,8}|[A-Z]{2}_[0-9]{6}|SRR[0-9]{7,8}")
+FIRST_ACCESSION_PATTERN = re.compile(f"({ACCESSION_PATTERN.pattern})")
+'''Virus name clean-up, applied in order: squash spaces, non-word runs to "/", squash separators, trim "/"'''
+NAME_CLEANING_PATTERNS = [(re.compile(r"[ ]{2,}"), " "),
+                          (re.compile(r"[^\w^ ^\.^\-]+"), "/"),
+                          (re.compile(r"[\/ ]{2,}"), "/"),
+                          (re.compile(r"^\/|\/$"), "")]
+
+def warn_rows(msg, VirusNames, max_listed=10) -> None:
+    '''Report a per-genome problem once, with a count and the first few affected genomes, rather than a line per genome'''
+    VirusNames = [str(i) for i in VirusNames]
+    if len(VirusNames) == 0:
+        return
+    listed = ", ".join(VirusNames[:max_listed])
+    if len(VirusNames) > max_listed:
+        listed += f" (and {len(VirusNames) - max_listed} more)"
+    raise_gravity_warning(f"{msg}: {len(VirusNames)} genome(s) affected: {listed}")
 
 
 class ReadGenomeDescTable:
@@ -38,10 +61,10 @@ class ReadGenomeDescTable:
                 [], [], [], [], [], [], [], [], []
 
     def open_table(self) -> None:
-        '''Open VMR file and read in relevant data to volatile'''
+        '''Open VMR file and read in relevant data to volatile. Columns are transformed with vectorised string operations'''
         print("- Read the GenomeDesc table")
         try:
-            df = pd.read_csv(self.GenomeDescTableFile, index_col=0)
+            df = pd.read_csv(self.GenomeDescTableFile, index_col=0, compression=csv_compression(self.GenomeDescTableFile))
         except:
             raise_gravity_error(f"Failed to read your input VMR-like document (GenomeDescTableFile). Check it's a valid CSV.")
         df = df.fillna("")
@@ -50,12 +73,16 @@ class ReadGenomeDescTable:
             df = df.drop(columns=i)
 
         try:
-            df["Virus name(s)"] = df.apply(lambda x: self.get_names(x), axis=1)
-            df["Genetic code table"] = df.apply(lambda x: self.transl_table_check(x), axis=1)
-            df["Virus GENBANK accession"] = df.apply(lambda x: self.get_accession(x), axis=1)
+            df["Virus name(s)"] = self.get_names(df)
+            df["Genetic code table"] = self.transl_table_check(df)
+            df["Virus GENBANK accession"] = self.get_accession(df)
         except KeyError as e:
             raise_gravity_error(f"Your input VMR-like document isn't structured appropriately, see documentation for instructions.\nException: {e}")
 
+        self.store_table(df)
+
+    def store_table(self, df) -> None:
+        '''Read transformed VMR columns into volatile'''
         self.VirusIndexList = [i for i in range(1, df.shape[0] + 1)]
         try: # TODO < TIDY THIS
             self.BaltimoreList = df["Baltimore Group"].tolist()
@@ -81,65 +108,61 @@ class ReadGenomeDescTable:
         self.SeqIDLists = [i.split(", ") for i in df["Virus GENBANK accession"].tolist()]
         self.TranslTableList = df["Genetic code table"].tolist()
 
-    def get_names(self, row):
-        # try: # RM < TODO Incorporate commented code for curtailing long names?
-        #     if not self.is_secondpass:
-        #         if not row["Virus name(s)"]:
-        #             row["Virus name(s)"] == ""
-        #         return re.sub(r"^\/|\/$", "", re.sub(r"[\/ ]{2,}", "/", re.sub(
-        #             r"[^\w^ ^\.^\-]+", "/", re.sub(r"[ ]{2,}", " ", row["Virus name(s)"]))))
-        #     else:
-        #         '''If PL2, append virus description to accession ID'''
-        #         part1 = re.sub(r"^\/|\/$", "", re.sub(r"[\/ ]{2,}", "/", re.sub(r"[^\w^ ^\.^\-]+", "/", re.sub(r"[ ]{2,}", " ", row["Virus name(s)"]))))
-        #         if len(row["Virus isolate designation"]) == 0:
-        #             part2 = ""
-        #         part2 = re.sub(r"[^\w\s]", "", row["Virus isolate designation"][0:39]).replace(" ", "_")
-        #         if len(row["Virus isolate designation"]) > 40:
-        #             part2 += "..."
-        #         return f'{part1}_{part2}'
+    def get_names(self, df) -> pd.Series:
+        '''Clean virus names; on second pass, prefix with first accession, family and genus'''
         try:
+            if pd.api.types.infer_dtype(df["Virus name(s)"], skipna=False) not in ["string", "empty"]:
+                raise TypeError("'Virus name(s)' contains non-text values")
+            VirusNames = df["Virus name(s)"]
+            for pattern, repl in NAME_CLEANING_PATTERNS:
+                VirusNames = VirusNames.str.replace(pattern, repl, regex=True)
             if self.is_secondpass:
-                if not row["Virus name(s)"]:
-                    row["Virus name(s)"] == ""
-                virus_name = re.sub(r"^\/|\/$", "", re.sub(r"[\/ ]{2,}", "/", re.sub(r"[^\w^ ^\.^\-]+", "/", re.sub(r"[ ]{2,}", " ", row["Virus name(s)"])))).replace(" ","_")
-                accession = ", ".join(re.findall(r"[A-Z]{1,2}[0-9]{5,6}|[A-Z]{4}[0-9]{6,8}|[A-Z]{2}_[0-9]{6}|SRR[0-9]{7,8}", row["Virus GENBANK accession"]))
-                if len(accession.split(",")) > 1:
-                    accession = accession.split(",")[0]
-                return f'{accession}_{row["Family"]}_{row["Genus"]}_{virus_name}'
-            else:
-                if not row["Virus name(s)"]:
-                    row["Virus name(s)"] == ""
-                return re.sub(r"^\/|\/$", "", re.sub(r"[\/ ]{2,}", "/", re.sub(
-                    r"[^\w^ ^\.^\-]+", "/", re.sub(r"[ ]{2,}", " ", row["Virus name(s)"]))))
+                if pd.api.types.infer_dtype(df["Virus GENBANK accession"], skipna=False) not in ["string", "empty"]:
+                    raise TypeError("'Virus GENBANK accession' contains non-text values")
+                Accessions = df["Virus GENBANK accession"].str.extract(FIRST_ACCESSION_PATTERN, expand=False).fillna("")
+                return Accessions + "_" + df["Family"].astype(str) + "_" + df["Genus"].astype(str) + "_" + VirusNames.str.replace(" ", "_", regex=False)
+            return VirusNames
 
         except Exception as ex:
 
             raise_gravity_error(f"At least one line in your input CSV (genome desc table) has empty fields (or fields causing another error): {ex}")
 
-    def transl_table_check(self, row):
-        try:
-            if row["Genetic code table"] != 1:
-                if not "complete" in str(row["Genome coverage"]).lower():
-                    self.transl_table_errors.append(row["Virus name(s)"])
-                return int(1)
-            else:
-                return int(row["Genetic code table"])
-        except:
-            raise_gravity_warning(f"No 'Genetic code table' column found or invalid value therein for {row['Virus name(s)']}, so setting as default translation table")
-            return 1
+    def transl_table_check(self, df) -> pd.Series:
+        '''
+        All genomes are translated with the standard code, so every row is set to 1, whatever it specifies. Genomes that
+        specify another table and aren't complete are noted in transl_table_errors. A missing 'Genetic code table'
+        column (or, for genomes specifying another table, a missing 'Genome coverage' column) is reported in one
+        warning listing the affected genomes, rather than one warning per genome.
+        '''
+        if "Genetic code table" not in df.columns:
+            warn_rows("No 'Genetic code table' column found, so setting as default translation table", df["Virus name(s)"])
+            return pd.Series(1, index=df.index)
+        NonStandard = ~df["Genetic code table"].isin([1])
+        if "Genome coverage" not in df.columns:
+            warn_rows("No 'Genome coverage' column found to validate 'Genetic code table' values, so setting as default translation table", df["Virus name(s)"][NonStandard])
+        else:
+            Incomplete = ~df["Genome coverage"].astype(str).str.lower().str.contains("complete", regex=False)
+            self.transl_table_errors += df["Virus name(s)"][NonStandard & Incomplete].tolist()
+        return pd.Series(1, index=df.index)
 
-    def get_accession(self, row):
-        try:
-            # if "SRR" in row["Virus GENBANK accession"]:
-            #     th = ", ".join()
-            th = ", ".join(re.findall(r"[A-Z]{1,2}[0-9]{5,6}|[A-Z]{4}[0-9]{6,8}|[A-Z]{2}_[0-9]{6}|SRR[0-9]{7,8}", row["Virus GENBANK accession"]))
-            if th == "":
-                raise
-            return th
-        except:
-            self.no_acc_cnt += 1
-            raise_gravity_warning(f"No accession number for {row['Virus name(s)']}: this might cause GRAViTy to error later on if you're not providing your own GenBank file!")
-            return f'{row["Virus GENBANK accession"]}' if not row["Virus GENBANK accession"] == "" else f'No_data_{self.no_acc_cnt - 1}'
+    def get_accession(self, df) -> pd.Series:
+        '''Extract accession numbers. Rows without any keep their original value, or are numbered No_data_{n} if empty'''
+        RawAccessions = df["Virus GENBANK accession"]
+        Accessions = RawAccessions.str.findall(ACCESSION_PATTERN).str.join(", ").fillna("") \
+            if pd.api.types.infer_dtype(RawAccessions, skipna=False) in ["string", "empty"] else \
+            RawAccessions.map(lambda x: ", ".join(ACCESSION_PATTERN.findall(x)) if isinstance(x, str) else "")
+        Missing = (Accessions == "").to_numpy()
+        if Missing.any():
+            NoDataCounter = self.no_acc_cnt - 1 + np.cumsum(Missing)
+            Fallback = RawAccessions.astype(str).to_numpy(dtype=object, copy=True)
+            Empty = Fallback == ""
+            Fallback[Empty] = [f"No_data_{i}" for i in NoDataCounter[Empty]]
+            Accessions = Accessions.to_numpy(dtype=object, copy=True)
+            Accessions[Missing] = Fallback[Missing]
+            Accessions = pd.Series(Accessions, index=df.index)
+            self.no_acc_cnt += int(Missing.sum())
+            warn_rows("No accession number found, which might cause GRAViTy to error later on if you're not providing your own GenBank file", df["Virus name(s)"][Missing])
+        return Accessions
 
     def update_desc_table(self) -> dict:
         '''Create dictionary in GRAViTy structure for saving to persistent storage'''
@@ -171,10 +194,57 @@ class ReadGenomeDescTable:
         '''Save dictionary in GRAViTy structure to persistent storage'''
         pickle.dump(table, open(self.fnames["ReadGenomeDescTablePickle"], "wb"))
 
+    def record_changeset(self, table) -> None:
+        '''Compare with this experiment's previous parse (if any) and save which accessions changed, for incremental updates'''
+        if os.path.isfile(self.fnames["ReadGenomeDescTableParquet"]):
+            previous_table = load_vmr_snapshot(self.fnames["ReadGenomeDescTableParquet"])[0]
+        elif os.path.isfile(self.fnames["ReadGenomeDescTablePickle"]):
+            previous_table = pickle.load(open(self.fnames["ReadGenomeDescTablePickle"], "rb"))
+        else:
+            previous_table = None
+            if os.path.isfile(self.fnames["VmrChangeset"]):
+                os.remove(self.fnames["VmrChangeset"])
+        if previous_table is not None:
+            changeset = compute_vmr_changeset(previous_table, table)
+            print(f"- Changes since previous VMR: {changeset.summary()}")
+            changeset.save(self.fnames["VmrChangeset"])
+
+        '''Sequence revisions, by digest; if the sequence file is yet to be downloaded, PPHMMDB construction checks once it is'''
+        if os.path.isfile(self.GenomeSeqFile):
+            record_sequence_changes(self.fnames, table, get_sequence_store(self.GenomeSeqFile, self.fnames))
+
+    def save_desc_table_columns(self, snapshot_fname, table):
+        '''Save columnar copy next to the pickle, so later stages can load only the columns they need'''
+        if snapshot_fname is not None:
+            shutil.copyfile(snapshot_fname, self.fnames["ReadGenomeDescTableParquet"])
+        else:
+            save_vmr_snapshot(self.fnames["ReadGenomeDescTableParquet"], table, self.no_acc_cnt)
+
+    def load_snapshot(self, snapshot_fname) -> None:
+        '''Restore parsed VMR from snapshot, then write outputs exactly as a fresh parse would'''
+        all_desc_table, self.no_acc_cnt = load_vmr_snapshot(snapshot_fname)
+        self.BaltimoreList, self.OrderList, self.FamilyList, self.SubFamList, self.GenusList, self.VirusNameList, \
+            self.SeqIDLists, self.SeqStatusList, self.TaxoGroupingList, self.TranslTableList = [all_desc_table[col] for col in VMR_COLUMNS]
+        self.DatabaseList = all_desc_table["DatabaseList"]
+        if self.no_acc_cnt > 1:
+            raise_gravity_warning(f"{self.no_acc_cnt} genomes specified in your desc file had no accession IDs.")
+        self.record_changeset(all_desc_table)
+        print("- Save variables to ReadGenomeDescTable pickle")
+        self.save_desc_table(all_desc_table)
+        self.save_desc_table_columns(snapshot_fname, all_desc_table)
+
     def entrypoint(self) -> None:
         '''RM < TODO DOCSTRING'''
         section_header("Read the GenomeDesc table")
 
+        '''If this VMR has been parsed with the same options before, reuse it'''
+        snapshot_fname = vmr_snapshot_fname(self.GenomeDescTableFile, self.payload, self.is_secondpass,
+                                            self.fnames['VmrSnapshotDir']) if self.payload.get("UseCache", True) else None
+        if snapshot_fname is not None and os.path.isfile(snapshot_fname):
+            print("- Parsed VMR unchanged, loading from snapshot")
+            self.load_snapshot(snapshot_fname)
+            return
+
         '''Open & parse input VMR (txt) file'''
         self.open_table()
 
@@ -223,5 +293,9 @@ class ReadGenomeDescTable:
         '''Create ReadGenomeDescTable "all genomes' db'''
         print("- Save variables to ReadGenomeDescTable pickle")
         all_desc_table = self.update_desc_table()
+        self.record_changeset(all_desc_table)
         self.save_desc_table(
             all_desc_table)
+        if snapshot_fname is not None:
+            save_vmr_snapshot(snapshot_fname, all_desc_table, self.no_acc_cnt)
+        self.save_desc_table_columns(snapshot_fname, all_desc_table)
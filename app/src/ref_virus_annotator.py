@@ -25,9 +25,10 @@ from app.utils.shell_cmds import shell
 from app.utils.mkdirs import mkdir_ref_annotator
 from app.utils.stdout_utils import progress_msg
 from app.utils.generate_fnames import generate_file_names
+from app.utils.signature_cache import pphmmdb_fingerprint
+from app.utils.vmr_changeset import member_key, current_run_state, load_applicable_changeset
 #
 from app.utils.parallel_sig_generator import PPHMMSignatureTable_Constructor
-# from app.utils.pphmm_signature_table_constructor import PPHMMSignatureTable_Constructor_DEPRECATED as PPHMMSignatureTable_Constructor #########
 
 class RefVirusAnnotator:
     def __init__(self,
@@ -372,6 +373,32 @@ class RefVirusAnnotator:
         updated_parameters["ClusterSizeByProtList"] = parameters["ClusterSizeByProtList"][PPHMMOrder]
         pickle.dump(updated_parameters, open(self.fnames['PphmmdbPickle'], "wb"))
 
+    def update_gomdb(self, GOMIDList):
+        '''
+        Update the previous run's GOM database, if any. If it was built against the same PPHMM DB from the run this
+        run's VMR changeset is relative to, only genomes in the changeset are removed and re-added; otherwise every
+        group is checked, rebuilding those whose members or their PPHMM locations changed
+        '''
+        PreviousGOMDB = retrieve_pickle(self.fnames['GOMDBPickle']) if os.path.isfile(self.fnames['GOMDBPickle']) else None
+        MemberKeys = [member_key(SeqIDList) for SeqIDList in self.genomes["SeqIDLists"]]
+        Fingerprint = pphmmdb_fingerprint(self.fnames['HMMER_PPHMMDb'], self.payload, self.PPHMMLocationTable.shape[1])
+        changeset = None
+        if PreviousGOMDB is not None and getattr(PreviousGOMDB, "pphmmdb_fingerprint", None) == Fingerprint:
+            changeset = load_applicable_changeset(self.fnames, self.genomes, PreviousGOMDB.run_state)
+        if changeset is not None:
+            GOMDB = PreviousGOMDB
+            GOMDB.apply_changes(self.genomes["TaxoGroupingList"], self.PPHMMLocationTable, GOMIDList, MemberKeys,
+                                changeset.changed_member_keys(self.genomes, [Key for Members in GOMDB.members.values() for Key in Members]))
+        else:
+            GOMDB = GOMDB_Constructor(self.genomes["TaxoGroupingList"], self.PPHMMLocationTable, GOMIDList,
+                                      MemberKeys=MemberKeys, PreviousGOMDB=PreviousGOMDB)
+        if PreviousGOMDB is not None:
+            progress_msg(f"- Updated GOM database{' from VMR changeset' if changeset is not None else ''}: "
+                         f"{len(GOMDB.last_rebuilt)} of {len(GOMIDList)} groups changed since previous run")
+        GOMDB.run_state, GOMDB.pphmmdb_fingerprint = current_run_state(self.fnames, self.genomes), Fingerprint
+        pickle.dump(GOMDB, open(self.fnames['GOMDBPickle'], "wb"))
+        return GOMDB
+
     def save_sig_tables(self, GOMIDList, GOMSignatureTable, GOMDB):
         '''8/8: Load in PPHMMDB, to extract cluster list...'''
         parameters = retrieve_pickle(self.fnames['PphmmdbPickle'])
@@ -417,7 +444,8 @@ class RefVirusAnnotator:
                     self.payload,
                     self.fnames,
                     self.GenomeSeqFile,
-                    self.fnames['HMMER_PPHMMDb']
+                    self.fnames['HMMER_PPHMMDb'],
+                    GenomeKeysFile=self.fnames['SignatureGenomeKeys']
         )
 
         if self.payload['RemoveSingletonPPHMMs']:
@@ -431,13 +459,12 @@ class RefVirusAnnotator:
         '''6/8 : Make GOM database'''
         GOMIDList = OrderedSet([TaxoGrouping for TaxoGrouping in self.genomes["TaxoGroupingList"].astype(
             'str') if not TaxoGrouping.startswith(("_", "*"))])
-        GOMDB = GOMDB_Constructor(
-            self.genomes["TaxoGroupingList"], self.PPHMMLocationTable, GOMIDList)
+        GOMDB = self.update_gomdb(GOMIDList)
 
         progress_msg("- Generate GOM signature table")
         '''7/8 : Make GOM signature table'''
         GOMSignatureTable = GOMSignatureTable_Constructor(
-            self.PPHMMLocationTable, GOMDB, GOMIDList)
+            self.PPHMMLocationTable, GOMDB, GOMIDList, N_CPUs=self.payload["N_CPUs"])
 
         '''8/8 : Save PPHMMSignatureTable and GOMSignatureTable'''
         self.save_sig_tables(GOMIDList, GOMSignatureTable, GOMDB)
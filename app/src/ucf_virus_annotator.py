@@ -4,8 +4,10 @@ import random
 import pickle
 from scipy.sparse import coo_matrix
 
-from app.utils.pphmm_signature_table_constructor import PPHMMSignatureTable_Constructor
+from app.utils.parallel_sig_generator import PPHMMSignatureTable_Constructor
 from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor
+from app.utils.gomdb_constructor import SparseGOMDB
+from app.utils.gom_candidates import candidate_gom_mask
 from app.utils.console_messages import section_header
 from app.utils.retrieve_pickle import retrieve_genome_vars, retrieve_pickle
 from app.utils.generate_fnames import generate_file_names
@@ -22,6 +24,15 @@ class UcfVirusAnnotator:
         self.fnames = generate_file_names(payload, ExpDir, Pl2=True)
         self.genomes = retrieve_genome_vars(self.fnames['ReadGenomeDescTablePickle'])
 
+    def gom_candidates(self, PPHMMSignatureTable, pl1_ref_annotations):
+        '''If GOMCandidateGroups is set, mask of each unclassified virus's candidate reference groups, else None (score all)'''
+        if self.payload.get("GOMCandidateGroups", 0) == 0:
+            return None
+        progress_msg(f"- Selecting {self.payload['GOMCandidateGroups']} candidate GOMs per unclassified virus by shared PPHMMs")
+        return candidate_gom_mask(PPHMMSignatureTable, pl1_ref_annotations["PPHMMSignatureTable"],
+                                  retrieve_genome_vars(self.fnames["Pl1ReadDescTablePickle"], columns=["TaxoGroupingList"])["TaxoGroupingList"],
+                                  pl1_ref_annotations["GOMIDList"], self.payload["GOMCandidateGroups"])
+
     def annotate(self) -> None:
         '''3/3: Annotate unclassified viruses via PPHMM and GOM, generate loc/sig tables for unclassified, save to pickle'''
         progress_msg(f"Annotating unclassified viruses using the PPHMM and GOM databases of the reference viruses from Pipeline I")
@@ -30,8 +41,7 @@ class UcfVirusAnnotator:
         pl1_ref_annotations = retrieve_pickle(self.fnames["Pl1RefAnnotatorPickle"])
         '''GOM Coords might not be in PL1 data depending on settings used'''
         if "GOMDB_coo" in pl1_ref_annotations.keys():
-            pl1_ref_annotations["GOMDB"] = {GOMID: GOM_coo.toarray(
-            ) for GOMID, GOM_coo in pl1_ref_annotations["GOMDB_coo"].items()}
+            pl1_ref_annotations["GOMDB"] = SparseGOMDB.from_coo(pl1_ref_annotations["GOMDB_coo"])
 
         '''Generate PPHMMSignatureTable, PPHMMLocationTable, and GOMSignatureTable for unclassified viruses using the reference PPHMM and GOM database'''
         '''Generate PPHMMSignatureTable and PPHMMLocationTable'''
@@ -46,7 +56,9 @@ class UcfVirusAnnotator:
 
         GOMSignatureTable = GOMSignatureTable_Constructor(PPHMMLocationTable=PPHMMLocationTable,
                                                             GOMDB=pl1_ref_annotations["GOMDB"],
-                                                            GOMIDList=pl1_ref_annotations["GOMIDList"])
+                                                            GOMIDList=pl1_ref_annotations["GOMIDList"],
+                                                            N_CPUs=self.payload["N_CPUs"],
+                                                            CandidateMask=self.gom_candidates(PPHMMSignatureTable, pl1_ref_annotations))
 
         '''Construct out dict, dump to pickle'''
         all_ucf_genomes = {}
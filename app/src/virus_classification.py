@@ -15,9 +15,10 @@ import re
 from app.utils.dist_mat_to_tree import DistMat2Tree
 from app.utils.similarity_matrix_constructor import SimilarityMat_Constructor
 from app.utils.taxo_label_constructor import TaxoLabel_Constructor
-from app.utils.pphmm_signature_table_constructor import PPHMMSignatureTable_Constructor
+from app.utils.parallel_sig_generator import PPHMMSignatureTable_Constructor
 from app.utils.gomdb_constructor import GOMDB_Constructor
-from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor
+from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor, GOMScoringPool
+from app.utils.gom_candidates import candidate_gom_mask
 from app.utils.virus_grouping_estimator import VirusGrouping_Estimator
 from app.utils.console_messages import section_header
 from app.utils.retrieve_pickle import retrieve_genome_vars, retrieve_pickle
@@ -89,7 +90,7 @@ class VirusClassificationAndEvaluation:
             '''Scan reference viruses against the PPHMM database of unclassified viruses to generate additional PPHMMSignatureTable, and PPHMMLocationTable'''
             '''Make OR update HMMER_hmmscanDir'''
             PPHMMSignatureTable_UcfVirusVSUcfDB, PPHMMLocationTable_UcfVirusVSUcfDB, NaivePPHMMLocationTable_UcfVirusVSUcfDB = PPHMMSignatureTable_Constructor(
-                    retrieve_genome_vars(self.fnames['Pl1ReadDescTablePickle']),
+                    retrieve_genome_vars(self.fnames['Pl1ReadDescTablePickle'], columns=["SeqIDLists", "TranslTableList"]),
                     self.payload,
                     self.fnames,
                     GenomeSeqFile=self.payload['GenomeSeqFiles_RefVirus'],
@@ -107,11 +108,15 @@ class VirusClassificationAndEvaluation:
                 pl1_ref_annotations["TaxoGroupingList"], pl1_ref_annotations["PPHMMLocationTable"], pl1_ref_annotations["GOMIDList"])
 
             pl1_ref_annotations["GOMSignatureTable"] = GOMSignatureTable_Constructor(
-                pl1_ref_annotations["PPHMMLocationTable"], UpdatedGOMDB_RefVirus, pl1_ref_annotations["GOMIDList"])
+                pl1_ref_annotations["PPHMMLocationTable"], UpdatedGOMDB_RefVirus, pl1_ref_annotations["GOMIDList"], N_CPUs=self.payload["N_CPUs"])
 
             '''Update unclassified viruses' GOMSignatureTable'''
+            CandidateMask = None
+            if self.payload.get("GOMCandidateGroups", 0) > 0:
+                CandidateMask = candidate_gom_mask(self.ucf_annots["PPHMMSignatureTable_Dict"], pl1_ref_annotations["PPHMMSignatureTable"],
+                                                   pl1_ref_annotations["TaxoGroupingList"], pl1_ref_annotations["GOMIDList"], self.payload["GOMCandidateGroups"])
             self.ucf_annots["GOMSignatureTable_Dict"] = GOMSignatureTable_Constructor(
-                self.ucf_annots["PPHMMLocationTable_Dict"], UpdatedGOMDB_RefVirus, pl1_ref_annotations["GOMIDList"])
+                self.ucf_annots["PPHMMLocationTable_Dict"], UpdatedGOMDB_RefVirus, pl1_ref_annotations["GOMIDList"], N_CPUs=self.payload["N_CPUs"], CandidateMask=CandidateMask)
 
         '''Build the dendrogram, including all sequences'''
         '''Generate TaxoLabelList of reference viruses'''
@@ -154,7 +159,8 @@ class VirusClassificationAndEvaluation:
                                         self.payload["PphmmNeighbourhoodWeight"],
                                         self.payload["PphmmSigScoreThreshold"],
                                         self.payload['SimilarityMeasurementScheme'],
-                                        self.payload['p'], fnames=self.fnames)
+                                        self.payload['p'], fnames=self.fnames,
+                                        N_CPUs=self.payload["N_CPUs"], BlockSize=self.payload.get("SimilarityBlockSize", 256))
         DistMat = 1 - SimMat # RM < TODO Turn into function
         DistMat[DistMat < 0] = 0
 
@@ -287,61 +293,63 @@ class VirusClassificationAndEvaluation:
         N_PPHMMs = PPHMMSignatureTable_AllVirus.shape[1]
         self.final_results["PairwiseSimilarityScore_CutoffDist_Dict"] = {Bootstrap_i: {} for Bootstrap_i in range(self.payload['N_Bootstrap'])}
 
-        for Bootstrap_i in range(0, self.payload['N_Bootstrap']):
-            '''Bootstrap the data'''
-            print(f"Round {Bootstrap_i+1}/{self.payload['N_Bootstrap']}")
-
-            '''Construct bootstrapped PPHMMSignatureTable and PPHMMLocationTable'''
-            PPHMM_IndexList = sorted(np.random.choice(
-                list(range(N_PPHMMs)), N_PPHMMs, replace=True))
-            BootstrappedPPHMMSignatureTable = PPHMMSignatureTable_AllVirus[:,
-                                                                           PPHMM_IndexList]
-            BootstrappedPPHMMLocationTable = PPHMMLocationTable_AllVirus[:,
-                                                                         PPHMM_IndexList]
-            BootstrappedGOMSignatureTable = None
-
-            if "G" in self.payload['SimilarityMeasurementScheme']:
-                '''Construct bootstrapped GOMSignatureTable'''
-                BootstrappedGOMDB = GOMDB_Constructor(
-                    pl1_ref_annotations["TaxoGroupingList"], BootstrappedPPHMMLocationTable[:N_RefViruses], pl1_ref_annotations["GOMIDList"])
-                BootstrappedGOMSignatureTable = GOMSignatureTable_Constructor(
-                    BootstrappedPPHMMLocationTable, BootstrappedGOMDB, pl1_ref_annotations["GOMIDList"])
-
-            '''Construct a dendrogram from the bootstrapped data'''
-            BootstrappedSimMat = SimilarityMat_Constructor(
-                BootstrappedPPHMMSignatureTable, BootstrappedGOMSignatureTable, BootstrappedPPHMMLocationTable, self.final_results["SharedNormPphmmRatioMatrix"], self.payload["PphmmNeighbourhoodWeight"],
-                self.payload["PphmmSigScoreThreshold"], self.payload['SimilarityMeasurementScheme'], self.payload['p'], self.fnames)
-            BootstrappedDistMat = 1 - BootstrappedSimMat
-            BootstrappedDistMat[BootstrappedDistMat < 0] = 0
-            BootstrappedVirusDendrogram = DistMat2Tree(
-                BootstrappedDistMat, TaxoLabelList_AllVirus, self.payload['Dendrogram_LinkageMethod'])
-
-            with open(self.fnames['VirusDendrogramDistFile'], "a") as VirusDendrogramDist_txt:
-                VirusDendrogramDist_txt.write(BootstrappedVirusDendrogram+"\n")
-
-            '''Compute similarity cut off for each taxonomic class based on the bootstrapped data'''
-            self.final_results["PairwiseSimilarityScore_CutoffDist_Dict"][Bootstrap_i] = PairwiseSimilarityScore_Cutoff_Dict_Constructor(BootstrappedSimMat[:N_RefViruses][:, :N_RefViruses],
-                                                                                                                                       pl1_ref_annotations[
-                                                                                                                                           "TaxoGroupingList"],
-                                                                                                                                       self.payload['N_PairwiseSimilarityScores'])
-
-            '''Propose a taxonomic class to each unclassified virus and evaluate the taxonomic assignments based on the bootstrapped data'''
-            BootsrappedMaxSimScoreList, BootsrappedTaxoOfMaxSimScoreList, BootsrappedTaxoAssignmentList, \
-                BootsrappedPhyloStatList = TaxonomicAssignmentProposerAndEvaluator(BootstrappedSimMat[-self.N_UcfViruses:][:, :N_RefViruses],
-                                                                                   pl1_ref_annotations["TaxoGroupingList"],
-                                                                                   BootstrappedVirusDendrogram,
-                                                                                   TaxoLabelList_RefVirus,
-                                                                                   self.TaxoLabelList_UcfVirus,
-                                                                                   self.final_results["PairwiseSimilarityScore_CutoffDist_Dict"][Bootstrap_i])
-
-            BootsrappedMaxSimScoreTable = np.column_stack(
-                (BootsrappedMaxSimScoreTable, BootsrappedMaxSimScoreList))
-            BootsrappedTaxoOfMaxSimScoreTable = np.column_stack(
-                (BootsrappedTaxoOfMaxSimScoreTable, BootsrappedTaxoOfMaxSimScoreList))
-            BootsrappedTaxoAssignmentTable = np.column_stack(
-                (BootsrappedTaxoAssignmentTable, BootsrappedTaxoAssignmentList))
-            BootsrappedPhyloStatTable = np.column_stack(
-                (BootsrappedPhyloStatTable, BootsrappedPhyloStatList))
+        with GOMScoringPool(self.payload["N_CPUs"]) as GOMPool:
+            for Bootstrap_i in range(0, self.payload['N_Bootstrap']):
+                '''Bootstrap the data'''
+                print(f"Round {Bootstrap_i+1}/{self.payload['N_Bootstrap']}")
+
+                '''Construct bootstrapped PPHMMSignatureTable and PPHMMLocationTable'''
+                PPHMM_IndexList = sorted(np.random.choice(
+                    list(range(N_PPHMMs)), N_PPHMMs, replace=True))
+                BootstrappedPPHMMSignatureTable = PPHMMSignatureTable_AllVirus[:,
+                                                                               PPHMM_IndexList]
+                BootstrappedPPHMMLocationTable = PPHMMLocationTable_AllVirus[:,
+                                                                             PPHMM_IndexList]
+                BootstrappedGOMSignatureTable = None
+
+                if "G" in self.payload['SimilarityMeasurementScheme']:
+                    '''Construct bootstrapped GOMSignatureTable'''
+                    BootstrappedGOMDB = GOMDB_Constructor(
+                        pl1_ref_annotations["TaxoGroupingList"], BootstrappedPPHMMLocationTable[:N_RefViruses], pl1_ref_annotations["GOMIDList"])
+                    BootstrappedGOMSignatureTable = GOMSignatureTable_Constructor(
+                        BootstrappedPPHMMLocationTable, BootstrappedGOMDB, pl1_ref_annotations["GOMIDList"], N_CPUs=self.payload["N_CPUs"], GOMPool=GOMPool)
+
+                '''Construct a dendrogram from the bootstrapped data'''
+                BootstrappedSimMat = SimilarityMat_Constructor(
+                    BootstrappedPPHMMSignatureTable, BootstrappedGOMSignatureTable, BootstrappedPPHMMLocationTable, self.final_results["SharedNormPphmmRatioMatrix"], self.payload["PphmmNeighbourhoodWeight"],
+                    self.payload["PphmmSigScoreThreshold"], self.payload['SimilarityMeasurementScheme'], self.payload['p'], self.fnames,
+                    N_CPUs=self.payload["N_CPUs"], BlockSize=self.payload.get("SimilarityBlockSize", 256))
+                BootstrappedDistMat = 1 - BootstrappedSimMat
+                BootstrappedDistMat[BootstrappedDistMat < 0] = 0
+                BootstrappedVirusDendrogram = DistMat2Tree(
+                    BootstrappedDistMat, TaxoLabelList_AllVirus, self.payload['Dendrogram_LinkageMethod'])
+
+                with open(self.fnames['VirusDendrogramDistFile'], "a") as VirusDendrogramDist_txt:
+                    VirusDendrogramDist_txt.write(BootstrappedVirusDendrogram+"\n")
+
+                '''Compute similarity cut off for each taxonomic class based on the bootstrapped data'''
+                self.final_results["PairwiseSimilarityScore_CutoffDist_Dict"][Bootstrap_i] = PairwiseSimilarityScore_Cutoff_Dict_Constructor(BootstrappedSimMat[:N_RefViruses][:, :N_RefViruses],
+                                                                                                                                           pl1_ref_annotations[
+                                                                                                                                               "TaxoGroupingList"],
+                                                                                                                                           self.payload['N_PairwiseSimilarityScores'])
+
+                '''Propose a taxonomic class to each unclassified virus and evaluate the taxonomic assignments based on the bootstrapped data'''
+                BootsrappedMaxSimScoreList, BootsrappedTaxoOfMaxSimScoreList, BootsrappedTaxoAssignmentList, \
+                    BootsrappedPhyloStatList = TaxonomicAssignmentProposerAndEvaluator(BootstrappedSimMat[-self.N_UcfViruses:][:, :N_RefViruses],
+                                                                                       pl1_ref_annotations["TaxoGroupingList"],
+                                                                                       BootstrappedVirusDendrogram,
+                                                                                       TaxoLabelList_RefVirus,
+                                                                                       self.TaxoLabelList_UcfVirus,
+                                                                                       self.final_results["PairwiseSimilarityScore_CutoffDist_Dict"][Bootstrap_i])
+
+                BootsrappedMaxSimScoreTable = np.column_stack(
+                    (BootsrappedMaxSimScoreTable, BootsrappedMaxSimScoreList))
+                BootsrappedTaxoOfMaxSimScoreTable = np.column_stack(
+                    (BootsrappedTaxoOfMaxSimScoreTable, BootsrappedTaxoOfMaxSimScoreList))
+                BootsrappedTaxoAssignmentTable = np.column_stack(
+                    (BootsrappedTaxoAssignmentTable, BootsrappedTaxoAssignmentList))
+                BootsrappedPhyloStatTable = np.column_stack(
+                    (BootsrappedPhyloStatTable, BootsrappedPhyloStatList))
 
         '''Update globals with bootstrap results'''
         self.final_results["MaxSimScoreDistTable"] = np.array([i for i in BootsrappedMaxSimScoreTable.T])
@@ -0,0 +1,107 @@
+from Bio import SeqIO
+from collections.abc import Mapping
+import sqlite3
+import os
+
+from app.utils.hashing import file_digest, str_digest
+from app.utils.stdout_utils import progress_msg
+from app.utils.compressed_io import strip_compression_ext, indexable_seq_file, open_text
+
+'''Bump if the index layout or accession normalisation changes, to force rebuilds'''
+ACCESSION_INDEX_VERSION = 1
+
+def seq_file_format(GenomeSeqFile) -> str:
+    '''Format from extension, ignoring any compression extension (e.g. seqs.fasta.gz is fasta)'''
+    return "fasta" if os.path.splitext(strip_compression_ext(GenomeSeqFile))[1] in [".fas", ".fst", ".fasta"] else "gb"
+
+def normalise_accession(SeqID) -> str:
+    '''Strip version, e.g. AB123456.1 -> AB123456'''
+    return SeqID.split(".")[0]
+
+class AccessionIndex:
+    '''
+    Persistent index of a GenBank/fasta sequence file, so stages needn't parse every record of a multi-GB input to
+    find the few they need. Built once per input file (keyed by path and content hash) with SeqIO.index_db; an
+    extra table holds each record's normalised accession, sequence length and whether it needs back-transcribing
+    (i.e. contains U). Records are read from disk on lookup. bgzf-compressed inputs are indexed in place; plain
+    gzip is first recompressed to bgzf.
+    '''
+    def __init__(self, GenomeSeqFile, index_dir) -> None:
+        self.GenomeSeqFile = os.path.abspath(GenomeSeqFile)
+        self.format = seq_file_format(GenomeSeqFile)
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_fname = f"{index_dir}/{str_digest(ACCESSION_INDEX_VERSION, self.GenomeSeqFile, file_digest(GenomeSeqFile), self.format)[:24]}.sqlite"
+        if not os.path.isfile(self.index_fname):
+            self.build()
+        with sqlite3.connect(self.index_fname) as con:
+            '''{accession: (record key, sequence length, back-transcribe flag)}; small, so held in memory for O(1) lookups'''
+            self.accessions = {accession: (key, length, bool(back_transcribe)) for accession, key, length, back_transcribe in con.execute(
+                "SELECT accession, record_key, length, back_transcribe FROM accessions ORDER BY row_order")}
+        self._db, self._pid = None, None
+
+    def build(self) -> None:
+        '''Index offsets, then record per-accession metadata in one sequential pass. Built under temp name and renamed when complete'''
+        progress_msg(f"-  Indexing sequence file {self.GenomeSeqFile}")
+        tmp_fname = f"{self.index_fname}.{os.getpid()}.tmp"
+        if os.path.isfile(tmp_fname):
+            os.remove(tmp_fname)
+        SeqIO.index_db(tmp_fname, indexable_seq_file(self.GenomeSeqFile, f"{os.path.dirname(self.index_fname)}/bgzf"), self.format).close()
+        with sqlite3.connect(tmp_fname) as con, open_text(self.GenomeSeqFile) as handle:
+            con.execute("CREATE TABLE accessions (accession TEXT PRIMARY KEY, record_key TEXT, length INTEGER, back_transcribe INTEGER, row_order INTEGER)")
+            '''Later records with the same normalised accession replace earlier ones but keep their position, as when building a dict'''
+            con.executemany("INSERT INTO accessions VALUES (?, ?, ?, ?, ?) ON CONFLICT(accession) DO UPDATE SET "
+                            "record_key = excluded.record_key, length = excluded.length, back_transcribe = excluded.back_transcribe",
+                            ((normalise_accession(record.id), record.id, len(record.seq), int("u" in str(record.seq).lower()), row_order)
+                             for row_order, record in enumerate(SeqIO.parse(handle, self.format))))
+        os.replace(tmp_fname, self.index_fname)
+
+    def __contains__(self, accession) -> bool:
+        return accession in self.accessions
+
+    def __len__(self) -> int:
+        return len(self.accessions)
+
+    def keys(self):
+        return self.accessions.keys()
+
+    def seq_length(self, accession) -> int:
+        return self.accessions[accession][1]
+
+    def get_record(self, accession):
+        '''Read one record from disk, back-transcribed if it contains U'''
+        if self._db is None or self._pid != os.getpid():
+            '''Each process opens its own handles: file offsets can't be shared across forked workers'''
+            self._db, self._pid = SeqIO.index_db(self.index_fname), os.getpid()
+        key, _, back_transcribe = self.accessions[accession]
+        record = self._db[key]
+        if back_transcribe:
+            record.seq = record.seq.back_transcribe()
+        return record
+
+    def records(self):
+        return AccessionRecords(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_db"], state["_pid"] = None, None
+        return state
+
+class AccessionRecords(Mapping):
+    '''Read-only {normalised accession: SeqRecord} view of an AccessionIndex; records are loaded on access'''
+    def __init__(self, index) -> None:
+        self.index = index
+
+    def __getitem__(self, accession):
+        return self.index.get_record(accession)
+
+    def __contains__(self, accession) -> bool:
+        return accession in self.index
+
+    def __iter__(self):
+        return iter(self.index.keys())
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+def get_accession_index(GenomeSeqFile, fnames) -> AccessionIndex:
+    return AccessionIndex(GenomeSeqFile, fnames['AccessionIndexDir'])
@@ -1,5 +1,5 @@
 from fastapi import Query
-from typing import Union, Literal
+from typing import Union, Literal, Optional
 from pydantic import BaseModel, Field, FilePath, DirectoryPath
 
 
@@ -81,6 +81,8 @@ class Data_pl2_unique_params(BaseModel):
                                                             description="Threshold to determine if the unclassified virus at least belongs to a particular database. For example, an unclassified virus is assigned to the family 'X' in the reference 'Baltimore group X' database, with the (greatest) similarity score of 0.1. This score might be too low to justify that the virus is a member of the family 'X', and fail the similarity threshold test. However, since the similarity score of 0.1 > %default, GRAViTy will make a guess that it might still be a virus of the 'Baltimore group X' database, under the default setting.")
     N_PairwiseSimilarityScores: int = Field(10000, gt=0,
                                             description="Number of data points in the distributions of intra- and inter-group similarity scores used to estimate the similarity threshold. ")
+    GOMCandidateGroups: int = Field(0, ge=0,
+                                    description="Off (0) by default: score each unclassified virus against every group. If > 0, compute each unclassified virus's GOM scores only against this many candidate reference groups: those whose closest member shares the most PPHMMs with it (viruses sharing no PPHMMs with any reference keep every group). Scores against other groups are left as zero. Much faster for large batches of unclassified viruses, but results can differ from scoring every group: zeroed scores lower similarities to references outside the candidate groups, which can change nearest references, taxonomic assignments and dendrograms.")
 
 '''General pipeline'''
 class Data_common_pipeline_params(BaseModel):
@@ -90,6 +92,22 @@ class Data_common_pipeline_params(BaseModel):
                                                                          description="The header of the Taxonomic grouping column.")
     genbank_email: str = Query('name@provider.com',
                                description="A valid email address is required to download genbank files.")
+    NcbiApiKey: Optional[str] = Query(None,
+                                      description="Optional NCBI API key; raises the GenBank download rate limit from 3 to 10 requests per second.")
+    GenBankBatchSize: int = Field(200, gt=0,
+                                  description="Number of accessions fetched from GenBank per request.")
+    GenBankDownloadWorkers: int = Field(3, gt=0,
+                                        description="Number of GenBank batches downloaded concurrently (always within NCBI's rate limit). Interrupted downloads resume from the last completed batch.")
+    GenBankMaxRetries: int = Field(5, ge=0,
+                                   description="Times a failed GenBank batch is retried before the download fails.")
+    GenBankRetryBackoff: float = Field(2.0, gt=0,
+                                       description="Base delay in seconds before retrying a failed GenBank batch; doubles with each further retry, plus random jitter.")
+    GenBankTimeout: float = Field(120, gt=0,
+                                  description="Seconds to wait for a GenBank response before the request is treated as failed.")
+    GenBankRateLimit: Optional[float] = Field(None, gt=0,
+                                              description="Maximum GenBank requests per second. Defaults to NCBI's limit: 3, or 10 with an NcbiApiKey.")
+    EntrezBaseUrl: str = Query('https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi',
+                               description="NCBI efetch endpoint used to download GenBank files, e.g. a local mirror.")
     ProteinLength_Cutoff: int = Field(100, gt=0,
                                       description="Proteins with length < LENGTH aa will be ignored")
     IncludeProteinsFromIncompleteGenomes: bool = Query(True,
@@ -134,6 +152,8 @@ class Data_common_pipeline_params(BaseModel):
                                                     description="Threshold for the BOOTSTRAP SUPPORT to be shown on the dendrogram on the heatmap.")
     PphmmNeighbourhoodWeight: float = Field(0.0125, ge=0, le=1,
                                             description="Apply weighting to protein profile scores where multiple, adjacent (i.e. very similar) profiles exist. This can help to resolve minor violations at the sub-family level: sensible range is 0-0.05.")
+    SimilarityBlockSize: int = Field(256, gt=0,
+                                     description="Number of viruses per block when computing pairwise similarities: blocks of virus pairs are scored at once and shared between N_CPUs processes. Larger blocks use more memory (roughly BLOCK x BLOCK x number of PPHMMs values at a time, capped) and give fewer, larger tasks.")
     PphmmSigScoreThreshold: int = Field(0,
                                         description="Disregard profiles where signature scores are less than this threshold. This can help to resolve minor violations at the sub-family level: sensible range is 0-300.")
     UseBlast: bool = Field(False,
@@ -142,6 +162,18 @@ class Data_common_pipeline_params(BaseModel):
                                       description="Specify the number of threads for multi-core processing. Options: integer == this many threads; 'auto' == let GRAViTy choose number of threads; 'hpc' == select when running on a compute cluster (hard codes to 1).")
     ClustAlnScheme: Literal["local", "global", "auto"] = Query("local",
                                                                description="After extracting and clustering ORFs, choose Mafft scheme to align them. 'local' = FFT-NS-i scheme (recommended); 'global' = G-INS-i scheme (use to enhance sensitivity for distantly-related genomes); 'auto': let Mafft decide best scheme.")
+    SignatureExecutor: Literal["serial", "pool", "batched"] = Query("pool",
+                                                                 description="How genomes are distributed when scanning them against PPHMM databases. 'serial' = one genome at a time, hmmscan uses all threads; 'pool' = one genome per worker process; 'batched' = SignatureBatchSize genomes per hmmscan call per worker process (recommended for many short sequences, e.g. contigs).")
+    SignatureBackend: Literal["hmmscan", "pyhmmer", "daemon"] = Query("hmmscan",
+                                                                      description="How ORFs are scored against PPHMM databases. 'hmmscan' = HMMER command line tool; 'pyhmmer' = in-process via HMMER's Python bindings (optional dependency: pip install pyhmmer), with the database held in memory; 'daemon' = as 'pyhmmer', but the database is held by a background search process that is reused for the lifetime of the API server and restarted if the database changes (recommended for repeated, interactive classification; use with SignatureExecutor = 'serial'). All give identical signatures.")
+    SignatureBatchSize: int = Field(20, gt=0,
+                                    description="If SignatureExecutor = 'batched', number of genomes scanned per hmmscan call.")
+    UseCache: bool = Query(True,
+                           description="Reuse results (e.g. parsed VMRs, per-genome ORFs and PPHMM signatures) computed by previous runs from the persistent cache in CacheDir, if True. Entries are keyed on sequence content, database fingerprint and relevant cut-offs, so are never reused when inputs change.")
+    CacheDir: str = Query('./output/cache',
+                          description="Directory for GRAViTy's persistent cache. Can be shared between experiments and both pipelines.")
+    GenBankStoreMaxGB: float = Field(20, gt=0,
+                                     description="Size limit of the GenBank record store in CacheDir, which holds every downloaded GenBank record so that experiments sharing accessions only download each once. Least recently used records are evicted beyond this size.")
 
 class DataInputMinimal(BaseModel):
     GenomeDescTableFile: FilePath = Query('./data/latest_vmr.csv',
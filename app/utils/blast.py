@@ -1,4 +1,3 @@
-from Bio import SeqIO
 from alive_progress import alive_it
 import numpy as np
 import pandas as pd
@@ -22,20 +21,19 @@ def eval_blast_query(i, SeenPair, SeenPair_i, BitScoreMat):
 
     return BitScoreMat, SeenPair, SeenPair_i
 
-def blastp_analysis(ProtList, fnames, payload):
+def blastp_analysis(ProtCatalogue, fnames, payload):
     '''6/10: Perform ALL-VERSUS-ALL BLASTp analysis'''
     raise_gravity_warning("Performing all-vs-all BLASTp analysis. If you didn't select this as an option, it's because there were no Mash hits (you might need to refine your settings).")
     progress_msg("Performing ALL-VERSUS-ALL BLASTp analysis")
     with open(fnames['MashSubjectFile'], "w") as BLASTSubject_txt:
-        SeqIO.write(ProtList, BLASTSubject_txt, "fasta")
+        ProtCatalogue.write_fasta(BLASTSubject_txt)
     shell(f"makeblastdb -in {fnames['MashSubjectFile']} -dbtype prot", "PPHMMDB Construction: make BLASTp db")
 
     BitScoreMat, SeenPair, SeenPair_i, N_ProtSeqs = [
-        ], {}, 0, len(ProtList)
+        ], {}, 0, len(ProtCatalogue)
     for ProtSeq_i in alive_it(range(N_ProtSeqs)):
         '''BLAST query fasta file'''
-        BLASTQuery = ProtList[ProtSeq_i]
-        with open(fnames['MashQueryFile'], "w") as BLASTQuery_txt: _ = SeqIO.write(BLASTQuery, BLASTQuery_txt, "fasta")
+        with open(fnames['MashQueryFile'], "w") as BLASTQuery_txt: ProtCatalogue.write_fasta(BLASTQuery_txt, rows=[ProtSeq_i])
         mash_fname = f'{"/".join(fnames["MashOutputFile"].split("/")[:-1])}/mashup_scores.tab'
         '''Perform BLASTp, load output to dataframe'''
         outfmat = '"6 qseqid sseqid pident qcovs qlen slen evalue bitscore"'
@@ -0,0 +1,64 @@
+from Bio import bgzf
+import shutil
+import gzip
+import os
+
+from app.utils.hashing import file_digest
+from app.utils.stdout_utils import progress_msg
+
+'''First two bytes of any gzip stream (including bgzf, which is a series of gzip blocks)'''
+GZIP_MAGIC = b"\x1f\x8b"
+COMPRESSED_EXTENSIONS = [".gz", ".bgz", ".bgzf"]
+
+def is_gzipped(fname) -> bool:
+    with open(fname, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+def is_bgzf(fname) -> bool:
+    '''bgzf blocks are gzip members with an extra field (FLG.FEXTRA) holding a "BC" subfield, which stores the block size'''
+    with open(fname, "rb") as f:
+        header = f.read(14)
+    return header[:2] == GZIP_MAGIC and len(header) == 14 and bool(header[3] & 4) and header[12:14] == b"BC"
+
+def strip_compression_ext(fname) -> str:
+    '''e.g. seqs.fasta.gz -> seqs.fasta'''
+    root, ext = os.path.splitext(fname)
+    return root if ext.lower() in COMPRESSED_EXTENSIONS else fname
+
+def open_text(fname, mode="r"):
+    '''Open a plain or gzip/bgzf-compressed text file for reading, detecting compression from content rather than extension'''
+    if is_gzipped(fname):
+        return gzip.open(fname, f"{mode}t")
+    return open(fname, mode)
+
+def csv_compression(fname):
+    '''pandas compression argument for a plain or gzip/bgzf-compressed csv, whatever its extension'''
+    return "gzip" if is_gzipped(fname) else None
+
+def indexable_seq_file(fname, cache_dir) -> str:
+    '''
+    Path to a random-access version of a sequence file. Plain and bgzf files are indexed in place (Biopython seeks
+    within bgzf blocks), so are returned unchanged. Plain gzip can't be seeked, so is recompressed to bgzf once per
+    content hash and the copy returned; the copy stays compressed, so reads from it stay small.
+    '''
+    if not is_gzipped(fname) or is_bgzf(fname):
+        return fname
+    os.makedirs(cache_dir, exist_ok=True)
+    bgzf_fname = f"{cache_dir}/{file_digest(fname)[:24]}.bgz"
+    if not os.path.isfile(bgzf_fname):
+        progress_msg(f"-  Recompressing {fname} to bgzf for random access")
+        tmp_fname = f"{bgzf_fname}.{os.getpid()}.tmp"
+        with gzip.open(fname, "rb") as src, bgzf.BgzfWriter(tmp_fname, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_fname, bgzf_fname)
+    return bgzf_fname
+
+def append_file(src_fname, dst_fname) -> None:
+    '''Append a plain text file to a plain, gzip or bgzf file, compressing to match the destination'''
+    if not is_gzipped(dst_fname):
+        with open(src_fname, "rb") as src, open(dst_fname, "ab") as dst:
+            shutil.copyfileobj(src, dst)
+        return
+    '''Concatenated gzip members (or bgzf blocks) form one valid stream'''
+    with open(src_fname, "rb") as src, (bgzf.BgzfWriter(dst_fname, "ab") if is_bgzf(dst_fname) else gzip.open(dst_fname, "ab")) as dst:
+        shutil.copyfileobj(src, dst)
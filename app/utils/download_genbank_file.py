@@ -1,21 +1,175 @@
-from Bio import Entrez
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import requests
+import random
+import shutil
+import json
+import time
 import os
 
-from app.utils.error_handlers import raise_gravity_error
+from app.utils.error_handlers import raise_gravity_error, raise_gravity_warning
+from app.utils.hashing import str_digest
+from app.utils.genbank_record_store import get_genbank_record_store
+from app.utils.stdout_utils import progress_msg
 
-def DownloadGenBankFile(GenomeSeqFile, SeqIDLists, email):
-    '''Hit GenBank to get data. Needs user to provide email authentication'''
-    if not os.path.exists("/".join(GenomeSeqFile.split("/")[:-1])):
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+'''NCBI E-utilities allow 3 requests/s per user, or 10 with an API key'''
+NCBI_RATE_LIMIT, NCBI_RATE_LIMIT_API_KEY = 3, 10
+'''Transient failures, worth retrying; other HTTP errors (e.g. 400 for malformed IDs) fail immediately'''
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class RateLimiter:
+    '''Space out requests from any number of threads to at most rate per second'''
+    def __init__(self, rate) -> None:
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+class GenBankDownloader:
+    '''
+    Fetch GenBank records for a list of accessions from NCBI efetch in batches, several at once within NCBI's rate
+    limit. Each batch is streamed to its own part file; failed batches are retried with exponential backoff. A
+    manifest of completed batches lets an interrupted download resume where it left off. Parts are concatenated in
+    batch order once all are complete, so the output is the same however batches were scheduled.
+    '''
+    def __init__(self, GenomeSeqFile, email, payload) -> None:
+        self.GenomeSeqFile = GenomeSeqFile
+        self.email = email
+        self.base_url = payload.get("EntrezBaseUrl", EFETCH_URL)
+        self.api_key = payload.get("NcbiApiKey")
+        self.batch_size = payload.get("GenBankBatchSize", 200)
+        self.n_workers = payload.get("GenBankDownloadWorkers", 3)
+        self.max_retries = payload.get("GenBankMaxRetries", 5)
+        self.backoff = payload.get("GenBankRetryBackoff", 2.0)
+        self.timeout = payload.get("GenBankTimeout", 120)
+        self.rate_limiter = RateLimiter(payload.get("GenBankRateLimit") or (NCBI_RATE_LIMIT_API_KEY if self.api_key else NCBI_RATE_LIMIT))
+        self.part_dir = f"{GenomeSeqFile}.parts"
+        self.manifest_fname = f"{self.part_dir}/manifest.json"
+        self.manifest_lock = threading.Lock()
+
+    def part_fname(self, BatchIdx) -> str:
+        return f"{self.part_dir}/part_{BatchIdx:06d}.gb"
+
+    def load_manifest(self, Batches) -> set:
+        '''Return indices of batches already downloaded, if an earlier attempt fetched the same accessions in the same batches'''
+        self.manifest = {"key": str_digest(self.base_url, *[",".join(Batch) for Batch in Batches]), "done": []}
+        if os.path.isfile(self.manifest_fname):
+            with open(self.manifest_fname) as f:
+                manifest = json.load(f)
+            if manifest.get("key") == self.manifest["key"]:
+                self.manifest["done"] = [BatchIdx for BatchIdx in manifest["done"] if os.path.isfile(self.part_fname(BatchIdx))]
+            else:
+                shutil.rmtree(self.part_dir)
+        os.makedirs(self.part_dir, exist_ok=True)
+        return set(self.manifest["done"])
+
+    def mark_done(self, BatchIdx) -> None:
+        with self.manifest_lock:
+            self.manifest["done"].append(BatchIdx)
+            tmp_fname = f"{self.manifest_fname}.tmp"
+            with open(tmp_fname, "w") as f:
+                json.dump(self.manifest, f)
+            os.replace(tmp_fname, self.manifest_fname)
+
+    def fetch_batch(self, BatchIdx, Batch) -> None:
+        '''Stream one batch to its part file; written under temp name and renamed only when the response is complete'''
+        params = {"db": "nucleotide", "id": ",".join(Batch), "rettype": "gb", "retmode": "text", "tool": "GRAViTy2", "email": self.email}
+        if self.api_key:
+            params["api_key"] = self.api_key
+        tmp_fname = f"{self.part_fname(BatchIdx)}.tmp"
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                '''POST, as NCBI recommend for long ID lists'''
+                with requests.post(self.base_url, data=params, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 200 and response.status_code not in RETRY_STATUS_CODES:
+                        raise_gravity_error(f"Failed to pull Genbank Data from NCBI Entrez (HTTP {response.status_code}: {response.text[:200]}). "
+                                            f"This is usually because your file contains genomes with invalid accession numbers.")
+                    response.raise_for_status()
+                    with open(tmp_fname, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
+                if not self.is_complete(tmp_fname):
+                    raise IOError("truncated response")
+                os.replace(tmp_fname, self.part_fname(BatchIdx))
+                self.mark_done(BatchIdx)
+                return
+            except (requests.RequestException, IOError) as e:
+                if attempt == self.max_retries:
+                    raise_gravity_error(f"Failed to pull Genbank Data from NCBI Entrez after {self.max_retries + 1} attempts with exception: {e}. "
+                                        f"This is usually a temporary problem due to NCBI server down time (try again in a few minutes: completed batches will not be downloaded again).")
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                raise_gravity_warning(f"GenBank batch {BatchIdx + 1} failed ({e}), retrying in {delay:.1f} s")
+                time.sleep(delay)
+
+    @staticmethod
+    def is_complete(fname) -> bool:
+        '''A complete GenBank response is empty or ends with a record terminator'''
+        with open(fname, "rb") as f:
+            f.seek(max(0, os.path.getsize(fname) - 64))
+            tail = f.read().rstrip()
+        return tail == b"" or tail.endswith(b"//")
+
+    def assemble(self, N_Batches) -> None:
+        '''Concatenate parts in batch order; written under temp name and renamed when complete'''
+        tmp_fname = f"{self.GenomeSeqFile}.tmp"
+        with open(tmp_fname, "wb") as out:
+            for BatchIdx in range(N_Batches):
+                with open(self.part_fname(BatchIdx), "rb") as part:
+                    shutil.copyfileobj(part, out)
+        os.replace(tmp_fname, self.GenomeSeqFile)
+        shutil.rmtree(self.part_dir)
+
+    def download(self, Accessions) -> None:
+        Batches = [Accessions[i:i+self.batch_size] for i in range(0, len(Accessions), self.batch_size)]
+        done = self.load_manifest(Batches)
+        if done:
+            progress_msg(f"-  Resuming GenBank download: {len(done)}/{len(Batches)} batches already downloaded")
+        ToFetch = [(BatchIdx, Batch) for BatchIdx, Batch in enumerate(Batches) if BatchIdx not in done]
+        with ThreadPoolExecutor(max_workers=max(1, self.n_workers)) as executor:
+            Futures = [executor.submit(self.fetch_batch, BatchIdx, Batch) for BatchIdx, Batch in ToFetch]
+            try:
+                for Future in Futures:
+                    Future.result()
+            except BaseException:
+                '''Don't start batches still queued; completed ones are kept for the next attempt'''
+                executor.shutdown(cancel_futures=True)
+                raise
+        self.assemble(len(Batches))
+
+def DownloadGenBankFile(GenomeSeqFile, SeqIDLists, email, payload=None):
+    '''Hit GenBank to get data. Needs user to provide email authentication. Download options are read from payload, if given'''
+    if not os.path.exists("/".join(GenomeSeqFile.split("/")[:-1])) and "/" in GenomeSeqFile:
         os.makedirs("/".join(GenomeSeqFile.split("/")[:-1]))
 
-    Entrez.email = email
-    try:
-        handle = Entrez.efetch(db="nucleotide", id=", ".join([", ".join(x) for x in SeqIDLists]), rettype="gb", retmode="text")
-    except Exception as e:
-        raise_gravity_error(f"Failed to pull Genbank Data from NCBI Entrez with exception: {e}"
-                         f"This is usually a temporary problem due to NCBI server down time (try again in a few minutes!) OR your file is entirely composed of genomes with invalid accession numbers.")
-    print("Writing contents of genbank object to file")
-    with open(GenomeSeqFile, "w") as GenomeSeqFile_handle:
-        GenomeSeqFile_handle.write(handle.read())
+    '''Unique, non-empty accessions in VMR order'''
+    Accessions = list(dict.fromkeys(SeqID.strip() for SeqIDList in SeqIDLists for SeqID in SeqIDList if SeqID.strip()))
+    if len(Accessions) == 0:
+        raise_gravity_error(f"Failed to pull Genbank Data from NCBI Entrez: your file is entirely composed of genomes with invalid accession numbers.")
+    payload = payload or {}
+    store = get_genbank_record_store(payload)
+    if store is None:
+        print("Writing contents of genbank object to file")
+        GenBankDownloader(GenomeSeqFile, email, payload).download(Accessions)
+        return
 
-    handle.close()
+    '''Fetch only what the local record store doesn't already hold, then assemble the file from the store'''
+    ToFetch = store.missing(Accessions)
+    progress_msg(f"-  {len(Accessions) - len(ToFetch)}/{len(Accessions)} GenBank records found in local record store")
+    if len(ToFetch) > 0:
+        DownloadFile = f"{GenomeSeqFile}.download"
+        GenBankDownloader(DownloadFile, email, payload).download(ToFetch)
+        store.add_file(DownloadFile)
+        os.remove(DownloadFile)
+    print("Writing contents of genbank object to file")
+    store.assemble(Accessions, GenomeSeqFile)
+    if len(ToFetch) > 0:
+        '''The store only grows when records are added; evict after assembling, so this experiment's records are the most recently used'''
+        store.evict()
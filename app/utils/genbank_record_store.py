@@ -0,0 +1,148 @@
+import sqlite3
+import time
+import os
+
+from app.utils.hashing import str_digest
+from app.utils.accession_index import normalise_accession
+from app.utils.generate_fnames import generate_cache_fnames
+from app.utils.stdout_utils import progress_msg
+
+'''Bump if the store layout changes; records in an old-layout store are ignored'''
+GENBANK_RECORD_STORE_VERSION = 1
+'''Bound parameters per query; SQLite builds before 3.32 allow at most 999'''
+SQLITE_MAX_VARIABLES = 900
+
+def version_number(AccVersion) -> int:
+    '''e.g. AB123456.12 -> 12; 0 if there's no numeric version'''
+    Version = AccVersion.split(".")[-1] if "." in AccVersion else ""
+    return int(Version) if Version.isdigit() else 0
+
+def split_genbank_records(fname):
+    '''Stream (accession.version, record text) from a multi-record GenBank file, without parsing the records'''
+    Lines, AccVersion, Accession = [], None, None
+    with open(fname) as f:
+        for line in f:
+            if line.startswith("LOCUS") and Lines:
+                '''Unterminated record; drop it rather than store a partial one'''
+                Lines, AccVersion, Accession = [], None, None
+            if not Lines and not line.strip():
+                continue
+            Lines.append(line)
+            if line.startswith("VERSION") and len(line.split()) > 1:
+                AccVersion = line.split()[1]
+            elif line.startswith("ACCESSION") and len(line.split()) > 1:
+                Accession = line.split()[1]
+            elif line.startswith("//"):
+                if AccVersion or Accession:
+                    yield AccVersion or Accession, "".join(Lines)
+                Lines, AccVersion, Accession = [], None, None
+
+class GenBankRecordStore:
+    '''
+    Local store of GenBank records shared by all experiments, one file per record, keyed by accession.version and
+    looked up by accession with or without version. Experiment GenBank files are assembled from the store, so a
+    record is downloaded once however many experiments use it. Total size is capped at max_bytes by evicting least
+    recently used records.
+    '''
+    def __init__(self, store_dir, max_bytes) -> None:
+        self.store_dir = f"{store_dir}/v{GENBANK_RECORD_STORE_VERSION}"
+        self.max_bytes = max_bytes
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.db_fname = f"{self.store_dir}/records.sqlite"
+        with self.connect() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS records (acc_version TEXT PRIMARY KEY, accession TEXT, fname TEXT, size INTEGER, last_used REAL)")
+            con.execute("CREATE INDEX IF NOT EXISTS records_accession ON records (accession)")
+
+    def connect(self):
+        '''Several experiments may share a store; wait on a locked database rather than fail'''
+        return sqlite3.connect(self.db_fname, timeout=600)
+
+    def record_fname(self, AccVersion) -> str:
+        key = str_digest(AccVersion)
+        return f"{key[:2]}/{AccVersion}.gb"
+
+    def lookup(self, SeqIDs) -> dict:
+        '''
+        {requested SeqID: (stored accession.version, record file)}. An unversioned SeqID matches its latest stored
+        version. Candidates are fetched by accession in a few IN (...) queries, rather than one query per SeqID
+        '''
+        Accessions = list(dict.fromkeys(normalise_accession(SeqID.upper()) for SeqID in SeqIDs))
+        Stored, Latest = {}, {}
+        with self.connect() as con:
+            for i in range(0, len(Accessions), SQLITE_MAX_VARIABLES):
+                Chunk = Accessions[i:i+SQLITE_MAX_VARIABLES]
+                for AccVersion, Accession, fname in con.execute(
+                        f"SELECT acc_version, accession, fname FROM records WHERE accession IN ({','.join('?' * len(Chunk))})", Chunk):
+                    Stored[AccVersion] = fname
+                    if Accession not in Latest or version_number(AccVersion) > version_number(Latest[Accession]):
+                        Latest[Accession] = AccVersion
+        Found = {}
+        for SeqID in SeqIDs:
+            AccVersion = SeqID.upper() if "." in SeqID else Latest.get(SeqID.upper())
+            if AccVersion in Stored:
+                Found[SeqID] = (AccVersion, Stored[AccVersion])
+        return Found
+
+    def find(self, SeqIDs) -> dict:
+        '''{requested SeqID: stored accession.version}. An unversioned SeqID matches its latest stored version'''
+        return {SeqID: AccVersion for SeqID, (AccVersion, _) in self.lookup(SeqIDs).items()}
+
+    def missing(self, SeqIDs) -> list:
+        Found = self.find(SeqIDs)
+        return [SeqID for SeqID in SeqIDs if SeqID not in Found]
+
+    def add_file(self, GenBankFile) -> int:
+        '''Store every record in a downloaded GenBank file; return number stored'''
+        N_Stored = 0
+        with self.connect() as con:
+            for AccVersion, Record in split_genbank_records(GenBankFile):
+                AccVersion = AccVersion.upper()
+                fname = self.record_fname(AccVersion)
+                os.makedirs(os.path.dirname(f"{self.store_dir}/{fname}"), exist_ok=True)
+                tmp_fname = f"{self.store_dir}/{fname}.{os.getpid()}.tmp"
+                with open(tmp_fname, "w") as f:
+                    f.write(Record)
+                os.replace(tmp_fname, f"{self.store_dir}/{fname}")
+                con.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                            (AccVersion, normalise_accession(AccVersion), fname, os.path.getsize(f"{self.store_dir}/{fname}"), time.time()))
+                N_Stored += 1
+        return N_Stored
+
+    def assemble(self, SeqIDs, GenomeSeqFile) -> list:
+        '''Stream stored records for SeqIDs, in order, to a GenBank file; return SeqIDs not in the store'''
+        Found = self.lookup(SeqIDs)
+        tmp_fname = f"{GenomeSeqFile}.{os.getpid()}.tmp"
+        with open(tmp_fname, "w") as out:
+            for SeqID in SeqIDs:
+                if SeqID not in Found:
+                    continue
+                with open(f"{self.store_dir}/{Found[SeqID][1]}") as f:
+                    out.write(f.read())
+        with self.connect() as con:
+            con.executemany("UPDATE records SET last_used = ? WHERE acc_version = ?", [(time.time(), AccVersion) for AccVersion, _ in Found.values()])
+        os.replace(tmp_fname, GenomeSeqFile)
+        return [SeqID for SeqID in SeqIDs if SeqID not in Found]
+
+    def evict(self) -> None:
+        '''Delete least recently used records until the store fits in max_bytes. Only needed after records are added'''
+        with self.connect() as con:
+            TotalSize = con.execute("SELECT COALESCE(SUM(size), 0) FROM records").fetchone()[0]
+            if TotalSize <= self.max_bytes:
+                return
+            Evicted = []
+            for AccVersion, fname, size in con.execute("SELECT acc_version, fname, size FROM records ORDER BY last_used"):
+                if TotalSize <= self.max_bytes:
+                    break
+                if os.path.isfile(f"{self.store_dir}/{fname}"):
+                    os.remove(f"{self.store_dir}/{fname}")
+                Evicted.append((AccVersion,))
+                TotalSize -= size
+            con.executemany("DELETE FROM records WHERE acc_version = ?", Evicted)
+        progress_msg(f"-  Evicted {len(Evicted)} least recently used records from the GenBank record store")
+
+def get_genbank_record_store(payload):
+    '''Store shared by all experiments, or None if caching is off'''
+    if not payload.get("UseCache", True):
+        return None
+    return GenBankRecordStore(generate_cache_fnames({}, payload)['GenBankRecordStoreDir'],
+                              int(payload.get("GenBankStoreMaxGB", 20) * 1024 ** 3))
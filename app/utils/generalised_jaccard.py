@@ -0,0 +1,165 @@
+import numpy as np
+from multiprocessing import Pool
+from scipy.sparse import coo_matrix, csr_matrix
+
+'''Elements per broadcast (rows x rows x PPHMMs) chunk when summing minima over a tile'''
+GJ_CHUNK_ELEMENTS = 1 << 22
+
+class CompoundedWeights:
+    '''
+    Neighbourhood weights as the original pair-by-pair similarity loop applied them. It reweights (and
+    re-thresholds) rows of the signature table in place every time they're used, so weights compound: at pair
+    (i, j), i < j, row i has been weighted j+2 times and row j i+1 times; on the diagonal, row i has been weighted
+    i+2 times; every row ends up weighted N+1 times. An entry with score s and factor f weighted t times is
+    s*f**t, or 0 if it has fallen below the threshold on the way: f < 1 shrinks, so that is s*f**t < threshold;
+    f > 1 grows, so only the first thresholding can catch it. Rows are first thresholded after one weighting
+    (at pair (0, j)), except row 0, first met at pair (0, 0), where it is weighted twice (as i and as j) first.
+
+    FactorTable is a sparse (viruses x PPHMMs) table of weight factors, over the weighted entries only (see
+    pphmm_neighbour_weight_table); entries outside the signature table's shape are ignored.
+    '''
+    def __init__(self, Scores, FactorTable, Threshold) -> None:
+        self.scores, self.threshold = Scores, Threshold
+        Table = coo_matrix(FactorTable)
+        Rows, Cols, Factors = Table.row, Table.col, Table.data
+        '''Zero scores stay zero however weighted (and a large factor**times could overflow)'''
+        Keep = (Rows < Scores.shape[0]) & (Cols < Scores.shape[1])
+        Rows, Cols, Factors = Rows[Keep], Cols[Keep], Factors[Keep]
+        Keep = (Factors != 1) & (Scores[Rows, Cols] != 0)
+        Order = np.lexsort((Cols[Keep], Rows[Keep]))
+        Rows, Cols, Factors = Rows[Keep][Order], Cols[Keep][Order], Factors[Keep][Order]
+        self.weighted = np.zeros(Scores.shape, dtype=bool)
+        self.weighted[Rows, Cols] = True
+        self.factors = csr_matrix((Factors, (Rows, Cols)), shape=Scores.shape)
+        '''Unweighted entries are only ever thresholded; weighted entries are kept separately, zero here'''
+        self.static = np.where(self.weighted | (Scores < Threshold), 0.0, Scores)
+        self.w_indptr = np.concatenate(([0], np.cumsum(np.bincount(Rows, minlength=Scores.shape[0]))))
+        self.w_cols, self.w_scores, self.w_factors = Cols, Scores[Rows, Cols], Factors
+
+    @staticmethod
+    def first_weighting(Rows):
+        '''Times each row has been weighted when first thresholded'''
+        return np.where(np.asarray(Rows) == 0, 2, 1)
+
+    def value(self, Score, Factor, Times, FirstTimes=1):
+        Weighted = Score * Factor ** Times
+        return np.where(np.minimum(Score * Factor ** FirstTimes, Weighted) < self.threshold, 0.0, Weighted)
+
+    def row_entries(self, RowStart, RowEnd):
+        '''Weighted entries of a range of rows: (row offsets from RowStart, columns, scores, factors)'''
+        Entries = slice(self.w_indptr[RowStart], self.w_indptr[RowEnd])
+        Rows = np.repeat(np.arange(RowEnd - RowStart), np.diff(self.w_indptr[RowStart:RowEnd+1]))
+        return Rows, self.w_cols[Entries], self.w_scores[Entries], self.w_factors[Entries]
+
+    def weighted_row_sums(self, RowStart, RowEnd, Times):
+        Rows, _, Scores, Factors = self.row_entries(RowStart, RowEnd)
+        Values = self.value(Scores, Factors, Times, self.first_weighting(RowStart + Rows))
+        return np.bincount(Rows, weights=Values, minlength=RowEnd - RowStart)
+
+    def final_table(self, N_Viruses):
+        '''The table as the legacy loop leaves it, every row weighted N+1 times'''
+        Table = self.static.copy()
+        Rows = np.repeat(np.arange(len(self.w_indptr) - 1), np.diff(self.w_indptr))
+        Table[Rows, self.w_cols] = self.value(self.w_scores, self.w_factors, N_Viruses + 1, self.first_weighting(Rows))
+        return Table
+
+def tile_min_sums(X, Y, NonNegative) -> np.ndarray:
+    '''sum(np.minimum(x, y)) for every row x of X and y of Y. For non-negative data, columns that are all-zero in either block add nothing and are skipped'''
+    if NonNegative:
+        Cols = np.flatnonzero((X != 0).any(axis=0) & (Y != 0).any(axis=0))
+        X, Y = X[:, Cols], Y[:, Cols]
+    MinSums = np.zeros((X.shape[0], Y.shape[0]))
+    Chunk = max(1, GJ_CHUNK_ELEMENTS // max(1, X.shape[0] * Y.shape[0]))
+    for ColStart in range(0, X.shape[1], Chunk):
+        MinSums += np.minimum(X[:, None, ColStart:ColStart+Chunk], Y[None, :, ColStart:ColStart+Chunk]).sum(axis=2)
+    return MinSums
+
+'''Arrays of the matrix being computed, set in each worker by init_gj_worker (inherited, not pickled, on fork)'''
+_gj_state = {}
+
+def init_gj_worker(Static, Weights, NonNegative) -> None:
+    _gj_state.update(static=Static, weights=Weights, row_sums=Static.sum(axis=1), nonneg=NonNegative)
+
+def gj_tile(Tile):
+    '''
+    Generalised Jaccard scores of rows [RowStart, RowEnd) against rows [ColStart, ColEnd) (ColStart >= RowStart),
+    from minimum sums; maximum sums follow as sum(max(x, y)) = sum(x) + sum(y) - sum(min(x, y)). With compounded
+    weights, minima are taken over the static (unweighted) entries, then corrected pair by pair on the
+    weighted entries of either row.
+    '''
+    RowStart, RowEnd, ColStart, ColEnd = Tile
+    Static, Weights, RowSums = _gj_state["static"], _gj_state["weights"], _gj_state["row_sums"]
+    MinSums = tile_min_sums(Static[RowStart:RowEnd], Static[ColStart:ColEnd], _gj_state["nonneg"])
+    SumX = np.repeat(RowSums[RowStart:RowEnd, None], ColEnd - ColStart, axis=1)
+    SumY = np.repeat(RowSums[None, ColStart:ColEnd], RowEnd - RowStart, axis=0)
+
+    if Weights is not None:
+        for i in range(RowStart, RowEnd):
+            '''Pairs (i, j > i) in this tile; row i weighted j+2 times, row j i+1 times'''
+            JStart = max(ColStart, i + 1)
+            if JStart >= ColEnd:
+                continue
+            Ti, Tj = i - RowStart, slice(JStart - ColStart, ColEnd - ColStart)
+            Js = np.arange(JStart, ColEnd)
+
+            '''Row j's sum, and its weighted entries outside row i's weighted entries (where row i is static); j > 0, so first thresholded after one weighting'''
+            Rows, Cols, Scores, Factors = Weights.row_entries(JStart, ColEnd)
+            Values = Weights.value(Scores, Factors, i + 1)
+            SumY[Ti, Tj] += np.bincount(Rows, weights=Values, minlength=len(Js))
+            Outside = ~Weights.weighted[i, Cols]
+            Static_i = Static[i, Cols[Outside]]
+            MinSums[Ti, Tj] += np.bincount(Rows[Outside], weights=np.minimum(Static_i, Values[Outside]) - np.minimum(Static_i, 0.0), minlength=len(Js))
+
+            '''Row i's weighted entries, against row j's (weighted or static) entries in the same columns'''
+            Entries = slice(Weights.w_indptr[i], Weights.w_indptr[i+1])
+            Cols_i = Weights.w_cols[Entries]
+            if len(Cols_i) == 0:
+                continue
+            X = Weights.value(Weights.w_scores[Entries][None, :], Weights.w_factors[Entries][None, :], Js[:, None] + 2, Weights.first_weighting(i))
+            Y_Static = Static[JStart:ColEnd][:, Cols_i]
+            Y_Weighted = Weights.weighted[JStart:ColEnd][:, Cols_i]
+            Y = np.where(Y_Weighted, Weights.value(Weights.scores[JStart:ColEnd][:, Cols_i], Weights.factors[JStart:ColEnd][:, Cols_i].toarray(), i + 1), Y_Static)
+            SumX[Ti, Tj] += X.sum(axis=1)
+            MinSums[Ti, Tj] += np.sum(np.minimum(X, Y) - np.minimum(Static[i, Cols_i][None, :], Y_Static), axis=1)
+
+    MaxSums = SumX + SumY - MinSums
+    with np.errstate(invalid="ignore", divide="ignore"):
+        Tile_GJ = np.where(MaxSums == 0, 0.0, MinSums / np.where(MaxSums == 0, 1.0, MaxSums))
+    return Tile, Tile_GJ
+
+def generalised_jaccard_matrix(Table, Weights=None, N_CPUs=1, BlockSize=256) -> np.ndarray:
+    '''
+    Pairwise generalised Jaccard scores, sum(min(x, y)) / sum(max(x, y)) (0 if the denominator is 0), of the rows of
+    Table, or of Weights' compounded scores if given (see CompoundedWeights). Only tiles on or above the diagonal
+    are computed, BlockSize rows square, on N_CPUs processes; the rest is mirrored.
+    '''
+    Static = np.asarray(Table, dtype=float) if Weights is None else Weights.static
+    N_Viruses = Static.shape[0]
+    GJMat = np.zeros((N_Viruses, N_Viruses))
+    Tiles = [(RowStart, min(RowStart + BlockSize, N_Viruses), ColStart, min(ColStart + BlockSize, N_Viruses))
+             for RowStart in range(0, N_Viruses, BlockSize) for ColStart in range(RowStart, N_Viruses, BlockSize)]
+    InitArgs = (Static, Weights, not (Static < 0).any())
+
+    if N_CPUs <= 1 or len(Tiles) == 1:
+        init_gj_worker(*InitArgs)
+        Results = map(gj_tile, Tiles)
+    else:
+        pool = Pool(N_CPUs, initializer=init_gj_worker, initargs=InitArgs)
+        Results = pool.imap_unordered(gj_tile, Tiles)
+    try:
+        for (RowStart, RowEnd, ColStart, ColEnd), Tile_GJ in Results:
+            GJMat[RowStart:RowEnd, ColStart:ColEnd] = Tile_GJ
+    finally:
+        if N_CPUs > 1 and len(Tiles) > 1:
+            pool.close()
+            pool.join()
+        _gj_state.clear()
+
+    '''Mirror the upper triangle; the diagonal is 1 for any row with a nonzero sum (self-weighted i+2 times for compounded weights)'''
+    GJMat = np.triu(GJMat, 1) + np.triu(GJMat, 1).T
+    RowSums = Static.sum(axis=1)
+    if Weights is not None:
+        RowSums = RowSums + np.array([Weights.weighted_row_sums(i, i + 1, i + 2)[0] for i in range(N_Viruses)])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        GJMat[np.diag_indices(N_Viruses)] = np.where(RowSums == 0, 0.0, RowSums / np.where(RowSums == 0, 1.0, RowSums))
+    return GJMat
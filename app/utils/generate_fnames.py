@@ -13,6 +13,13 @@ def generate_file_names(payload, ExpDir, Pl2=False):
 
     '''Read Genome Desc Table'''
     fnames["ReadGenomeDescTablePickle"] = f'{fnames["OutputDir"]}/ReadGenomeDescTable.p'
+    fnames["ReadGenomeDescTableParquet"] = f'{fnames["OutputDir"]}/ReadGenomeDescTable.parquet'
+    fnames["VmrChangeset"] = f'{fnames["OutputDir"]}/VmrChangeset.json'
+    fnames["SequenceDigests"] = f'{fnames["OutputDir"]}/SequenceDigests.json'
+    fnames["SignatureGenomeKeys"] = f'{fnames["OutputDir"]}/SignatureGenomeKeys.json'
+
+    '''Persistent caches, shared between experiments'''
+    fnames = generate_cache_fnames(fnames, payload)
 
     '''PPHMMDB Cosntruction'''
     fnames = generate_pphmmdb_fnames(fnames)
@@ -35,6 +42,17 @@ def generate_file_names(payload, ExpDir, Pl2=False):
 
     return fnames
 
+def generate_cache_fnames(fnames, payload):
+    '''Generate folder names for caches that persist across experiments and pipelines'''
+    fnames['CacheDir'] = payload.get('CacheDir', './output/cache')
+    fnames['SignatureCacheDir'] = f"{fnames['CacheDir']}/pphmm_signatures"
+    fnames['OrfCatalogueDir'] = f"{fnames['CacheDir']}/orfs"
+    fnames['AccessionIndexDir'] = f"{fnames['CacheDir']}/accession_index"
+    fnames['SequenceStoreDir'] = f"{fnames['CacheDir']}/sequence_store"
+    fnames['VmrSnapshotDir'] = f"{fnames['CacheDir']}/vmr"
+    fnames['GenBankRecordStoreDir'] = f"{fnames['CacheDir']}/genbank_records"
+    return fnames
+
 def generate_pphmmdb_fnames(fnames):
     '''Generate file and folder names for PPHMMDB Constructor'''
     '''Mash Dirs'''
@@ -64,6 +82,7 @@ def generate_ref_annotator_fnames(fnames):
     '''Generate file and folder names for Ref Virus Annotator'''
     '''Misc'''
     fnames['RefAnnotatorPickle'] = f'{fnames["OutputDir"]}/RefVirusAnnotator.p'
+    fnames['GOMDBPickle'] = f'{fnames["OutputDir"]}/GOMDB.p'
     return fnames
 
 def generate_pl1_graph_fnames(fnames, payload):
@@ -0,0 +1,43 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+'''Query viruses scored per block, bounding the dense (block x reference viruses) similarity matrix'''
+CANDIDATE_BLOCK_SIZE = 1024
+
+def candidate_gom_mask(PPHMMSignatureTable, RefPPHMMSignatureTable, RefTaxoGroupingList, GOMIDList, TopK) -> np.ndarray:
+    '''
+    Boolean (viruses x GOMs) mask of each virus's TopK candidate groups, for GOMSignatureTable_Constructor. Groups
+    are ranked by their closest member, by Jaccard index of present PPHMMs (signature score > 0), from one sparse
+    product per block of viruses, so the prefilter costs a fraction of scoring every GOM. Both signature tables must
+    share PPHMM columns. TopK >= len(GOMIDList) selects every group, as does a virus sharing no PPHMMs with any
+    reference (no ranking to go on).
+    '''
+    N_Viruses, N_GOMs = PPHMMSignatureTable.shape[0], len(GOMIDList)
+    if TopK >= N_GOMs:
+        return np.ones((N_Viruses, N_GOMs), dtype=bool)
+    Present = csr_matrix(np.asarray(PPHMMSignatureTable) > 0, dtype=float)
+    RefPresent = csr_matrix(np.asarray(RefPPHMMSignatureTable) > 0, dtype=float)
+    N_Present, N_RefPresent = np.asarray(Present.sum(axis=1)).ravel(), np.asarray(RefPresent.sum(axis=1)).ravel()
+
+    '''Reference viruses ordered by group, so per-group maxima are one reduceat; viruses outside GOMIDList are dropped'''
+    RefTaxoGroupingList = np.asarray(RefTaxoGroupingList).astype(str)
+    GroupMembers = [np.flatnonzero(RefTaxoGroupingList == str(GOMID)) for GOMID in GOMIDList]
+    NonEmpty = np.array([len(Members) > 0 for Members in GroupMembers])
+    if not NonEmpty.any():
+        return np.ones((N_Viruses, N_GOMs), dtype=bool)
+    RefOrder = np.concatenate([Members for Members in GroupMembers if len(Members)]).astype(int)
+    GroupStarts = np.cumsum([0] + [len(Members) for Members in GroupMembers if len(Members)])[:-1]
+    RefPresentT = RefPresent[RefOrder].T.tocsc()
+
+    Mask = np.zeros((N_Viruses, N_GOMs), dtype=bool)
+    for BlockStart in range(0, N_Viruses, CANDIDATE_BLOCK_SIZE):
+        Block = slice(BlockStart, min(BlockStart + CANDIDATE_BLOCK_SIZE, N_Viruses))
+        Shared = (Present[Block] @ RefPresentT).toarray()
+        Union = N_Present[Block, None] + N_RefPresent[None, RefOrder] - Shared
+        Jaccard = np.divide(Shared, Union, out=np.zeros_like(Shared), where=Union > 0)
+        GroupScores = np.full((Shared.shape[0], N_GOMs), -1.0)
+        GroupScores[:, NonEmpty] = np.maximum.reduceat(Jaccard, GroupStarts, axis=1)
+        TopGroups = np.argpartition(-GroupScores, TopK - 1, axis=1)[:, :TopK]
+        np.put_along_axis(Mask[Block], TopGroups, True, axis=1)
+        Mask[Block][GroupScores.max(axis=1) <= 0] = True
+    return Mask
@@ -22,41 +22,210 @@
 
 #     return GOMSignatureTable
 
-import os
+import shutil
+import tempfile
 import numpy as np
 from tqdm import tqdm
 from multiprocessing import Pool
-from alive_progress import alive_it
+from scipy.spatial.distance import pdist, squareform
+from scipy.sparse import csr_matrix, vstack, save_npz, load_npz
+from collections import OrderedDict
+from contextlib import nullcontext
 
-from app.utils.dcor import dcor
+from app.utils.gomdb_constructor import SparseGOMDB, sparse_digest
 from app.utils.stdout_utils import progress_msg
 
-def GOMSignatureTable_Constructor(PPHMMLocationTable, GOMDB, GOMIDList, bootstrap=0):
-    '''Generate organisational model signature table, for annotations, graphing and description functions'''
+class GOMModel:
+    '''
+    Per-GOM terms reused for every virus scored against it. A GOM's points are PPHMMs, with one coordinate per member
+    virus; PPHMMs outside its support (all-zero columns) all sit at the origin. So over any virus's relevant PPHMMs
+    (GOM support + K of the virus's own hits), the distance matrix M is the support's distance matrix D, bordered
+    by the support's distances from the origin (column norms), with zeros between the K extra PPHMMs. M's row
+    means, grand mean and sum of squares then follow from a few sums over D, for any K.
+
+    dcor_reference double-centres both distance matrices (A from M, B from the virus's PPHMM location distances N);
+    as centred matrices' rows and columns sum to zero, sum(A*B) = sum(A*N) and sum(A**2) = sum(A*M), so neither
+    centred matrix is built. The virus's locations are zero outside its own hits, so every N term is a sum over
+    its nonzero locations: scoring a virus costs O(hits^2), however large the GOM's support.
+    '''
+    def __init__(self, GOMMatrix) -> None:
+        GOMMatrix = csr_matrix(GOMMatrix, dtype=float)
+        GOMMatrix.eliminate_zeros()
+        self.support = np.unique(GOMMatrix.indices)
+        '''Position of each PPHMM in the support, -1 if outside it'''
+        self.support_pos = np.full(GOMMatrix.shape[1], -1)
+        self.support_pos[self.support] = np.arange(len(self.support))
+        Points = GOMMatrix[:, self.support].toarray().T
+        self.dists = squareform(pdist(Points))
+        self.dist_rowsums = self.dists.sum(axis=1)
+        self.norms = np.sqrt(np.sum(Points ** 2, axis=1))
+        self.sum_sq_dists = np.sum(self.dists ** 2)
+        self.sum_norms, self.sum_sq_norms = self.norms.sum(), np.sum(self.norms ** 2)
+        self.sum_rowsums, self.sum_sq_rowsums = self.dist_rowsums.sum(), np.sum(self.dist_rowsums ** 2)
+        self.sum_rowsums_norms = np.sum(self.dist_rowsums * self.norms)
+
+    def nbytes(self) -> int:
+        return self.dists.nbytes + self.support_pos.nbytes
+
+    def score(self, Cols, Vals):
+        '''dcor of GOM and one virus's PPHMM locations (given as its nonzero PPHMM indices and values), over the PPHMMs either has'''
+        Pos = self.support_pos[Cols]
+        InSupport = Pos >= 0
+        Z, y_Z, y_E = Pos[InSupport], Vals[InSupport], Vals[~InSupport]
+        N_Support, K = len(self.support), len(y_E)
+        n = N_Support + K
+        if n < 2:
+            return 0.0
+        N_Zeros = N_Support - len(Z)
+
+        '''GOM side: row means of M (support rows, then the identical extra rows), grand mean, sum(A**2)'''
+        RowMeans_Z = (self.dist_rowsums[Z] + K * self.norms[Z]) / n
+        RowMean_E = self.sum_norms / n
+        SumRowMeans_Support = (self.sum_rowsums + K * self.sum_norms) / n
+        SumSqRowMeans = (self.sum_sq_rowsums + 2 * K * self.sum_rowsums_norms + K ** 2 * self.sum_sq_norms) / n ** 2 + K * RowMean_E ** 2
+        GrandMean = (self.sum_rowsums + 2 * K * self.sum_norms) / n ** 2
+        SumSqA = self.sum_sq_dists + 2 * K * self.sum_sq_norms - 2 * n * SumSqRowMeans + n ** 2 * GrandMean ** 2
+
+        '''Virus side: N between nonzero locations (support hits Z, then extras E); zero locations are N_Zeros support PPHMMs'''
+        y = np.concatenate((y_Z, y_E))
+        N = np.abs(y[:, None] - y[None, :])
+        AbsSum = np.abs(y).sum()
+        RowSums = N.sum(axis=1) + N_Zeros * np.abs(y)
+        SumN = N_Zeros * AbsSum + RowSums.sum()
+        SumSqRowSums = N_Zeros * AbsSum ** 2 + np.sum(RowSums ** 2)
+        SumSqB = np.sum(N ** 2) + 2 * N_Zeros * np.sum(y ** 2) - 2 * SumSqRowSums / n + SumN ** 2 / n ** 2
+
+        '''sum(M*N): support block (zero rows only see Z), plus the support-extra border'''
+        N_Z, N_ZE, n_Z = N[:len(Z), :len(Z)], N[:len(Z), len(Z):], len(Z)
+        D_Z = self.dists[np.ix_(Z, Z)]
+        SumDN = np.sum(D_Z * N_Z) + 2 * np.sum(np.abs(y_Z) * (self.dist_rowsums[Z] - D_Z.sum(axis=1)))
+        SumBorder = np.abs(y_E).sum() * (self.sum_norms - self.norms[Z].sum()) + np.sum(self.norms[Z] * N_ZE.sum(axis=1))
+        SumMN = SumDN + 2 * SumBorder
+
+        SumRowMeansRowSums = ((SumRowMeans_Support - RowMeans_Z.sum()) * AbsSum + np.sum(RowMeans_Z * RowSums[:n_Z])
+                              + RowMean_E * RowSums[n_Z:].sum())
+        SumAB = SumMN - 2 * SumRowMeansRowSums + GrandMean * SumN
+        return dcor_from_sums(SumAB, SumSqA, SumSqB, n)
+
+def dcor_from_sums(SumAB, SumSqA, SumSqB, n):
+    '''As dcor_reference, from sum(A*B), sum(A**2) and sum(B**2) of the double-centred distance matrices'''
+    dvar_A, dvar_B = np.sqrt(max(SumSqA, 0.0)) / n, np.sqrt(max(SumSqB, 0.0)) / n
+    if dvar_A > 0.0 and dvar_B > 0.0:
+        return np.sqrt(max(SumAB, 0.0)) / n / np.sqrt(dvar_A * dvar_B)
+    return 0.0
+
+'''GOMModels by GOM digest, so a process scoring the same (unchanged) GOMs again, e.g. reference then unclassified viruses, builds each once'''
+GOM_MODEL_CACHE_BYTES = 512 * 1024 ** 2
+_gom_models = OrderedDict()
+
+def get_gom_model(GOMMatrix, Digest) -> GOMModel:
+    if Digest in _gom_models:
+        _gom_models.move_to_end(Digest)
+        return _gom_models[Digest]
+    Model = GOMModel(GOMMatrix)
+    _gom_models[Digest] = Model
+    while len(_gom_models) > 1 and sum(Cached.nbytes() for Cached in _gom_models.values()) > GOM_MODEL_CACHE_BYTES:
+        _gom_models.popitem(last=False)
+    return Model
+
+def score_gom_block(LocationTable, Model, Rows) -> np.ndarray:
+    '''GOM signatures of a block of viruses (rows of a CSR location table) against one GOM'''
+    Scores = np.empty(len(Rows))
+    for Score_i, Row in enumerate(Rows):
+        Entries = slice(LocationTable.indptr[Row], LocationTable.indptr[Row+1])
+        Scores[Score_i] = Model.score(LocationTable.indices[Entries], LocationTable.data[Entries])
+    return Scores
+
+class GOMScoringPool:
+    '''
+    Worker pool and scratch directory for GOMSignatureTable_Constructor, for the duration of a with block: every call
+    given it (e.g. one per bootstrap replicate) reuses both, and both are shut down and removed on leaving the block.
+    Each call writes its sparse arrays over the last call's under a new call number, so workers reload them once per call.
+    With N_CPUs <= 1, GOMs are scored serially and nothing is started.
+    '''
+    def __init__(self, N_CPUs) -> None:
+        self.N_CPUs = N_CPUs
+        self.pool, self.scratch_dir, self.n_calls = None, None, 0
+
+    def __enter__(self):
+        if self.N_CPUs > 1:
+            self.scratch_dir = tempfile.mkdtemp(prefix="gravity_gom_")
+            self.pool = Pool(self.N_CPUs)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.pool, self.scratch_dir = None, None
+
+    def score(self, LocationTable, GOMDB, GOMIDList, Tasks):
+        '''Yield (Task_i, Scores) for Tasks of (GOMIdx, Digest, Rows), in the order workers finish them'''
+        self.n_calls += 1
+        save_npz(f"{self.scratch_dir}/PPHMMLocationTable.npz", LocationTable)
+        save_npz(f"{self.scratch_dir}/GOMDB.npz", csr_matrix(vstack([csr_matrix(GOMDB[GOM], dtype=float) for GOM in GOMIDList])))
+        np.save(f"{self.scratch_dir}/GOMOffsets.npy", np.cumsum([0] + [GOMDB[GOM].shape[0] for GOM in GOMIDList]))
+        yield from self.pool.imap_unordered(gom_worker, [(self.scratch_dir, self.n_calls, Task_i, *Task) for Task_i, Task in enumerate(Tasks)])
+
+'''Worker state: sparse arrays of the call being served, read from the scratch dir once per worker, not sent per task'''
+_worker_arrays = (None, None)
+
+def load_call_arrays(ScratchDir, Call):
+    global _worker_arrays
+    if _worker_arrays[0] != (ScratchDir, Call):
+        _worker_arrays = ((ScratchDir, Call), (load_npz(f"{ScratchDir}/PPHMMLocationTable.npz"),
+                                               load_npz(f"{ScratchDir}/GOMDB.npz"),
+                                               np.load(f"{ScratchDir}/GOMOffsets.npy")))
+    return _worker_arrays[1]
+
+def gom_worker(Task):
+    ScratchDir, Call, Task_i, GOMIdx, Digest, Rows = Task
+    LocationTable, GOMDBStack, GOMOffsets = load_call_arrays(ScratchDir, Call)
+    Model = get_gom_model(GOMDBStack[GOMOffsets[GOMIdx]:GOMOffsets[GOMIdx+1]], Digest)
+    return Task_i, score_gom_block(LocationTable, Model, Rows)
+
+def GOMSignatureTable_Constructor(PPHMMLocationTable, GOMDB, GOMIDList, bootstrap=0, N_CPUs=1, CandidateMask=None, GOMPool=None):
+    '''
+    Generate organisational model signature table, for annotations, graphing and description functions.
+    PPHMMLocationTable and GOMDB's matrices may be dense or sparse; both are scored as sparse. All (virus, GOM)
+    pairs are scored in tasks of one GOM x a block of viruses, on N_CPUs workers, and written into a preallocated
+    table. The workers are those of GOMPool (a GOMScoringPool) if given, else a pool started for this call. If a
+    boolean (viruses x GOMs) CandidateMask is given (see candidate_gom_mask), only its pairs are scored; the rest
+    are left as zero.
+    '''
     if bootstrap != 0:
         print(f"- (Re-)Constructing GOM Signature Table, bootstrap iteration: {bootstrap+1}")
-    N_Viruses = len(PPHMMLocationTable)
-    GOMSignatureTable = np.empty((N_Viruses, 0))
+    LocationTable = csr_matrix(PPHMMLocationTable, dtype=float)
+    LocationTable.eliminate_zeros()
+    N_Viruses, N_GOMs = LocationTable.shape[0], len(GOMIDList)
+    GOMSignatureTable = np.zeros((N_Viruses, N_GOMs))
+    if CandidateMask is None:
+        CandidateMask = np.ones((N_Viruses, N_GOMs), dtype=bool)
+    N_Pairs = int(CandidateMask.sum())
+    if N_Pairs == 0:
+        return GOMSignatureTable
+    Digests = [GOMDB.digests[GOM] if isinstance(GOMDB, SparseGOMDB) else sparse_digest(GOMDB[GOM]) for GOM in GOMIDList]
 
-    progress_msg(f"-  Spinning up {os.cpu_count()-1} workers to generate GOM signatures. This may take a while...")
-    pool = Pool(os.cpu_count()-1)
-    # pool = Pool(4) ###############################
-    with pool as p, tqdm(total=len(GOMIDList)) as pbar:
-        res = [p.apply_async(
-            generate_gom_sigs, args=(i,PPHMMLocationTable, GOMDB), callback=lambda _: pbar.update(1)) for i in GOMIDList]
-        results = [r.get() for r in res]
+    if N_CPUs <= 1:
+        for GOMIdx, GOM in enumerate(tqdm(GOMIDList)):
+            Rows = np.flatnonzero(CandidateMask[:, GOMIdx])
+            if len(Rows):
+                GOMSignatureTable[Rows, GOMIdx] = score_gom_block(LocationTable, get_gom_model(GOMDB[GOM], Digests[GOMIdx]), Rows)
+        return GOMSignatureTable
 
-    for result in results:
-        GOMSignatureTable = np.column_stack(
-            (GOMSignatureTable, result))
+    '''Split each GOM's viruses into blocks, so there are enough tasks to balance the load, even with few GOMs'''
+    BlockSize = -(-N_Pairs // (N_CPUs * 8))
+    Tasks = []
+    for GOMIdx in range(N_GOMs):
+        Rows = np.flatnonzero(CandidateMask[:, GOMIdx])
+        Tasks += [(GOMIdx, Digests[GOMIdx], Rows[BlockStart:BlockStart + BlockSize]) for BlockStart in range(0, len(Rows), BlockSize)]
 
-    return GOMSignatureTable
+    progress_msg(f"-  Scoring {N_Pairs} virus-GOM pairs ({N_Viruses} viruses, {N_GOMs} GOMs) on {N_CPUs} workers. This may take a while...")
+    with (GOMScoringPool(N_CPUs) if GOMPool is None else nullcontext(GOMPool)) as GOMPool, tqdm(total=len(Tasks)) as pbar:
+        for Task_i, Scores in GOMPool.score(LocationTable, GOMDB, GOMIDList, Tasks):
+            GOMIdx, _, Rows = Tasks[Task_i]
+            GOMSignatureTable[Rows, GOMIdx] = Scores
+            pbar.update(1)
 
-def generate_gom_sigs(GOM, PPHMMLocationTable, GOMDB):
-    GOMSignatureList = []
-    for PPHMMLocation in PPHMMLocationTable:
-        RelevantPPHMMIndices = np.where(list(map(any, list(
-            zip(list(map(any, GOMDB[GOM].transpose() != 0)), PPHMMLocation != 0)))))[0]
-        GOMSignatureList.append(dcor(
-            GOMDB[GOM][:, RelevantPPHMMIndices].T, PPHMMLocation[RelevantPPHMMIndices].reshape(-1, 1)))
-    return GOMSignatureList
+    return GOMSignatureTable
@@ -1,8 +1,147 @@
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
 
-def GOMDB_Constructor (TaxoGroupingList, PPHMMLocationTable, GOMIDList):
-	'''Generate genomic organisation model (GOM) database'''
-	GOMDb = {}
-	for id in GOMIDList:
-		GOMDb[id] = PPHMMLocationTable[TaxoGroupingList == id,:]
+from app.utils.hashing import str_digest
 
-	return GOMDb
\ No newline at end of file
+def sparse_digest(Matrix) -> str:
+	'''Digest of a sparse matrix's shape and contents, in canonical (CSR, sorted indices, no explicit zeros) form'''
+	Matrix = csr_matrix(Matrix, dtype=float)
+	Matrix.eliminate_zeros()
+	Matrix.sort_indices()
+	return str_digest(Matrix.shape, Matrix.indptr.astype(np.int64).tobytes(), Matrix.indices.astype(np.int64).tobytes(), Matrix.data.tobytes())
+
+class SparseGOMDB:
+	'''
+	Genomic organisation model (GOM) database: {GOMID: CSR matrix of its member viruses' PPHMM location vectors},
+	used as the dense dict it replaces was (GOMDB[GOMID], .keys(), .items()). Each group also holds its members'
+	keys and a digest of its matrix, so the database can be updated as reference genomes are added or removed:
+	unchanged groups keep their matrix (and digest, which GOM scoring caches per-group terms on).
+	'''
+	def __init__(self, N_PPHMMs=0) -> None:
+		self.N_PPHMMs = N_PPHMMs
+		self.groups, self.members, self.digests = {}, {}, {}
+		'''GOMIDs rebuilt by the last update'''
+		self.last_rebuilt = []
+		'''Inputs the database was last brought in line with (see RefVirusAnnotator.update_gomdb): run_state and PPHMM DB fingerprint'''
+		self.run_state, self.pphmmdb_fingerprint = None, None
+
+	def __getitem__(self, GOMID):
+		return self.groups[GOMID]
+
+	def __contains__(self, GOMID) -> bool:
+		return GOMID in self.groups
+
+	def __iter__(self):
+		return iter(self.groups)
+
+	def __len__(self) -> int:
+		return len(self.groups)
+
+	def keys(self):
+		return self.groups.keys()
+
+	def items(self):
+		return self.groups.items()
+
+	def set_group(self, GOMID, Matrix, Members, Digest=None) -> None:
+		Matrix = csr_matrix(Matrix, dtype=float)
+		Matrix.eliminate_zeros()
+		Matrix.sort_indices()
+		self.groups[GOMID], self.members[GOMID] = Matrix, list(Members)
+		self.digests[GOMID] = sparse_digest(Matrix) if Digest is None else Digest
+
+	def remove_group(self, GOMID) -> None:
+		for d in (self.groups, self.members, self.digests):
+			d.pop(GOMID, None)
+
+	def update(self, TaxoGroupingList, PPHMMLocationTable, GOMIDList, MemberKeys=None) -> list:
+		'''
+		Bring the database in line with a (new) reference set; returns the GOMIDs rebuilt. A group is kept as it is if
+		its members (by key, in order) and their location vectors are unchanged. Without MemberKeys, viruses are keyed
+		by row, so any insertion or removal before a group's members rebuilds it. A change in the number of PPHMMs
+		(e.g. a rebuilt PPHMM database) rebuilds every group.
+		'''
+		LocationTable = csr_matrix(PPHMMLocationTable, dtype=float)
+		TaxoGroupingList = np.asarray(TaxoGroupingList)
+		if MemberKeys is None:
+			MemberKeys = [str(Virus_i) for Virus_i in range(LocationTable.shape[0])]
+		if LocationTable.shape[1] != self.N_PPHMMs:
+			self.__init__(LocationTable.shape[1])
+
+		for GOMID in [GOMID for GOMID in self.groups if GOMID not in set(GOMIDList)]:
+			self.remove_group(GOMID)
+		Rebuilt = []
+		for GOMID in GOMIDList:
+			Rows = np.flatnonzero(TaxoGroupingList == GOMID)
+			Members = [MemberKeys[Row] for Row in Rows]
+			Matrix = LocationTable[Rows]
+			Digest = sparse_digest(Matrix)
+			if self.members.get(GOMID) == Members and self.digests.get(GOMID) == Digest:
+				continue
+			self.set_group(GOMID, Matrix, Members, Digest)
+			Rebuilt.append(GOMID)
+		'''Iterate in GOMIDList order, as the dense dict did'''
+		self.groups = {GOMID: self.groups[GOMID] for GOMID in GOMIDList}
+		self.last_rebuilt = Rebuilt
+		return Rebuilt
+
+	def remove_genomes(self, Keys) -> list:
+		'''Drop reference genomes (by member key) from their groups, touching only those groups; returns the GOMIDs changed'''
+		Keys, Changed = set(Keys), []
+		for GOMID, Members in list(self.members.items()):
+			Keep = [Member_i for Member_i, Member in enumerate(Members) if Member not in Keys]
+			if len(Keep) < len(Members):
+				self.set_group(GOMID, self.groups[GOMID][Keep], [Members[Member_i] for Member_i in Keep])
+				Changed.append(GOMID)
+		return Changed
+
+	def add_genomes(self, TaxoGroupingList, PPHMMLocationTable, Keys) -> list:
+		'''Append reference genomes to their groups (created if new), touching only those groups; returns the GOMIDs changed'''
+		LocationTable = csr_matrix(PPHMMLocationTable, dtype=float)
+		TaxoGroupingList, Changed = np.asarray(TaxoGroupingList), []
+		for GOMID in dict.fromkeys(TaxoGroupingList):
+			Rows = np.flatnonzero(TaxoGroupingList == GOMID)
+			Existing = self.groups.get(GOMID, csr_matrix((0, LocationTable.shape[1])))
+			self.set_group(GOMID, vstack([Existing, LocationTable[Rows]]), self.members.get(GOMID, []) + [Keys[Row] for Row in Rows])
+			Changed.append(GOMID)
+		return Changed
+
+	def apply_changes(self, TaxoGroupingList, PPHMMLocationTable, GOMIDList, MemberKeys, ChangedKeys) -> list:
+		'''
+		Bring the database in line with a new reference set that differs from the one it was built from only in the
+		genomes with ChangedKeys (e.g. from a VMR changeset): those are removed from their groups and re-added from
+		the new table, and other groups are left as they are. Members of changed groups are put in table order, so the
+		result is the same as update(). Returns the GOMIDs rebuilt.
+		'''
+		LocationTable = csr_matrix(PPHMMLocationTable, dtype=float)
+		TaxoGroupingList, GOMIDSet = np.asarray(TaxoGroupingList), set(GOMIDList)
+		Changed = set(self.remove_genomes(ChangedKeys))
+		Rows = [Row for Row, Key in enumerate(MemberKeys) if Key in ChangedKeys and TaxoGroupingList[Row] in GOMIDSet]
+		Changed |= set(self.add_genomes(TaxoGroupingList[Rows], LocationTable[Rows], [MemberKeys[Row] for Row in Rows]))
+		RowByKey = {Key: Row for Row, Key in enumerate(MemberKeys)}
+		for GOMID in Changed & GOMIDSet:
+			Order = np.argsort([RowByKey[Member] for Member in self.members[GOMID]], kind="stable")
+			self.set_group(GOMID, self.groups[GOMID][Order], [self.members[GOMID][Member_i] for Member_i in Order])
+		for GOMID in [GOMID for GOMID in self.groups if GOMID not in GOMIDSet]:
+			self.remove_group(GOMID)
+		self.groups = {GOMID: self.groups[GOMID] for GOMID in GOMIDList}
+		self.last_rebuilt = [GOMID for GOMID in GOMIDList if GOMID in Changed]
+		return self.last_rebuilt
+
+	def dense(self) -> dict:
+		'''{GOMID: dense location matrix of its members (rows of PPHMMLocationTable)}, the dict form the database replaces'''
+		return {GOMID: Matrix.toarray() for GOMID, Matrix in self.groups.items()}
+
+	@classmethod
+	def from_coo(cls, GOMDB_coo):
+		'''Rebuild from the {GOMID: coo_matrix} saved in the RefVirusAnnotator pickle (members keyed by row)'''
+		GOMDB = cls(next(iter(GOMDB_coo.values())).shape[1] if GOMDB_coo else 0)
+		for GOMID, GOM_coo in GOMDB_coo.items():
+			GOMDB.set_group(GOMID, GOM_coo, [str(Member_i) for Member_i in range(GOM_coo.shape[0])])
+		return GOMDB
+
+def GOMDB_Constructor(TaxoGroupingList, PPHMMLocationTable, GOMIDList, MemberKeys=None, PreviousGOMDB=None):
+	'''Generate genomic organisation model (GOM) database, sparse; updates PreviousGOMDB in place if given'''
+	GOMDb = SparseGOMDB() if PreviousGOMDB is None else PreviousGOMDB
+	GOMDb.update(TaxoGroupingList, PPHMMLocationTable, GOMIDList, MemberKeys)
+	return GOMDb
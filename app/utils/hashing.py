@@ -0,0 +1,37 @@
+import hashlib
+import os
+
+'''Digests already computed by this process: {(abs path, size, mtime): digest}'''
+_file_digests = {}
+
+def file_digest(fname, buf_size=1024 * 1024) -> str:
+    '''Return SHA-256 hex digest of a file's contents, read in chunks so large files don't land in memory.
+    Memoised on path, size and mtime so long-running processes don't rehash unchanged files'''
+    stat = os.stat(fname)
+    file_id = (os.path.abspath(fname), stat.st_size, stat.st_mtime_ns)
+    if file_id not in _file_digests:
+        _file_digests[file_id] = _hash_file(fname, buf_size)
+    return _file_digests[file_id]
+
+def _hash_file(fname, buf_size):
+    h = hashlib.sha256()
+    with open(fname, "rb") as f:
+        buf = f.read(buf_size)
+        while buf:
+            h.update(buf)
+            buf = f.read(buf_size)
+    return h.hexdigest()
+
+def seq_digest_part(GenomeSeq):
+    '''Sequence as str_digest part: uint8 arrays (e.g. from the sequence store) hash the same as the equivalent str/Seq'''
+    return GenomeSeq.tobytes() if hasattr(GenomeSeq, "tobytes") else str(GenomeSeq)
+
+def str_digest(*parts) -> str:
+    '''Return SHA-256 hex digest of one or more strings/bytes. Parts are delimited so ("ab","c") != ("a","bc")'''
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray, memoryview)):
+            part = str(part).encode("utf-8")
+        h.update(part)
+        h.update(b"\x00")
+    return h.hexdigest()
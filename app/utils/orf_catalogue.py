@@ -0,0 +1,94 @@
+import numpy as np
+import zipfile
+import os
+
+from app.utils.hashing import str_digest, seq_digest_part
+from app.utils.orf_identifier import find_orfs, find_orf_table, orf_table_to_records, orf_table_ids, report_orf_warnings
+
+'''Bump if find_orf_table's output changes, to invalidate old entries'''
+ORF_CATALOGUE_VERSION = 1
+
+class OrfCatalogue:
+    '''
+    Disk catalogue of each genome's ORFs, so database construction, reference annotation and Pipeline II
+    translate a given sequence once. Entries are keyed by the hash of the sequence, translation table and
+    protein length cut-off, and hold the columns of find_orf_table (protein sequences, ORF IDs without the
+    accession prefix, START offsets, warnings) as an uncompressed .npz file. Identical sequences under
+    different accessions share an entry. If catalogue_dir is None, ORFs are computed but not stored.
+    '''
+    def __init__(self, catalogue_dir, protein_length_cutoff) -> None:
+        self.catalogue_dir = catalogue_dir
+        self.protein_length_cutoff = protein_length_cutoff
+        if catalogue_dir is not None:
+            os.makedirs(catalogue_dir, exist_ok=True)
+
+    def key(self, GenBankSeq, TranslTable) -> str:
+        return str_digest(ORF_CATALOGUE_VERSION, TranslTable, self.protein_length_cutoff, seq_digest_part(GenBankSeq))
+
+    def entry_fname(self, key) -> str:
+        return f"{self.catalogue_dir}/{key[:2]}/{key}.npz"
+
+    def get_table(self, GenBankSeq, TranslTable):
+        '''Return find_orf_table output for sequence, from catalogue if present, else compute and store it'''
+        if self.catalogue_dir is None:
+            return find_orf_table(GenBankSeq, TranslTable, self.protein_length_cutoff)
+        fname = self.entry_fname(self.key(GenBankSeq, TranslTable))
+        OrfTable = self.load(fname)
+        if OrfTable is None:
+            OrfTable = find_orf_table(GenBankSeq, TranslTable, self.protein_length_cutoff)
+            if OrfTable is not None:
+                self.save(fname, OrfTable)
+        return OrfTable
+
+    def find_orfs(self, seq_id, GenBankSeq, TranslTable, call_locs = False, taxonomy_annots=[
+                "None", "None", "None", "None", "None", "None", "None"
+            ]):
+        '''Drop-in for orf_identifier.find_orfs. Return (ProtList, ProtIDList)'''
+        OrfTable = self.get_table(GenBankSeq, TranslTable)
+        if OrfTable is None:
+            '''Sequences find_orf_table can't handle go through the original implementation, uncatalogued'''
+            return find_orfs(seq_id, GenBankSeq, TranslTable, self.protein_length_cutoff, call_locs, taxonomy_annots)[:2]
+        return orf_table_to_records(seq_id, OrfTable, call_locs, taxonomy_annots)
+
+    def find_orf_seqs(self, seq_id, GenBankSeq, TranslTable, call_locs = False):
+        '''As find_orfs, without building SeqRecords. Return (ProtSeqList, ProtIDList)'''
+        OrfTable = self.get_table(GenBankSeq, TranslTable)
+        if OrfTable is None:
+            ProtList, ProtIDList = self.find_orfs(seq_id, GenBankSeq, TranslTable, call_locs)
+            return [str(Prot.seq) for Prot in ProtList], ProtIDList
+        report_orf_warnings(seq_id, OrfTable, call_locs)
+        return OrfTable["ProtSeqs"], orf_table_ids(seq_id, OrfTable, call_locs)
+
+    @staticmethod
+    def load(fname):
+        '''Return ORF table, or None on a miss or unreadable (e.g. truncated) entry'''
+        if not os.path.isfile(fname):
+            return None
+        try:
+            with np.load(fname, allow_pickle=False) as entry:
+                ProtBuffer, Offsets = entry["ProtBuffer"], entry["Offsets"]
+                return {"ProtSeqs": [ProtBuffer[Offsets[i]:Offsets[i+1]].tobytes().decode() for i in range(len(Offsets)-1)],
+                        "ORFIDs": entry["ORFIDs"].tolist(),
+                        "Starts": entry["Starts"],
+                        "Warnings": entry["Warnings"]}
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+
+    @staticmethod
+    def save(fname, OrfTable) -> None:
+        '''Proteins are stored as one byte buffer + offsets. Write to temp file and rename, so readers never see partial entries'''
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        ProtSeqs = [ProtSeq.encode() for ProtSeq in OrfTable["ProtSeqs"]]
+        tmp_fname = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp_fname, "wb") as f:
+            np.savez(f,
+                     ProtBuffer=np.frombuffer(b"".join(ProtSeqs), dtype=np.uint8),
+                     Offsets=np.concatenate(([0], np.cumsum([len(ProtSeq) for ProtSeq in ProtSeqs], dtype=np.int64))).astype(np.int64),
+                     ORFIDs=np.array(OrfTable["ORFIDs"], dtype=str),
+                     Starts=OrfTable["Starts"],
+                     Warnings=OrfTable["Warnings"])
+        os.replace(tmp_fname, fname)
+
+def get_orf_catalogue(payload, fnames) -> OrfCatalogue:
+    '''Catalogue for this run's cut-off; not persisted if user has disabled caches'''
+    return OrfCatalogue(fnames['OrfCatalogueDir'] if payload.get("UseCache", True) else None, payload['ProteinLength_Cutoff'])
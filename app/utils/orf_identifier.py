@@ -1,6 +1,4 @@
 import numpy as np
-import re
-from Bio import SeqIO, AlignIO
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 import warnings
@@ -47,9 +45,183 @@ def no_orf_match():
     return "---M------**--*----M---------------M----------------------------"
 
 
+'''Nucleotide letters handled by the vectorised ORF finder: IUPAC DNA codes, either case'''
+IUPAC_DNA = "TCAGRYSWKMBDHVN"
+'''Translated ORFs longer than this (aa) are split into consecutive pieces of this length, each named ORF{i}.{j}'''
+MAX_ORF_LENGTH = 1000000
+'''Per-genetic code lookup tables, built on first use: {TranslTable: uint8 array of amino acid letters}'''
+_codon_luts = {}
+
+def encode_seq(GenBankSeq):
+    '''Return sequence as uint8 array of ASCII codes'''
+    if isinstance(GenBankSeq, np.ndarray):
+        return GenBankSeq
+    return np.frombuffer(str(GenBankSeq).encode("ascii", errors="replace"), dtype=np.uint8)
+
+def get_encoders():
+    '''
+    Return 256-entry tables mapping ASCII to (i) TCAG codon digits for start/stop matching, case-sensitive like
+    the string comparison in find_orfs_scalar (4 == no match), (ii) IUPAC_DNA digits for translation,
+    case-insensitive like Biopython (255 == letter we can't translate), (iii) Biopython's complement
+    '''
+    if "encoders" not in _codon_luts:
+        start_stop_code = np.full(256, 4, dtype=np.uint8)
+        translation_code = np.full(256, 255, dtype=np.uint8)
+        complement = np.arange(256, dtype=np.uint8)
+        for i, base in enumerate("TCAG"):
+            start_stop_code[ord(base)] = i
+        for i, base in enumerate(IUPAC_DNA):
+            translation_code[ord(base)] = translation_code[ord(base.lower())] = i
+        letters = IUPAC_DNA + IUPAC_DNA.lower()
+        complement[np.frombuffer(letters.encode(), dtype=np.uint8)] = np.frombuffer(str(Seq(letters).complement()).encode(), dtype=np.uint8)
+        _codon_luts["encoders"] = (start_stop_code, translation_code, complement)
+    return _codon_luts["encoders"]
+
+def get_codon_lut(TranslTable):
+    '''
+    Translation lookup for every codon of IUPAC_DNA letters (the 64 unambiguous codons, plus ambiguity codes so
+    results stay identical to Biopython's, which resolves e.g. CTN -> L, TAR -> *). Index = 225*b1 + 15*b2 + b3
+    '''
+    if TranslTable not in _codon_luts:
+        codons = [b1+b2+b3 for b1 in IUPAC_DNA for b2 in IUPAC_DNA for b3 in IUPAC_DNA]
+        _codon_luts[TranslTable] = np.frombuffer(str(Seq("".join(codons)).translate(table=TranslTable)).encode(), dtype=np.uint8)
+    return _codon_luts[TranslTable]
+
 def find_orfs(seq_id, GenBankSeq, TranslTable, protein_length_cutoff, call_locs = False, taxonomy_annots=[
             "None", "None", "None", "None", "None", "None", "None"
         ]):
+    '''
+    Find ORFs in all six frames and translate those >= protein_length_cutoff. ORF = first start codon after each
+    stop (or frame start), to the next stop (or frame end). Sequence is encoded as uint8 and codons for each frame
+    are computed with array arithmetic; output is identical to find_orfs_scalar, which
+    handles sequences with letters outside IUPAC_DNA.
+    '''
+    seq = encode_seq(GenBankSeq)
+    OrfTable = find_orf_table(seq, TranslTable, protein_length_cutoff)
+    if OrfTable is None:
+        '''Non-IUPAC letters (e.g. gaps, RNA): defer to Biopython so behaviour (incl. errors) is unchanged'''
+        return find_orfs_scalar(seq_id, GenBankSeq if not isinstance(GenBankSeq, np.ndarray) else Seq(seq.tobytes().decode()), TranslTable, protein_length_cutoff, call_locs, taxonomy_annots)
+
+    '''Standard code translation of the + strand, as Seq.translate() (kept for output compatibility)'''
+    _, translation_code, _ = get_encoders()
+    raw_na = codon_lut_translate(seq[:3 * (len(seq) // 3)], translation_code, get_codon_lut(1)).tobytes().decode()
+    ProtList, ProtIDList = orf_table_to_records(seq_id, OrfTable, call_locs, taxonomy_annots)
+    return ProtList, ProtIDList, {seq_id: [raw_na, raw_na]}
+
+def find_orf_table(GenBankSeq, TranslTable, protein_length_cutoff):
+    '''
+    Sequence-only part of find_orfs (no IDs or records), so results can be stored and reused for any accession.
+    Return dict of columns: ProtSeqs, ORFIDs ("ORF{i}.{j}"), Starts (codon index of ORF's segment) and Warnings
+    ((kind, idx, x_count) rows in the order find_orfs reports them; kind 0 = mistranslated, 1 = trimmed)), or
+    None if the sequence contains letters the vectorised translation can't handle.
+    '''
+    seq = encode_seq(GenBankSeq)
+    start_stop_code, translation_code, complement = get_encoders()
+    if np.any(translation_code[seq] == 255):
+        return None
+
+    orf_tranl_table = get_orf_trasl_table()
+    try:
+        Starts = orf_tranl_table[TranslTable]
+    except KeyError:
+        '''No ORF found, use standard code'''
+        Starts = no_orf_match()
+
+    '''Start and stop codon masks, indexed by TCAG codon number; index 64 == codon containing non-TCAG letter'''
+    IsStartCodon = np.array([j == "M" for j in Starts] + [False])
+    IsStopCodon = np.array([j == "*" for j in Starts] + [False])
+    codon_lut = get_codon_lut(TranslTable)
+
+    ProtSeqList, ORFIDList, StartList, WarningList = [], [], [], []
+    SeqLength, ORF_i = len(seq), 0
+    for nuc in [seq, complement[seq][::-1]]:
+        for frame in range(3):
+            '''Split into multiple of 3, get in-frame nucleotide seq, split sequence into codons'''
+            length = 3 * ((SeqLength-frame) // 3)
+            codons = nuc[frame:(frame+length)].reshape(-1, 3)
+            n_codons = codons.shape[0]
+            ss = start_stop_code[codons].astype(np.int32)
+            CodonIdx = np.where((ss < 4).all(axis=1), ss[:, 0]*16 + ss[:, 1]*4 + ss[:, 2], 64)
+
+            '''Segments between stop codons; ORF starts at first start codon in each segment'''
+            StopCodon_indices = np.flatnonzero(IsStopCodon[CodonIdx])
+            Coding_Start_IndexList = np.concatenate(([0], StopCodon_indices + 1))
+            Coding_End_IndexList = np.concatenate((StopCodon_indices, [n_codons]))
+            StartCodon_indices = np.flatnonzero(IsStartCodon[CodonIdx])
+            FirstStart = np.searchsorted(StartCodon_indices, Coding_Start_IndexList)
+            FirstStart = np.append(StartCodon_indices, n_codons)[FirstStart]
+            HasOrf = FirstStart < Coding_End_IndexList
+            loc_list, OrfFrom, OrfTo = Coding_Start_IndexList[HasOrf], FirstStart[HasOrf], Coding_End_IndexList[HasOrf]
+
+            '''Translate frame via lookup table; count Xs per ORF from cumulative sum'''
+            AAs = codon_lut_translate(codons, translation_code, codon_lut)
+            XCumSum = np.concatenate(([0], np.cumsum(AAs == ord("X"))))
+            XCounts = XCumSum[OrfTo] - XCumSum[OrfFrom]
+
+            '''Exclude protein sequences with <'ProteinLength_Cutoff' aa (excl. Xs), before building any strings'''
+            Keep = (OrfTo - OrfFrom - XCounts) >= protein_length_cutoff
+            for idx in np.flatnonzero(Keep | (XCounts > 10)):
+                x_count = int(XCounts[idx])
+                if x_count > 10:
+                    WarningList.append((0, idx, x_count))
+                if not Keep[idx]:
+                    continue
+
+                ProtSeq = AAs[OrfFrom[idx]:OrfTo[idx]].tobytes().decode()
+                if x_count > 100:
+                    WarningList.append((1, ORF_i, x_count))
+                    ProtSeq = ProtSeq.replace("X","")
+                n = MAX_ORF_LENGTH
+                ProtSeqs = [ProtSeq[i:i + n] for i in range(0, len(ProtSeq), n)] if len(ProtSeq) > n else [ProtSeq]
+                for orf_idx, ProtSeq in enumerate(ProtSeqs):
+                    if len(ProtSeqs) > 1 and len(ProtSeq) < protein_length_cutoff:
+                        continue
+                    ProtSeqList.append(ProtSeq)
+                    ORFIDList.append(f"ORF{ORF_i}.{orf_idx}")
+                    StartList.append(loc_list[idx])
+                ORF_i += 1
+
+    return {"ProtSeqs": ProtSeqList,
+            "ORFIDs": ORFIDList,
+            "Starts": np.array(StartList, dtype=np.int64),
+            "Warnings": np.array(WarningList, dtype=np.int64).reshape(-1, 3)}
+
+def orf_table_to_records(seq_id, OrfTable, call_locs = False, taxonomy_annots=[
+            "None", "None", "None", "None", "None", "None", "None"
+        ]):
+    '''Name ORFs from find_orf_table for an accession; report its warnings. Return (ProtList, ProtIDList) as find_orfs'''
+    report_orf_warnings(seq_id, OrfTable, call_locs)
+    ProtList = [SeqRecord(Seq(ProtSeq),
+                            id=f"{seq_id}|{ORFID}",
+                            name=f"{seq_id}|{ORFID}",
+                            description="~",
+                            annotations={'taxonomy': taxonomy_annots}) for ProtSeq, ORFID in zip(OrfTable["ProtSeqs"], OrfTable["ORFIDs"])]
+    return ProtList, orf_table_ids(seq_id, OrfTable, call_locs)
+
+def orf_table_ids(seq_id, OrfTable, call_locs = False):
+    '''Protein IDs for ORFs from find_orf_table, as find_orfs names them'''
+    if call_locs:
+        return [f"{seq_id}|{ORFID}|START{Start}" for ORFID, Start in zip(OrfTable["ORFIDs"], OrfTable["Starts"])]
+    return [f"{seq_id}|{ORFID}" for ORFID in OrfTable["ORFIDs"]]
+
+def report_orf_warnings(seq_id, OrfTable, call_locs = False):
+    '''Raise the warnings find_orfs would for this accession'''
+    for kind, idx, x_count in OrfTable["Warnings"]:
+        if kind == 0 and not call_locs:
+            '''If on first call, count Xs and report to user to alert to mistranslated regions'''
+            raise_gravity_warning(f"(PPHMMDB Construction: orf_identifier()). Putative ORF {seq_id}_{idx} has {x_count} mistranslated residues.")
+        elif kind == 1:
+            raise_gravity_warning(f"TRIMMING {seq_id}|ORF{idx} OF {x_count} MISTRANSLATED RESIDUES. Recommend user checks input sequence.")
+
+def codon_lut_translate(nucs, translation_code, codon_lut):
+    '''Translate uint8 nucleotides (flat, or n x 3 codons) to uint8 amino acid letters'''
+    tc = translation_code[nucs.reshape(-1, 3)].astype(np.int32)
+    return codon_lut[tc[:, 0]*225 + tc[:, 1]*15 + tc[:, 2]]
+
+def find_orfs_scalar(seq_id, GenBankSeq, TranslTable, protein_length_cutoff, call_locs = False, taxonomy_annots=[
+            "None", "None", "None", "None", "None", "None", "None"
+        ]):
+    '''Codon-by-codon find_orfs on a Biopython Seq, for sequences find_orf_table can't encode (e.g. gaps, RNA)'''
     orf_tranl_table = get_orf_trasl_table()
     orf_no_match = no_orf_match()
     ProtList, ProtIDList, raw_nas = [], [], {}
@@ -111,7 +283,7 @@ def find_orfs(seq_id, GenBankSeq, TranslTable, protein_length_cutoff, call_locs
                     if ProtSeq.count("X") > 100:
                         raise_gravity_warning(f"TRIMMING {seq_id}|ORF{ORF_i} OF {ProtSeq.count('X')} MISTRANSLATED RESIDUES. Recommend user checks input sequence.")
                         ProtSeq = ProtSeq.replace("X","")
-                    n = 1000000 # RM < TODO WIP, subsetting of large orfs
+                    n = MAX_ORF_LENGTH
                     if len(ProtSeq) > n:
                         ProtSeqs = [ProtSeq[i:i + n] for i in range(0, len(ProtSeq), n)]
                         for orf_idx, ProtSeq in enumerate(ProtSeqs):
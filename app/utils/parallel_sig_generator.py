@@ -1,17 +1,19 @@
-from Bio import SeqIO
-from Bio.Seq import Seq
 import numpy as np
-import random, string, os
-from alive_progress import alive_it
-import time
+import shutil
+import os
 from tqdm import tqdm
 from multiprocessing import Pool
 
 from app.utils.line_count import LineCount
 from app.utils.shell_cmds import shell
 from app.utils.stdout_utils import warning_msg, progress_msg
-from app.utils.orf_identifier import find_orfs
+from app.utils.orf_catalogue import get_orf_catalogue
+from app.utils.sequence_store import get_sequence_store
 from app.utils.error_handlers import raise_gravity_error, error_handler_hmmscan
+from app.utils.pyhmmer_backend import get_pyhmmer_backend
+from app.utils.search_daemon import get_search_daemon
+from app.utils.signature_cache import SignatureCache, SignatureCheckpoint, pphmmdb_fingerprint, report_cache_hits
+from app.utils.vmr_changeset import member_key, load_genome_keys, save_genome_keys, current_run_state
 
 def PPHMMSignatureTable_Constructor(
             genomes,
@@ -20,191 +22,270 @@ def PPHMMSignatureTable_Constructor(
             GenomeSeqFile,
             HMMER_PPHMMDB,
             Pl2=False,
+            GenomeKeysFile=None,
         ):
+    '''
+    Signature engine for both pipelines: scan each genome's ORFs against a PPHMM DB to generate PPHMM signature,
+    location and naive location tables. How genomes are distributed is set by payload["SignatureExecutor"]:
+    "serial" (one genome at a time, hmmscan uses all CPUs), "pool" (one genome per worker process) or "batched"
+    (several genomes per hmmscan call per worker; best for many short query contigs).
+    With GenomeKeysFile (the VMR's genomes only), each genome's cache key is saved there, and genomes the VMR
+    changeset leaves unchanged reuse the previous run's keys rather than re-reading their sequences.
+    '''
     progress_msg("- Generating PPHMM signature table and PPHMM location table")
-    '''All Hmmer dirs are temporary, so are generated dynamically then removed'''
-    PPHMMDB_Summary = f"{fnames['HMMER_PPHMMDb']}_Summary.txt"
-    HMMER_hmmscanDir = f"{fnames['HMMERDir']}/hmmscan_{''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))}"
-    os.makedirs(HMMER_hmmscanDir)
-
-    '''Load GenBank record'''
-    GenBankDict = SeqIO.index(GenomeSeqFile, "fasta" if os.path.splitext(GenomeSeqFile)[1] in [".fas", ".fst", ".fasta"] else "gb")
-    Records_dict = {}
-    for i in GenBankDict.items():
-        ### RM < TODO: EITHER HARMONISE FUNTION CALL WITH PPHMMDB OR LOAD GB FILE
-        if "u" in str(i[1].seq).lower():
-            i[1].seq = i[1].seq.back_transcribe()
-        Records_dict[i[0].split(".")[0]] = i[1]
-    Records_dict = {k.split(".")[0]: v for k, v in Records_dict.items()}
-
+    PPHMMDB_Summary = f"{HMMER_PPHMMDB}_Summary.txt"
     N_PPHMMs = LineCount(PPHMMDB_Summary)-1
-    PPHMMSignatureTable = np.empty((0, N_PPHMMs))
-    PPHMMLocMiddleBestHitTable = np.empty((0, N_PPHMMs))
-    NaiveLocationTable = np.empty((0, N_PPHMMs))
+    DBFingerprint = pphmmdb_fingerprint(HMMER_PPHMMDB, payload, N_PPHMMs)
+
+    '''Hmmer dir is named for the DB, so it (and its checkpoint) survives a crash and is picked up on restart; removed when done'''
+    HMMER_hmmscanDir = f"{fnames['HMMERDir_UcfVirus'] if Pl2 else fnames['HMMERDir']}/hmmscan_{DBFingerprint[:10]}"
+    os.makedirs(HMMER_hmmscanDir, exist_ok=True)
+    checkpoint = SignatureCheckpoint(f"{HMMER_hmmscanDir}/checkpoint.p", N_PPHMMs)
+
+    '''Packed, memory-mapped sequences (shared with PPHMMDB construction); workers read them zero-copy'''
+    SeqStore = get_sequence_store(GenomeSeqFile, fnames)
+
+    N_Genomes = genomes["SeqIDLists"].shape[0]
+    PPHMMSignatureTable = np.zeros((N_Genomes, N_PPHMMs))
+    PPHMMLocMiddleBestHitTable = np.zeros((N_Genomes, N_PPHMMs))
+    NaiveLocationTable = np.zeros((N_Genomes, N_PPHMMs))
+
+    '''Identical sequences are only scanned once'''
+    KnownKeys = load_genome_keys(GenomeKeysFile, fnames, genomes) if GenomeKeysFile else {}
+    GenomeIdxsByKey, KeysByMember = {}, {}
+    for GenomeIdx, (SeqIDList, TranslTable) in enumerate(zip(genomes["SeqIDLists"], genomes["TranslTableList"])):
+        Member = member_key(SeqIDList)
+        key = KnownKeys[Member] if Member in KnownKeys else SignatureCache.genome_key(SeqStore.concat_genome(SeqIDList)[1], TranslTable)
+        GenomeIdxsByKey.setdefault(key, []).append(GenomeIdx)
+        KeysByMember[Member] = key
+    if KnownKeys:
+        progress_msg(f"-  {sum(Member in KnownKeys for Member in KeysByMember)}/{N_Genomes} genomes unchanged since previous run (VMR changeset)")
+
+    '''Resume from checkpoint of a previous, interrupted run, then look up remaining genomes in signature cache'''
+    cache = SignatureCache(fnames['SignatureCacheDir'], DBFingerprint, N_PPHMMs) if payload.get("UseCache", True) else None
+    ResultsByKey = checkpoint.load()
+    report_cache_hits(sum(len(GenomeIdxsByKey[key]) for key in ResultsByKey if key in GenomeIdxsByKey), N_Genomes, source="Resuming from checkpoint")
+    ScanQueue, N_CacheHits = [], 0
+    for key, GenomeIdxs in GenomeIdxsByKey.items():
+        if key in ResultsByKey:
+            continue
+        rows = cache.get(key) if cache else None
+        if rows is None:
+            ScanQueue.append(key)
+            continue
+        ResultsByKey[key] = rows
+        N_CacheHits += len(GenomeIdxs)
+    report_cache_hits(N_CacheHits, N_Genomes)
+
+    def store_results(keys, results):
+        '''Persist each genome's rows as soon as its job finishes; called in this process, never in a pool callback (a failed write there would hang the pool)'''
+        for key, result in zip(keys, results):
+            ResultsByKey[key] = result[1:]
+            checkpoint.append(key, *result[1:])
+            if cache:
+                cache.put(key, *result[1:])
+
+    '''Each job is a list of (SeqIDList, TranslTable) for genomes to be scanned together; ORFs come from the shared catalogue'''
+    orf_catalogue = get_orf_catalogue(payload, fnames)
+    executor = payload.get("SignatureExecutor", "pool")
+    BatchSize = payload.get("SignatureBatchSize", 20) if executor == "batched" else 1
+    Batches = [ScanQueue[i:i+BatchSize] for i in range(0, len(ScanQueue), BatchSize)]
+    Jobs = [[(genomes["SeqIDLists"][GenomeIdxsByKey[key][0]], genomes["TranslTableList"][GenomeIdxsByKey[key][0]]) for key in Batch] for Batch in Batches]
 
-    clf = Pphmm_Sig_Gen(payload, Records_dict, HMMER_PPHMMDB, N_PPHMMs, HMMER_hmmscanDir)
-    pool = Pool(payload["N_CPUs"])
+    if executor == "serial":
+        clf = Pphmm_Sig_Gen(payload, SeqStore, HMMER_PPHMMDB, N_PPHMMs, HMMER_hmmscanDir, orf_catalogue, hmmscan_cpus=payload["N_CPUs"])
+        for Batch, Job in zip(Batches, tqdm(Jobs)):
+            store_results(Batch, clf.generate_sigs_for_batch(Job))
+    elif executor in ["pool", "batched"]:
+        clf = Pphmm_Sig_Gen(payload, SeqStore, HMMER_PPHMMDB, N_PPHMMs, HMMER_hmmscanDir, orf_catalogue)
+        '''Hand signature generator (incl. sequences) to each worker once, rather than pickling it with every job'''
+        pool = Pool(payload["N_CPUs"], initializer=init_sig_worker, initargs=(clf,))
+        progress_msg(f"-  Spinning up {payload['N_CPUs']} workers to generate PPHMM signatures. This may take a while...")
+        with pool as p, tqdm(total=len(ScanQueue)) as pbar:
+            for Batch_i, results in p.imap_unordered(sig_worker, enumerate(Jobs)):
+                store_results(Batches[Batch_i], results)
+                pbar.update(len(Batches[Batch_i]))
+    else:
+        raise_gravity_error(f"Didn't recognise SignatureExecutor '{executor}', choose from 'serial', 'pool' or 'batched'")
 
-    progress_msg(f"-  Spinning up {payload['N_CPUs']} workers to generate PPHMM signatures. This may take a while...")
-    with pool as p, tqdm(total=genomes["SeqIDLists"].shape[0]) as pbar:
-        res = [p.apply_async( # can specify specific inputs with args in a set!
-            clf.generate_sigs_for_genome, args=(i,), callback=lambda _: pbar.update(1)) for i in genomes["SeqIDLists"]]
-        results = [r.get() for r in res]
+    for key, GenomeIdxs in GenomeIdxsByKey.items():
+        PPHMMLocMiddleBestHitTable[GenomeIdxs], NaiveLocationTable[GenomeIdxs], PPHMMSignatureTable[GenomeIdxs] = ResultsByKey[key]
 
-    for result in results:
-        # Naive.. must be updated before PPhmmloc..
-        NaiveLocationTable = np.vstack((PPHMMLocMiddleBestHitTable, result[2]))
-        PPHMMLocMiddleBestHitTable = np.vstack((PPHMMLocMiddleBestHitTable, result[1]))
-        PPHMMSignatureTable = np.vstack((PPHMMSignatureTable, result[3]))
+    if GenomeKeysFile:
+        save_genome_keys(GenomeKeysFile, current_run_state(fnames, genomes), KeysByMember)
 
     '''Delete temp HMMER dir'''
-    shell(f"rm -rf {HMMER_hmmscanDir}")
-    # RM < TODO SAVE TO PICKLE FOR HOT START
+    shutil.rmtree(HMMER_hmmscanDir, ignore_errors=True)
     return PPHMMSignatureTable, PPHMMLocMiddleBestHitTable, NaiveLocationTable
 
+'''Worker process state for pool executors'''
+_worker_sig_gen = None
+
+def init_sig_worker(clf):
+    global _worker_sig_gen
+    _worker_sig_gen = clf
+
+def sig_worker(IndexedJob):
+    Batch_i, Job = IndexedJob
+    return Batch_i, _worker_sig_gen.generate_sigs_for_batch(Job)
+
+def read_domtblout(PPHMMScanOutFile):
+    '''Domain hits from an hmmscan --domtblout file, as (TargetName, QueryName, QueryLen, HitScore, C_EValue, TargetDesc)'''
+    Hits = []
+    with open(PPHMMScanOutFile, "r") as PPHMMScanOut_txt:
+        for Line in PPHMMScanOut_txt:
+            if Line[0] == "#" or not Line.strip():
+                '''If header or blank'''
+                continue
+            Line = Line.split()
+            if len(Line) < 23:
+                '''Hits of later genomes in the batch follow, and rows are cached: never drop them silently'''
+                raise_gravity_error(f"Malformed hmmscan domain table line in {PPHMMScanOutFile} (expected at least 23 fields, got {len(Line)}): {' '.join(Line)}")
+            '''Concatenate the cluster description back'''
+            Line[22] = " ".join(Line[22:])
+            Hits.append((Line[0], Line[3], int(Line[5]), float(Line[7]), float(Line[11]), Line[22]))
+    return Hits
+
 class Pphmm_Sig_Gen:
-    def __init__(self, payload, Records_dict, HMMER_PPHMMDB, N_PPHMMs, HMMER_hmmscanDir) -> None:
+    def __init__(self, payload, SeqStore, HMMER_PPHMMDB, N_PPHMMs, HMMER_hmmscanDir, orf_catalogue, hmmscan_cpus=1) -> None:
         self.payload = payload
-        self.Records_dict = Records_dict
+        self.orf_catalogue = orf_catalogue
+        self.backend = payload.get("SignatureBackend", "hmmscan")
+        self.SeqStore = SeqStore
         self.HMMER_PPHMMDB = HMMER_PPHMMDB
         self.HMMER_hmmscanDir = HMMER_hmmscanDir
         self.N_PPHMMs = N_PPHMMs
+        self.hmmscan_cpus = hmmscan_cpus
+        '''Daemon is started (or reused) here, in the parent, so pool workers share it'''
+        self.search_daemon = get_search_daemon(HMMER_PPHMMDB, payload["N_CPUs"]) if self.backend == "daemon" else None
 
     def generate_sigs_for_genome(self, SeqIDList, TranslTable=1):
-        PPHMMQueryFile = f'{self.HMMER_hmmscanDir}/QProtSeqs_{SeqIDList[0]}.fasta'
-        PPHMMScanOutFile = f'{self.HMMER_hmmscanDir}/PPHMMScanOut_{SeqIDList[0]}.txt'
-        GenBankSeqList, GenBankIDList = [], []
-        for SeqID in SeqIDList:
-            GenBankRecord = self.Records_dict[SeqID]
-            GenBankSeqList.append(GenBankRecord.seq)
-            GenBankIDList.append(GenBankRecord.id)
-
-        '''Sort lists by sequence/segment lengths, then concat to single seq'''
-        _, GenBankSeqList, GenBankIDList = list(zip(
-            *sorted(zip(list(map(len, list(map(str, GenBankSeqList)))), GenBankSeqList, GenBankIDList), reverse=True))) # TODO WAS TRUE 17/02
-
-        if len(GenBankSeqList) > 1:
-            GenBankSeqList = sum(GenBankSeqList, Seq(""))
-            GenBankIDList = "/".join([i.split(".")[0] for i in SeqIDList])
+        return self.generate_sigs_for_batch([(SeqIDList, TranslTable)])[0]
+
+    def generate_sigs_for_batch(self, Job):
+        '''Scan ORFs of one or more genomes together. Return [(SeqIDList, FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList), ...]'''
+        OriAASeqlens, QueryNames, QuerySeqs = [], [], []
+        for GenomeIdx, (SeqIDList, TranslTable) in enumerate(Job):
+            GenBankIDList, GenBankSeqList = self.SeqStore.concat_genome(SeqIDList)
+            OriAASeqlens.append(float(len(GenBankSeqList))/3)
+
+            '''Get each orf for a genome'''
+            ProtSeqList, ProtIDList = self.orf_catalogue.find_orf_seqs(GenBankIDList, GenBankSeqList, TranslTable, call_locs=True)
+            if len(ProtSeqList) < 1:
+                raise_gravity_error(f"GRAViTy couldn't detect any reading frames in your input sequence(s) (Protein IDs {ProtIDList}; Accessions {SeqIDList}). Check that your sequences are labelled properly; some viroids can break this process if they have no detectable ORFs.")
+
+            '''Prefix each ORF with its genome's index in batch'''
+            QueryNames += [f"{GenomeIdx}|{ProtID}" for ProtID in ProtIDList]
+            QuerySeqs += ProtSeqList
+
+        if self.backend == "pyhmmer":
+            Hits = get_pyhmmer_backend(self.HMMER_PPHMMDB).scan(QueryNames, QuerySeqs, self.payload['HMMER_C_EValue_Cutoff'], cpus=self.hmmscan_cpus)
+        elif self.backend == "daemon":
+            Hits = self.search_daemon.scan(QueryNames, QuerySeqs, self.payload['HMMER_C_EValue_Cutoff'])
         else:
-            GenBankSeqList = GenBankSeqList[0]
-            GenBankIDList = GenBankIDList[0]
+            Hits = self.run_hmmscan(QueryNames, QuerySeqs, f"{Job[0][0][0]}")
 
-        '''Get each orf for a genome'''
-        ProtList, ProtIDList = [], []
-        prot, prot_id, _ = find_orfs(GenBankIDList, GenBankSeqList, TranslTable, self.payload['ProteinLength_Cutoff'], call_locs=True)
-        ProtList += prot
-        ProtIDList += prot_id
+        '''Hits for each query are contiguous, so group by genome without reordering'''
+        HitsByGenome = [[] for _ in Job]
+        for Hit in Hits:
+            HitsByGenome[int(Hit[1].split('|')[0])].append(Hit)
 
-        if len(ProtList) < 1:
-            raise_gravity_error(f"GRAViTy couldn't detect any reading frames in your input sequence(s) (Protein IDs {ProtIDList}; Accessions {SeqIDList}). Check that your sequences are labelled properly; some viroids can break this process if they have no detectable ORFs.")
+        return [(SeqIDList,) + self.hits_to_sig_rows(GenomeHits, OriAASeqlen) for (SeqIDList, _), GenomeHits, OriAASeqlen in zip(Job, HitsByGenome, OriAASeqlens)]
 
-        # BEFORE TODO
+    def run_hmmscan(self, QueryNames, QuerySeqs, JobID):
+        '''Scan queries with HMMER CLI. Return domain hits as (TargetName, QueryName, QueryLen, HitScore, C_EValue, TargetDesc)'''
+        PPHMMQueryFile = f'{self.HMMER_hmmscanDir}/QProtSeqs_{JobID}.fasta'
+        PPHMMScanOutFile = f'{self.HMMER_hmmscanDir}/PPHMMScanOut_{JobID}.txt'
         with open(PPHMMQueryFile, "w") as f:
             '''Write each translated ORF to the PPHMM Query File'''
-            for i in range(len(ProtIDList)):
-                f.write(f">{ProtIDList[i]}\n{str(ProtList[i].seq)}\n")
+            for QueryName, QuerySeq in zip(QueryNames, QuerySeqs):
+                f.write(f">{QueryName}\n{QuerySeq}\n")
 
-        out = shell(f"hmmscan --cpu 1 -E {self.payload['HMMER_C_EValue_Cutoff']} --noali --nobias --domtblout {PPHMMScanOutFile} {self.HMMER_PPHMMDB} {PPHMMQueryFile}",
+        out = shell(f"hmmscan --cpu {self.hmmscan_cpus} -E {self.payload['HMMER_C_EValue_Cutoff']} --noali --nobias --domtblout {PPHMMScanOutFile} {self.HMMER_PPHMMDB} {PPHMMQueryFile}",
                     ret_output=True)
-        error_handler_hmmscan(out, "hmmscan (PPHMM signature table constructor, PphmmSignatureTable_Constructor_DEPRECATED())")
+        error_handler_hmmscan(out, "hmmscan (PPHMM signature table constructor, Pphmm_Sig_Gen.run_hmmscan())")
 
+        return read_domtblout(PPHMMScanOutFile)
+
+    def hits_to_sig_rows(self, Hits, OriAASeqlen):
+        '''Reduce a genome's domain hits to its PPHMM location, naive location and signature rows'''
         PPHMMIDList, PPHMMScoreList, FeatureFrameBestHitList, FeatureLocFromBestHitList, \
             FeatureLocToBestHitList, FeatureDescList = [], [], [], [], [], []
-        with open(PPHMMScanOutFile, "r") as PPHMMScanOut_txt:
-            for Line in PPHMMScanOut_txt:
-                if Line[0] == "#":
-                    '''If header'''
-                    continue
-                Line = Line.split()
-                '''Concatenate the cluster description back'''
-                try:
-                    Line[22] = " ".join(Line[22:])
-                except:
-                    break # TODO TEST - sometimes the line is only half formed. Not sure why, possibly if no matches?
-                Line = Line[:23]
-                C_EValue = float(Line[11])
-                HitScore = float(Line[7])
-                OriAASeqlen = float(len(GenBankSeqList))/3
-
-                if HitScore <= self.payload['HMMER_HitScore_Cutoff']:
-                    '''Threshold at user-set values'''
-                    continue
-
-                '''Determine the frame and the location of the hit'''
-                iden = int(Line[0].split('_')[-1])
-                HitFrom = int(Line[3].split('|')[-1].replace("START",""))
-                HitTo = HitFrom + int(Line[5])
-                HitMid = float(HitFrom+HitTo)/2
-                Frame = int(np.ceil(HitMid/OriAASeqlen)) if np.ceil(HitMid/OriAASeqlen) <= 3 else int(-(np.ceil(HitMid/OriAASeqlen)-3))
-                LocFrom = int(HitFrom % OriAASeqlen)
-
-                if LocFrom == 0:
-                    '''if the hit occurs preciously from the end of the sequence'''
-                    LocFrom = int(OriAASeqlen)
-                LocTo = int(HitTo % OriAASeqlen)
-
-                if LocTo == 0:
-                    '''if the hit occurs preciously to the end of the sequence'''
-                    LocTo = int(OriAASeqlen)
+        for TargetName, QueryName, QueryLen, HitScore, C_EValue, TargetDesc in Hits:
+            if HitScore <= self.payload['HMMER_HitScore_Cutoff']:
+                '''Threshold at user-set values'''
+                continue
+
+            '''Determine the frame and the location of the hit'''
+            iden = int(TargetName.split('_')[-1])
+            HitFrom = int(QueryName.split('|')[-1].replace("START",""))
+            HitTo = HitFrom + QueryLen
+            HitMid = float(HitFrom+HitTo)/2
+            Frame = int(np.ceil(HitMid/OriAASeqlen)) if np.ceil(HitMid/OriAASeqlen) <= 3 else int(-(np.ceil(HitMid/OriAASeqlen)-3))
+            LocFrom = int(HitFrom % OriAASeqlen)
+
+            if LocFrom == 0:
+                '''if the hit occurs preciously from the end of the sequence'''
+                LocFrom = int(OriAASeqlen)
+            LocTo = int(HitTo % OriAASeqlen)
 
-                if LocTo < LocFrom:
-                    '''The hit (falsely) spans across sequences of different frames'''
-                    if np.ceil(HitFrom/OriAASeqlen) <= 3:
-                        HitFrom_Frame = int(
-                            np.ceil(HitFrom/OriAASeqlen))
-                    else:
-                        HitFrom_Frame = int(
-                            -(np.ceil(HitFrom/OriAASeqlen)-3))
-
-                    if np.ceil(HitTo/OriAASeqlen) <= 3:
-                        HitTo_Frame = int(
-                            np.ceil(HitTo/OriAASeqlen))
-                    else:
-                        HitTo_Frame = int(-(np.ceil(HitTo/OriAASeqlen)-3))
-
-                    if Frame == HitFrom_Frame:
-                        LocTo = int(OriAASeqlen)
-                    elif Frame == HitTo_Frame:
-                        LocFrom = int(1)
-                    elif HitFrom_Frame != Frame and Frame != HitTo_Frame:
-                        LocFrom = int(1)
-                        LocTo = int(OriAASeqlen)
-                    else:
-                        warning_msg(
-                            "Something is wrong with this PPHMMDB hit location determination")
-
-                if iden not in PPHMMIDList:
-                    Best_C_EValue = C_EValue
-                    PPHMMIDList.append(iden)
-                    PPHMMScoreList.append(HitScore)
-                    FeatureDescList.append(Line[22].split('|')[0])
-                    FeatureFrameBestHitList.append(Frame)
-                    FeatureLocFromBestHitList.append(LocFrom*3)
-                    FeatureLocToBestHitList.append(LocTo*3)
-
-                elif iden in PPHMMIDList and C_EValue < Best_C_EValue:
-                    '''Not new hit but score better than last'''
-                    Best_C_EValue = C_EValue
-                    FeatureFrameBestHitList[-1] = Frame
-                    FeatureLocFromBestHitList[-1] = LocFrom*3
-                    FeatureLocToBestHitList[-1] = LocTo*3
+            if LocTo == 0:
+                '''if the hit occurs preciously to the end of the sequence'''
+                LocTo = int(OriAASeqlen)
 
+            if LocTo < LocFrom:
+                '''The hit (falsely) spans across sequences of different frames'''
+                if np.ceil(HitFrom/OriAASeqlen) <= 3:
+                    HitFrom_Frame = int(
+                        np.ceil(HitFrom/OriAASeqlen))
                 else:
-                    '''Not new hit and score not as good as last'''
-                    continue
-
-            '''Absolute coordinate with orientation info encoded into it: +ve if the gene is present on the (+)strand, otherwise -ve'''
-            NaiveLocationList = np.zeros(self.N_PPHMMs)
-            NaiveLocationList[PPHMMIDList] = np.mean(np.array([FeatureLocFromBestHitList, FeatureLocToBestHitList]), axis=0)
-            FeatureLocMiddleBestHitList = np.zeros(self.N_PPHMMs)
-            FeatureLocMiddleBestHitList[PPHMMIDList] = np.mean(np.array([FeatureLocFromBestHitList, FeatureLocToBestHitList]), axis=0)*(
-                np.array(FeatureFrameBestHitList)/abs(np.array(FeatureFrameBestHitList)))
-            FeatureValueList = np.zeros(self.N_PPHMMs)
-            FeatureValueList[PPHMMIDList] = PPHMMScoreList
-
-        return (SeqIDList, FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList)
-        #            0              1                           2               3
-        # NaiveLocationTable = np.vstack((PPHMMLocMiddleBestHitTable, result[2]))
-        # PPHMMLocMiddleBestHitTable = np.vstack((PPHMMLocMiddleBestHitTable, result[1]))
-        # PPHMMSignatureTable = np.vstack((PPHMMSignatureTable, result[3]))
+                    HitFrom_Frame = int(
+                        -(np.ceil(HitFrom/OriAASeqlen)-3))
+
+                if np.ceil(HitTo/OriAASeqlen) <= 3:
+                    HitTo_Frame = int(
+                        np.ceil(HitTo/OriAASeqlen))
+                else:
+                    HitTo_Frame = int(-(np.ceil(HitTo/OriAASeqlen)-3))
+
+                if Frame == HitFrom_Frame:
+                    LocTo = int(OriAASeqlen)
+                elif Frame == HitTo_Frame:
+                    LocFrom = int(1)
+                elif HitFrom_Frame != Frame and Frame != HitTo_Frame:
+                    LocFrom = int(1)
+                    LocTo = int(OriAASeqlen)
+                else:
+                    warning_msg(
+                        "Something is wrong with this PPHMMDB hit location determination")
+
+            if iden not in PPHMMIDList:
+                Best_C_EValue = C_EValue
+                PPHMMIDList.append(iden)
+                PPHMMScoreList.append(HitScore)
+                FeatureDescList.append(TargetDesc.split('|')[0])
+                FeatureFrameBestHitList.append(Frame)
+                FeatureLocFromBestHitList.append(LocFrom*3)
+                FeatureLocToBestHitList.append(LocTo*3)
+
+            elif iden in PPHMMIDList and C_EValue < Best_C_EValue:
+                '''Not new hit but score better than last'''
+                Best_C_EValue = C_EValue
+                FeatureFrameBestHitList[-1] = Frame
+                FeatureLocFromBestHitList[-1] = LocFrom*3
+                FeatureLocToBestHitList[-1] = LocTo*3
+
+            else:
+                '''Not new hit and score not as good as last'''
+                continue
+
+        '''Absolute coordinate with orientation info encoded into it: +ve if the gene is present on the (+)strand, otherwise -ve'''
+        NaiveLocationList = np.zeros(self.N_PPHMMs)
+        NaiveLocationList[PPHMMIDList] = np.mean(np.array([FeatureLocFromBestHitList, FeatureLocToBestHitList]), axis=0)
+        FeatureLocMiddleBestHitList = np.zeros(self.N_PPHMMs)
+        FeatureLocMiddleBestHitList[PPHMMIDList] = np.mean(np.array([FeatureLocFromBestHitList, FeatureLocToBestHitList]), axis=0)*(
+            np.array(FeatureFrameBestHitList)/abs(np.array(FeatureFrameBestHitList)))
+        FeatureValueList = np.zeros(self.N_PPHMMs)
+        FeatureValueList[PPHMMIDList] = PPHMMScoreList
+
+        return (FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList)
@@ -1,7 +1,10 @@
 from Bio import SeqIO
 import pandas as pd
+import csv
 import re
 
+from app.utils.compressed_io import open_text
+
 def get_vmr_cols():
     return ["Unnamed: 0", "Sort", "Realm", "Subrealm", "Kingdom", "Subkingdom",
             "Phylum", "Subphylum", "Class", "Subclass", "Order", "Suborder", "Family",
@@ -10,45 +13,50 @@ def get_vmr_cols():
             "Virus GENBANK accession", "Genome coverage", "Genome composition", "Host source",
             "Baltimore Group", "Genetic code table", "Taxonomic grouping"]
 
-def fasta_to_genbank(payload):
-    '''Convert FASTA-style base sequences into genbank files, generate VMR-like object'''
-    '''Parse input, prepare data structures'''
-    input_handle = open(
-        f"{payload['fasta_fname']}", "r")
-    output_handle = open(
-        f"{payload['genbank_fname']}", "w")
-    raw_seqs = SeqIO.parse(input_handle, "fasta")
-    sequences = list(raw_seqs)
-    seq_names, seq_codes, output_seqs, seq_description = [], [], [], []
+class VmrStubWriter:
+    '''Write VMR-like csv rows one at a time, formatted exactly as DataFrame(columns=get_vmr_cols()).to_csv() would'''
+    def __init__(self, handle) -> None:
+        self.cols = get_vmr_cols()
+        self.writer = csv.writer(handle, lineterminator="\n")
+        self.writer.writerow([""] + self.cols)
+        self.n_rows = 0
 
-    for i in range(len(sequences)):
-        '''Annotate each sequence and create VMR entries'''
-        # RM < TODO Remove accession IDs from names?
-        sequences[i].annotations['molecule_type'] = 'DNA'
-        if not sequences[i].id in seq_codes:
-            '''Don't process duplicate Acc IDs - omit all but first'''
-            sequences[i].id = sequences[i].name = sequences[i].description = f"Query_{i+1}_{sequences[i].id.split('.')[0]}" # Get rid of ".x" in acc ids
-            output_seqs.append(sequences[i])
-            seq_codes.append(sequences[i].id)
-            seq_names.append(sequences[i].id)
-            seq_description.append(re.sub(" +", " ", sequences[i].description.replace(sequences[i].id, "").replace(",","").strip()))
-        else:
-            print(f"WARNING: I detected an entry in your FASTA file that has a duplicate accession ID: {sequences[id].id}\n GRAViTy has only kept the first entry!")
+    def write_row(self, accession, name, description, code_table=1) -> None:
+        row = dict.fromkeys(self.cols, "")
+        row["Virus GENBANK accession"], row["Virus name(s)"] = accession, name
+        row["Genetic code table"], row["Virus isolate designation"] = code_table, description
+        self.writer.writerow([self.n_rows] + [row[col] for col in self.cols])
+        self.n_rows += 1
 
-    '''Write genbank'''
-    _ = SeqIO.write(output_seqs, output_handle, "genbank")
-    output_handle.close()
-    input_handle.close()
+def fasta_to_genbank(payload):
+    '''
+    Convert FASTA-style base sequences into genbank files, generate VMR-like object. Records are streamed: each is
+    written to the genbank file and its VMR row to the csv as it's read, so memory doesn't grow with the input.
+    Input may be gzip/bgzf compressed.
+    '''
+    seen_ids = set()
+    n_converted = 0
+    with open_text(payload['fasta_fname']) as input_handle, \
+            open(payload['genbank_fname'], "w") as output_handle, \
+            open(payload['vmr_fname'], "w", newline="") as vmr_handle:
+        vmr_writer = VmrStubWriter(vmr_handle)
+        for i, sequence in enumerate(SeqIO.parse(input_handle, "fasta")):
+            '''Annotate each sequence and create VMR entries'''
+            # RM < TODO Remove accession IDs from names?
+            if sequence.id in seen_ids:
+                '''Don't process duplicate Acc IDs - omit all but first'''
+                print(f"WARNING: I detected an entry in your FASTA file that has a duplicate accession ID: {sequence.id}\n GRAViTy has only kept the first entry!")
+                continue
+            seen_ids.add(sequence.id)
+            sequence.annotations['molecule_type'] = 'DNA'
+            sequence.id = sequence.name = sequence.description = f"Query_{i+1}_{sequence.id.split('.')[0]}" # Get rid of ".x" in acc ids
+            SeqIO.write(sequence, output_handle, "genbank")
+            vmr_writer.write_row(accession=sequence.id, name=sequence.id,
+                                 description=re.sub(" +", " ", sequence.description.replace(sequence.id, "").replace(",","").strip()))
+            n_converted += 1
 
-    '''Build VMR-like csv'''
-    df = pd.DataFrame(columns=get_vmr_cols())
-    df["Virus GENBANK accession"] = seq_codes
-    df["Virus name(s)"] = seq_names
-    df["Genetic code table"] = 1
-    df["Virus isolate designation"] = seq_description
-    df.to_csv(f"{payload['vmr_fname']}")
-    print(f"Successfully converted {df.shape[0]} records")
-    return f"Successfully converted {df.shape[0]} records"
+    print(f"Successfully converted {n_converted} records")
+    return f"Successfully converted {n_converted} records"
 
 def combine_segments(payload):
     input_handle = open(
@@ -0,0 +1,59 @@
+import numpy as np
+
+class ProteinCatalogue:
+    '''
+    Columnar store of the proteins extracted from a set of genomes, replacing lists of SeqRecords. Sequences are
+    concatenated into one byte buffer with row offsets; each protein carries an integer genome index in place of
+    its own copy of the genome's taxonomy list; protein IDs are hashed to rows for O(1) lookup.
+    '''
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.offsets = [0]
+        self.ids, self.descs, self.genome_idxs = [], [], []
+        self.taxonomy = []
+        self.row_by_id = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_genome(self, taxonomy_annots, ProtIDList, ProtSeqList, ProtDescList) -> int:
+        '''Append a genome's proteins; return the genome's index'''
+        GenomeIdx = len(self.taxonomy)
+        self.taxonomy.append(taxonomy_annots)
+        for ProtID, ProtSeq, ProtDesc in zip(ProtIDList, ProtSeqList, ProtDescList):
+            '''First occurrence wins for duplicate IDs, as with a search of the ID list'''
+            self.row_by_id.setdefault(ProtID, len(self.ids))
+            self.buffer += ProtSeq.encode()
+            self.offsets.append(len(self.buffer))
+            self.ids.append(ProtID)
+            self.descs.append(ProtDesc)
+            self.genome_idxs.append(GenomeIdx)
+        return GenomeIdx
+
+    def row(self, ProtID) -> int:
+        return self.row_by_id[ProtID]
+
+    def seq(self, row) -> str:
+        return self.buffer[self.offsets[row]:self.offsets[row+1]].decode()
+
+    def taxonomy_of(self, row) -> list:
+        return self.taxonomy[self.genome_idxs[row]]
+
+    def id_array(self):
+        return np.array(self.ids)
+
+    def fasta_record(self, row, wrap=60) -> str:
+        '''Row as FASTA text, formatted exactly as SeqIO.write(..., "fasta") formats a SeqRecord'''
+        ProtID, ProtDesc, ProtSeq = self.ids[row], self.descs[row], self.seq(row)
+        if ProtDesc and ProtDesc.split(None, 1)[0] == ProtID:
+            title = ProtDesc
+        elif ProtDesc:
+            title = f"{ProtID} {ProtDesc}"
+        else:
+            title = ProtID
+        return f">{title}\n" + "".join(f"{ProtSeq[i:i+wrap]}\n" for i in range(0, len(ProtSeq), wrap))
+
+    def write_fasta(self, handle, rows=None) -> None:
+        '''Write all (or selected) rows to an open file handle'''
+        for row in range(len(self)) if rows is None else rows:
+            handle.write(self.fasta_record(row))
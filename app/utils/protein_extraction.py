@@ -0,0 +1,78 @@
+from multiprocessing import Pool
+import contextlib
+import io
+
+from app.utils.error_handlers import raise_gravity_warning
+
+def extract_proteins_for_genome(SeqIDList, TranslTable, GenBankDict, SeqStore, orf_catalogue, payload):
+    '''Extract (or predict) protein sequences for each of a genome's segments. Return (ProtIDList, ProtSeqList, ProtDescList)'''
+    ProtIDList, ProtSeqList, ProtDescList = [], [], []
+    for SeqID in SeqIDList:
+        GenBankID = SeqStore.seq_name(SeqID)
+
+        allow_genbank_annotations = False # RM < TODO PARAMETERISE
+        ContainProtAnnotation = False
+        if allow_genbank_annotations:
+            '''Extract protein sequences; only here is the full record (with features) read'''
+            GenBankFeatures = GenBankDict[SeqID].features
+            for Feature in GenBankFeatures:
+                if(Feature.type == 'CDS' and "protein_id" in Feature.qualifiers and "translation" in Feature.qualifiers):
+                    ContainProtAnnotation = True
+                    try: # TODO Triple exception makes me sad
+                        ProtName = Feature.qualifiers["product"][0]
+                    except KeyError:
+                        try:
+                            ProtName = Feature.qualifiers["gene"][0]
+                        except KeyError:
+                            try:
+                                ProtName = Feature.qualifiers["note"][0]
+                            except KeyError:
+                                ProtName = "Hypothetical protein"
+                    ProtID = Feature.qualifiers["protein_id"][0]
+                    ProtSeq = Feature.qualifiers["translation"][0]
+                    if len(ProtSeq) >= payload['ProteinLength_Cutoff']:
+                        ProtIDList.append(f"{GenBankID}|{ProtID}")
+                        ProtSeqList.append(ProtSeq)
+                        ProtDescList.append(ProtName)
+
+        '''If the genome isn't annotated with any ORFs, find some'''
+        if not ContainProtAnnotation:
+            prot_seqs, prot_ids = orf_catalogue.find_orf_seqs(GenBankID, SeqStore.seq(SeqID), TranslTable)
+            if len(prot_seqs) == 0:
+                raise_gravity_warning(f"Sequence {SeqID} doesn't code for any ORFs!")
+            ProtIDList += prot_ids
+            ProtSeqList += prot_seqs
+            ProtDescList += ["~"] * len(prot_ids)
+    return ProtIDList, ProtSeqList, ProtDescList
+
+'''Worker process state: (GenBankDict, SeqStore, orf_catalogue, payload), handed over once per worker'''
+_worker_state = None
+
+def init_extraction_worker(GenBankDict, SeqStore, orf_catalogue, payload):
+    global _worker_state
+    _worker_state = (GenBankDict, SeqStore, orf_catalogue, payload)
+
+def extraction_worker(Job):
+    '''Capture warnings so the parent can print them in genome order, as a serial run would'''
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        Proteins = extract_proteins_for_genome(*Job, *_worker_state)
+    return Proteins, stdout.getvalue()
+
+def extract_proteins(Jobs, GenBankDict, SeqStore, orf_catalogue, payload):
+    '''
+    Generator over (ProtIDList, ProtSeqList, ProtDescList) per genome, in input order. Jobs = [(SeqIDList, TranslTable), ...].
+    With N_CPUs > 1 genomes are split across a process pool; results (and warnings) are yielded in the same order
+    as a serial run, so anything written from them is identical.
+    '''
+    if payload["N_CPUs"] <= 1:
+        for Job in Jobs:
+            yield extract_proteins_for_genome(*Job, GenBankDict, SeqStore, orf_catalogue, payload)
+        return
+
+    ChunkSize = max(1, min(64, len(Jobs) // (payload["N_CPUs"] * 8)))
+    with Pool(payload["N_CPUs"], initializer=init_extraction_worker, initargs=(GenBankDict, SeqStore, orf_catalogue, payload)) as p:
+        for Proteins, stdout in p.imap(extraction_worker, Jobs, chunksize=ChunkSize):
+            if stdout:
+                print(stdout, end="")
+            yield Proteins
@@ -0,0 +1,51 @@
+import os
+
+from app.utils.error_handlers import raise_gravity_error
+from app.utils.stdout_utils import progress_msg
+
+try:
+    import pyhmmer
+except ImportError:
+    pyhmmer = None
+
+'''Loaded PPHMM DBs, kept for the lifetime of the process: {(db path, mtime): PyhmmerBackend}'''
+_loaded_dbs = {}
+
+def get_pyhmmer_backend(HMMER_PPHMMDB):
+    '''Return in-memory backend for DB, loading it on first use (or if the DB file has been rebuilt since)'''
+    if pyhmmer is None:
+        raise_gravity_error(f"SignatureBackend 'pyhmmer' requires the pyhmmer package (HMMER's Python bindings). Install it with `pip install pyhmmer`, or use SignatureBackend = 'hmmscan'.")
+    db_id = (os.path.abspath(HMMER_PPHMMDB), os.path.getmtime(HMMER_PPHMMDB))
+    if db_id not in _loaded_dbs:
+        for stale_id in [i for i in _loaded_dbs if i[0] == db_id[0]]:
+            del _loaded_dbs[stale_id]
+        _loaded_dbs[db_id] = PyhmmerBackend(HMMER_PPHMMDB)
+    return _loaded_dbs[db_id]
+
+class PyhmmerBackend:
+    '''
+    Score ORFs against a PPHMM DB in-process, equivalent to `hmmscan -E {cutoff} --noali --nobias --domtblout`.
+    Profiles are loaded once (optimised, if the DB has been pressed), and there are no temp files or subprocesses.
+    '''
+    def __init__(self, HMMER_PPHMMDB) -> None:
+        progress_msg(f"-  Loading PPHMM DB {HMMER_PPHMMDB} into memory")
+        self.alphabet = pyhmmer.easel.Alphabet.amino()
+        with pyhmmer.plan7.HMMFile(HMMER_PPHMMDB) as hmm_file:
+            self.profiles = list(hmm_file.optimized_profiles()) if hmm_file.is_pressed() else list(hmm_file)
+
+    def scan(self, QueryNames, QuerySeqs, C_EValue_Cutoff, cpus=1):
+        '''Return domain hits as (TargetName, QueryName, QueryLen, HitScore, C_EValue, TargetDesc), in domtblout order'''
+        queries = [pyhmmer.easel.TextSequence(name=name.encode(), sequence=seq).digitize(self.alphabet)
+                   for name, seq in zip(QueryNames, QuerySeqs)]
+        Hits = []
+        for QueryName, QuerySeq, TopHits in zip(QueryNames, QuerySeqs, pyhmmer.hmmer.hmmscan(queries, self.profiles, cpus=cpus, E=C_EValue_Cutoff, bias_filter=False)):
+            for hit in TopHits.reported:
+                for domain in hit.domains.reported:
+                    '''Round as hmmscan prints to domtblout (%.1f, %.2g), so signatures match the CLI backend exactly'''
+                    Hits.append((decode(hit.name), QueryName, len(QuerySeq), float(f"{hit.score:.1f}"),
+                                 float(f"{domain.c_evalue:.2g}"), decode(hit.description) or "-"))
+        return Hits
+
+def decode(s):
+    '''pyhmmer < 0.11 returns names as bytes'''
+    return s.decode() if isinstance(s, bytes) else s
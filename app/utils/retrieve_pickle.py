@@ -1,11 +1,20 @@
 import pickle
+import os
 
 from app.utils.error_handlers import raise_gravity_error
+from app.utils.vmr_snapshot import load_vmr_snapshot
 
-def retrieve_genome_vars(read_desc_table_p) -> dict:
-    '''Read pickle file to dict containing VMR data'''
-    f = pickle.load(open(read_desc_table_p, "rb"))
-    if len(f["VirusNameList"]) == 0:
+def retrieve_genome_vars(read_desc_table_p, columns=None) -> dict:
+    '''Read pickle file to dict containing VMR data. If columns are given, read only those, from the columnar copy
+    saved alongside the pickle where one exists'''
+    parquet_fname = f"{os.path.splitext(read_desc_table_p)[0]}.parquet"
+    if columns is not None and os.path.isfile(parquet_fname):
+        f = load_vmr_snapshot(parquet_fname, columns=columns)[0]
+    else:
+        f = pickle.load(open(read_desc_table_p, "rb"))
+        if columns is not None:
+            f = {col: f[col] for col in columns}
+    if len(f[columns[0] if columns is not None else "VirusNameList"]) == 0:
         raise_gravity_error("The list of processed genomes I retrieved is empty!\nThis usually results from errors reading the VMR or you're working with incomplete genomes with AnnotateIncompleteGenomes=false (set to true).")
     return f
 
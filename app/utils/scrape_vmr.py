@@ -96,15 +96,16 @@ class Scraper:
         return self.save_dir
 
 
-def construct_first_pass_set(row, df, threshold) -> pd.Series:
-    '''Construct first-pass grouping; ensure diversity is maintained in representative examples'''
-    if df[df["Family"] == row["Family"]].shape[0] >= threshold:
-        return row["Family"]
-    else:
-        if df[df["Genus"] == row["Genus"]].shape[0] >= threshold:
-            return row["Genus"]
-        else:
-            return row["Species"]
+def construct_first_pass_groupings(df, threshold) -> pd.Series:
+    '''
+    Construct first-pass grouping for every row at once; ensure diversity is maintained in representative examples.
+    A row is grouped by its family if the family has >= threshold members, else by its genus if that does, else
+    by its species. Member counts come from one value_counts per rank; missing family/genus counts as 0 members.
+    '''
+    family_size = df["Family"].map(df["Family"].value_counts()).fillna(0)
+    genus_size = df["Genus"].map(df["Genus"].value_counts()).fillna(0)
+    return df["Family"].where(family_size >= threshold,
+                              df["Genus"].where(genus_size >= threshold, df["Species"]))
 
 
 @timing
@@ -123,8 +124,7 @@ def scrape(payload) -> str:
 def first_pass_baltimore_filter(payload) -> str:
     try:
         df = pd.read_csv(f"{payload['save_path']}/{payload['vmr_name']}")
-        df["Taxonomic grouping"] = df.apply(
-            lambda x: construct_first_pass_set(x, df, payload["filter_threshold"]), axis=1)
+        df["Taxonomic grouping"] = construct_first_pass_groupings(df, payload["filter_threshold"])
         df = df.drop_duplicates(subset="Taxonomic grouping", keep="first")
 
         if payload["baltimore_filter"] == "RNA":
@@ -146,9 +146,8 @@ def first_pass_baltimore_filter(payload) -> str:
 def first_pass_taxon_filter(payload) -> str:
     try:
         df = pd.read_csv(f"{payload['vmr_name']}")
-        df = df[df[payload['filter_level']] == payload["filter_name"]]
-        df["Taxonomic grouping"] = df.apply(
-            lambda x: construct_first_pass_set(x, df, payload["filter_threshold"]), axis=1)
+        df = df[df[payload['filter_level']] == payload["filter_name"]].copy()
+        df["Taxonomic grouping"] = construct_first_pass_groupings(df, payload["filter_threshold"])
         df = df.drop_duplicates(subset="Taxonomic grouping", keep="first")
         df.to_csv(f"{payload['save_path']}/{payload['save_name']}")
         return f"Success! VMR saved to ./{payload['save_path']}"
@@ -0,0 +1,98 @@
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client
+import tempfile
+import atexit
+import os
+
+from app.utils.hashing import file_digest
+from app.utils.error_handlers import raise_gravity_error
+from app.utils.stdout_utils import progress_msg
+from app.utils.pyhmmer_backend import get_pyhmmer_backend, pyhmmer
+
+'''Running daemons, kept for the lifetime of the (API) process: {abs DB path: SearchDaemon}'''
+_daemons = {}
+
+def get_search_daemon(HMMER_PPHMMDB, cpus=1):
+    '''Return client for a search daemon holding DB in memory. Start one on first use, or restart if the DB has changed'''
+    if pyhmmer is None:
+        raise_gravity_error(f"SignatureBackend 'daemon' requires the pyhmmer package (HMMER's Python bindings). Install it with `pip install pyhmmer`, or use SignatureBackend = 'hmmscan'.")
+    db_path = os.path.abspath(HMMER_PPHMMDB)
+    db_fingerprint = file_digest(db_path)
+    daemon = _daemons.get(db_path)
+    if daemon is not None and (daemon.db_fingerprint != db_fingerprint or not daemon.is_alive()):
+        progress_msg(f"-  PPHMM DB {HMMER_PPHMMDB} has changed (or its search daemon died), restarting search daemon")
+        daemon.stop()
+        daemon = None
+    if daemon is None:
+        daemon = SearchDaemon(db_path, db_fingerprint, cpus)
+        _daemons[db_path] = daemon
+    return daemon.client
+
+class SearchDaemon:
+    '''
+    Background process that loads a PPHMM DB once and answers scan requests over a local (unix) socket,
+    so repeated annotation calls from a long-running API process don't reload the DB or spawn hmmscan.
+    '''
+    def __init__(self, db_path, db_fingerprint, cpus) -> None:
+        self.db_fingerprint = db_fingerprint
+        address = f"{tempfile.gettempdir()}/gravity_search_{os.getpid()}_{db_fingerprint[:10]}.sock"
+        if os.path.exists(address):
+            os.remove(address)
+        self.client = SearchDaemonClient(address, os.urandom(16))
+        ready = mp.Event()
+        self.process = mp.Process(target=serve, args=(db_path, address, self.client.authkey, cpus, ready), daemon=True)
+        self.process.start()
+        progress_msg(f"-  Starting PPHMM search daemon (pid {self.process.pid}) for {db_path}")
+        while not ready.wait(timeout=1):
+            if not self.process.is_alive():
+                raise_gravity_error(f"PPHMM search daemon failed to start for {db_path}; check the DB has been built with hmmpress.")
+        atexit.register(self.stop)
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self) -> None:
+        if self.process.is_alive():
+            try:
+                self.client.request(("shutdown",))
+            except (OSError, EOFError):
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        if os.path.exists(self.client.address):
+            os.remove(self.client.address)
+
+class SearchDaemonClient:
+    '''Picklable handle on a running daemon: can be passed to pool workers, which each connect per request'''
+    def __init__(self, address, authkey) -> None:
+        self.address = address
+        self.authkey = authkey
+
+    def request(self, msg):
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send(msg)
+            status, out = conn.recv()
+        if status == "error":
+            raise_gravity_error(f"PPHMM search daemon couldn't complete scan: {out}")
+        return out
+
+    def scan(self, QueryNames, QuerySeqs, C_EValue_Cutoff, cpus=None):
+        '''Same interface and output as PyhmmerBackend.scan; daemon uses its own thread count'''
+        return self.request(("scan", QueryNames, QuerySeqs, C_EValue_Cutoff))
+
+def serve(db_path, address, authkey, cpus, ready):
+    '''Daemon main loop. Requests are answered one at a time, each using all of the daemon's threads'''
+    backend = get_pyhmmer_backend(db_path)
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        ready.set()
+        while True:
+            with listener.accept() as conn:
+                msg = conn.recv()
+                if msg[0] == "shutdown":
+                    conn.send(("ok", None))
+                    return
+                try:
+                    conn.send(("ok", backend.scan(*msg[1:], cpus=cpus)))
+                except Exception as ex:
+                    conn.send(("error", repr(ex)))
@@ -0,0 +1,100 @@
+from Bio import SeqIO
+import numpy as np
+import os
+
+from app.utils.hashing import file_digest, str_digest
+from app.utils.accession_index import seq_file_format, normalise_accession
+from app.utils.stdout_utils import progress_msg
+from app.utils.compressed_io import open_text
+
+'''Bump if the store layout changes, to force rebuilds'''
+SEQUENCE_STORE_VERSION = 1
+
+class SequenceStore:
+    '''
+    All nucleotide sequences of a GenBank/fasta input packed into one memory-mapped file of uint8 (ASCII) codes,
+    back-transcribed where needed, with an offset table by normalised accession. Built once per input file (keyed
+    by path and content hash), which may be gzip/bgzf compressed. Sequences are returned as zero-copy uint8 views,
+    which find_orfs accepts directly, so workers share the OS page cache rather than each holding Biopython Seq objects.
+    '''
+    def __init__(self, GenomeSeqFile, store_dir) -> None:
+        self.GenomeSeqFile = os.path.abspath(GenomeSeqFile)
+        self.format = seq_file_format(GenomeSeqFile)
+        os.makedirs(store_dir, exist_ok=True)
+        fname_prefix = f"{store_dir}/{str_digest(SEQUENCE_STORE_VERSION, self.GenomeSeqFile, file_digest(GenomeSeqFile), self.format)[:24]}"
+        self.seq_fname, self.table_fname = f"{fname_prefix}.seq", f"{fname_prefix}.npz"
+        if not (os.path.isfile(self.seq_fname) and os.path.isfile(self.table_fname)):
+            self.build()
+        with np.load(self.table_fname, allow_pickle=False) as table:
+            self.offsets = table["Offsets"]
+            self.ids, self.names = table["IDs"].tolist(), table["Names"].tolist()
+            '''Later records with the same normalised accession replace earlier ones, as when building a dict'''
+            self.row_by_accession = {normalise_accession(SeqID): row for row, SeqID in enumerate(self.ids)}
+        self._buffer, self._pid = None, None
+
+    def build(self) -> None:
+        '''Stream records into the packed file in one sequential pass; written under temp names and renamed when complete'''
+        progress_msg(f"-  Packing sequences from {self.GenomeSeqFile}")
+        tmp_seq_fname, tmp_table_fname = f"{self.seq_fname}.{os.getpid()}.tmp", f"{self.table_fname}.{os.getpid()}.tmp"
+        Offsets, IDs, Names = [0], [], []
+        with open(tmp_seq_fname, "wb") as f, open_text(self.GenomeSeqFile) as handle:
+            for record in SeqIO.parse(handle, self.format):
+                seq = str(record.seq)
+                if "u" in seq.lower():
+                    seq = str(record.seq.back_transcribe())
+                f.write(seq.encode("ascii", errors="replace"))
+                Offsets.append(Offsets[-1] + len(seq))
+                IDs.append(record.id)
+                Names.append(record.name)
+        with open(tmp_table_fname, "wb") as f:
+            np.savez(f, Offsets=np.array(Offsets, dtype=np.int64), IDs=np.array(IDs, dtype=str), Names=np.array(Names, dtype=str))
+        os.replace(tmp_seq_fname, self.seq_fname)
+        os.replace(tmp_table_fname, self.table_fname)
+
+    @property
+    def buffer(self):
+        '''Map file on first use in each process; pages are shared between processes by the OS'''
+        if self._buffer is None or self._pid != os.getpid():
+            self._buffer = np.memmap(self.seq_fname, dtype=np.uint8, mode="r") if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+            self._pid = os.getpid()
+        return self._buffer
+
+    def __contains__(self, accession) -> bool:
+        return accession in self.row_by_accession
+
+    def __len__(self) -> int:
+        return len(self.row_by_accession)
+
+    def keys(self):
+        return self.row_by_accession.keys()
+
+    def seq(self, accession):
+        '''Zero-copy uint8 view of a sequence'''
+        row = self.row_by_accession[accession]
+        return self.buffer[self.offsets[row]:self.offsets[row+1]]
+
+    def seq_str(self, accession) -> str:
+        return self.seq(accession).tobytes().decode()
+
+    def seq_id(self, accession) -> str:
+        return self.ids[self.row_by_accession[accession]]
+
+    def seq_name(self, accession) -> str:
+        return self.names[self.row_by_accession[accession]]
+
+    def concat_genome(self, SeqIDList):
+        '''Sort a genome's segments by length (longest first) and concat to single seq. Return (ID, uint8 seq)'''
+        if len(SeqIDList) == 1:
+            return self.seq_id(SeqIDList[0]), self.seq(SeqIDList[0])
+        '''Ties on length are broken on sequence then ID, as when sorting (length, Seq, ID) tuples'''
+        Segments = sorted([(len(self.seq(SeqID)), self.seq(SeqID).tobytes(), self.seq_id(SeqID), SeqID) for SeqID in SeqIDList], reverse=True)
+        return "/".join([i.split(".")[0] for i in SeqIDList]), np.concatenate([self.seq(Segment[3]) for Segment in Segments])
+
+    def __getstate__(self):
+        '''Never pickle the mapped data itself; each process maps the file'''
+        state = self.__dict__.copy()
+        state["_buffer"], state["_pid"] = None, None
+        return state
+
+def get_sequence_store(GenomeSeqFile, fnames) -> SequenceStore:
+    return SequenceStore(GenomeSeqFile, fnames['SequenceStoreDir'])
@@ -0,0 +1,110 @@
+import numpy as np
+import pickle
+import os
+
+from app.utils.hashing import file_digest, str_digest, seq_digest_part
+from app.utils.stdout_utils import progress_msg
+
+'''Bump if the layout of cached rows or the signature generation logic changes, to invalidate old entries'''
+SIGNATURE_CACHE_VERSION = 1
+
+def pphmmdb_fingerprint(HMMER_PPHMMDB, payload, N_PPHMMs) -> str:
+    '''Identify a PPHMM DB and the cut-offs used to annotate against it'''
+    return str_digest(
+                SIGNATURE_CACHE_VERSION,
+                file_digest(HMMER_PPHMMDB),
+                N_PPHMMs,
+                payload['HMMER_C_EValue_Cutoff'],
+                payload['HMMER_HitScore_Cutoff'],
+                payload['ProteinLength_Cutoff'],
+            )
+
+class SignatureCache:
+    '''
+    Disk cache of per-genome PPHMM signature rows. Entries are keyed by the hash of the genome's concatenated
+    sequence (+ translation table), and are stored in a subdirectory named for the PPHMM DB fingerprint and
+    HMMER/ORF cutoffs, so a rebuilt DB or changed threshold never returns stale rows. Identical genomes under
+    different accessions share an entry.
+    '''
+    def __init__(self, cache_dir, db_fingerprint, N_PPHMMs) -> None:
+        self.N_PPHMMs = N_PPHMMs
+        self.cache_dir = f"{cache_dir}/{db_fingerprint[:16]}"
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def genome_key(GenomeSeq, TranslTable) -> str:
+        '''Key on concatenated genome sequence and translation table'''
+        return str_digest(TranslTable, seq_digest_part(GenomeSeq))
+
+    def entry_fname(self, key) -> str:
+        return f"{self.cache_dir}/{key[:2]}/{key}.p"
+
+    def get(self, key):
+        '''Return (FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList) or None on a miss'''
+        fname = self.entry_fname(key)
+        if not os.path.isfile(fname):
+            return None
+        try:
+            idx, loc, naive, sig = pickle.load(open(fname, "rb"))
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            '''Truncated entry (e.g. killed mid-write on a filesystem without atomic rename): treat as miss'''
+            return None
+        return unpack_sig_rows(idx, loc, naive, sig, self.N_PPHMMs)
+
+    def put(self, key, FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList) -> None:
+        '''Write rows sparsely; write to temp file and rename so concurrent readers never see partial entries'''
+        fname = self.entry_fname(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp_fname = f"{fname}.{os.getpid()}.tmp"
+        pickle.dump(pack_sig_rows(FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList), open(tmp_fname, "wb"))
+        os.replace(tmp_fname, fname)
+
+class SignatureCheckpoint:
+    '''
+    Append-only record of per-genome signature rows for an in-progress run, so a crashed or killed run can be
+    resumed without rescanning finished genomes. Each record is a pickled (key, packed rows) tuple; a truncated
+    trailing record (process killed mid-write) is discarded on load.
+    '''
+    def __init__(self, fname, N_PPHMMs) -> None:
+        self.fname = fname
+        self.N_PPHMMs = N_PPHMMs
+
+    def load(self) -> dict:
+        '''Return {key: rows} for all complete records and cut the file back to the last of these'''
+        done = {}
+        if not os.path.isfile(self.fname):
+            return done
+        good_offset = 0
+        with open(self.fname, "rb") as f:
+            while True:
+                try:
+                    key, packed = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError, TypeError):
+                    break
+                done[key] = unpack_sig_rows(*packed, self.N_PPHMMs)
+                good_offset = f.tell()
+        with open(self.fname, "r+b") as f:
+            f.truncate(good_offset)
+        return done
+
+    def append(self, key, FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList) -> None:
+        with open(self.fname, "ab") as f:
+            pickle.dump((key, pack_sig_rows(FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList)), f)
+            f.flush()
+
+def pack_sig_rows(FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList):
+    '''Signature rows are very sparse: keep only columns where any of the three rows is non-zero'''
+    idx = np.flatnonzero((FeatureLocMiddleBestHitList != 0) | (NaiveLocationList != 0) | (FeatureValueList != 0)).astype(np.int32)
+    return idx, FeatureLocMiddleBestHitList[idx], NaiveLocationList[idx], FeatureValueList[idx]
+
+def unpack_sig_rows(idx, loc, naive, sig, N_PPHMMs):
+    '''Inverse of pack_sig_rows'''
+    FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList = np.zeros(N_PPHMMs), np.zeros(N_PPHMMs), np.zeros(N_PPHMMs)
+    FeatureLocMiddleBestHitList[idx] = loc
+    NaiveLocationList[idx] = naive
+    FeatureValueList[idx] = sig
+    return FeatureLocMiddleBestHitList, NaiveLocationList, FeatureValueList
+
+def report_cache_hits(n_hits, n_genomes, source="Signature cache") -> None:
+    if n_hits > 0:
+        progress_msg(f"-  {source}: {n_hits}/{n_genomes} genomes already annotated against this PPHMM DB, scanning remaining {n_genomes - n_hits}")
@@ -1,13 +1,87 @@
 import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from scipy.sparse import csr_matrix
 
+from app.utils.hashing import file_digest
 from app.utils.stdout_utils import clean_stdout
 from app.utils.dcor import dcor
-from app.utils.error_handlers import raise_gravity_error
-
-def SimilarityMat_Constructor(PPHMMSignatureTable, GOMSignatureTable, PPHMMLocationTable, SPRSignatureTable, pphmm_neighbourhood_weight, pphmm_signature_score_threshold, SimilarityMeasurementScheme="PG", p=1.0, fnames=False):
-    '''Construct similarity matrix according to specified scheme and p value'''
-    # if SimilarityMeasurementScheme not in ["P", "G", "L", "PG", "PL", "R", "RG", "PR"]: # TODO < Deprecate, not needed now the API does typing
-    #     raise_gravity_error("'SimilarityMeasurementScheme' should be one of the following: 'P', 'G', 'L', 'PG', 'PL', 'R', 'RG', 'PR'.")
+from app.utils.generalised_jaccard import CompoundedWeights, generalised_jaccard_matrix
+
+'''Neighbour weight tables built this process, {(location CSV digest, signature CSV digest, weight): table}; bootstrap replicates reuse them'''
+_neighbour_weight_tables = OrderedDict()
+NEIGHBOUR_WEIGHT_CACHE_SIZE = 4
+
+def pphmm_neighbour_weight_table(fnames, pphmm_neighbourhood_weight):
+    '''
+    Sparse (viruses x PPHMMs) table of neighbourhood weight factors, built from the PPHMM location and signature CSVs.
+    PPHMMs are put in order of mean location (over the viruses hitting them); a virus's distance at a PPHMM is
+    |signature score - mean location|, rounded to 4 d.p., or 0 where it has no hit. A neighbourhood is a run of at
+    least 4 nonzero distances in that order (the first PPHMM never counts as one). Its PPHMM with the largest
+    distance is weighted up, by 1 + weight, and the rest down, by 1 - weight. As in the original profile loop, a run
+    ended by a miss is compared from the PPHMM before it to its last, and weighted one PPHMM later (so the miss
+    is weighted, and the PPHMM before the run is not); a run reaching the last PPHMM is compared and weighted from
+    the PPHMM before it to the second-last. A PPHMM weighted down by one neighbourhood and up by the next gets
+    the product of both factors; unweighted PPHMMs have no entry. Runs are found with array operations, then a
+    short loop over them picks each largest; tables are cached by CSV content and weight.
+    '''
+    Key = (file_digest(fnames["PphmmLocs"]), file_digest(fnames["PphmmAndGomSigs"]), pphmm_neighbourhood_weight)
+    if Key in _neighbour_weight_tables:
+        _neighbour_weight_tables.move_to_end(Key)
+        return _neighbour_weight_tables[Key]
+
+    '''Mean location of each PPHMM over its hits; distance of each signature score from it, in PPHMM location order'''
+    trim_df = pd.read_csv(fnames["PphmmLocs"], index_col=False).iloc[:,1:].apply(pd.to_numeric).replace(0, np.nan)
+    means = np.array(trim_df.mean().to_list())
+    means_indices = np.argsort(means)
+    sig_trim_df = pd.read_csv(fnames["PphmmAndGomSigs"], index_col=False).iloc[:,2:].apply(pd.to_numeric).replace(0, np.nan)
+    distance_arr = np.nan_to_num(np.round(np.abs(np.array(sig_trim_df) - means), 4)[:, means_indices], nan=0)
+    N_Rows, N_Profs = distance_arr.shape
+
+    '''Runs of hits, the first profile skipped: [start, end) per run, from the edges of each padded row'''
+    Hits = distance_arr != 0
+    Hits[:, 0] = False
+    Edges = np.diff(np.column_stack((np.zeros(N_Rows, dtype=np.int8), Hits.astype(np.int8), np.zeros(N_Rows, dtype=np.int8))), axis=1)
+    RunRows, RunStarts = np.nonzero(Edges == 1)
+    RunEnds = np.nonzero(Edges == -1)[1]
+    '''
+    As the profile loop records them: a run ended by a miss at e keys at its start, with the values from start-1 to
+    e-1 weighted at start to e; a run reaching the last profile keys at start-1, with the values from start-1 to
+    the second-last profile, weighted in place. Both are recorded with length run+1, against MIN_NEIGH_SIZE
+    '''
+    MIN_NEIGH_SIZE = 5
+    RunLens = RunEnds - RunStarts
+    Keep = RunLens + 1 >= MIN_NEIGH_SIZE
+    RunRows, RunStarts, RunLens, AtEnd = RunRows[Keep], RunStarts[Keep], RunLens[Keep], RunEnds[Keep] == N_Profs
+    NeighKeys, NeighLens = RunStarts - AtEnd, RunLens + 1 - AtEnd
+
+    NegEntries, PosEntries = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+    for row_idx, start, nei_key, nei_len in zip(RunRows, RunStarts, NeighKeys, NeighLens):
+        Largest = np.argmax(distance_arr[row_idx, start-1:start-1+nei_len])
+        Profs = np.arange(nei_key, nei_key + nei_len)
+        PosEntries.append(row_idx * N_Profs + means_indices[Profs[Largest:Largest+1]])
+        NegEntries.append(row_idx * N_Profs + means_indices[np.delete(Profs, Largest)])
+
+    '''Entries (row * N_Profs + PPHMM, in original PPHMM order); a PPHMM weighted down (or up) twice in a row is still only weighted once'''
+    NegEntries, PosEntries = np.unique(np.concatenate(NegEntries)), np.unique(np.concatenate(PosEntries))
+    Entries = np.union1d(NegEntries, PosEntries)
+    Factors = (np.where(np.isin(Entries, NegEntries), 1 - pphmm_neighbourhood_weight, 1.0)
+               * np.where(np.isin(Entries, PosEntries), 1 + pphmm_neighbourhood_weight, 1.0))
+    Table = csr_matrix((Factors, (Entries // N_Profs, Entries % N_Profs)), shape=(N_Rows, N_Profs))
+
+    _neighbour_weight_tables[Key] = Table
+    if len(_neighbour_weight_tables) > NEIGHBOUR_WEIGHT_CACHE_SIZE:
+        _neighbour_weight_tables.popitem(last=False)
+    return Table
+
+def SimilarityMat_Constructor(PPHMMSignatureTable, GOMSignatureTable, PPHMMLocationTable, SPRSignatureTable, pphmm_neighbourhood_weight, pphmm_signature_score_threshold, SimilarityMeasurementScheme="PG", p=1.0, fnames=False, N_CPUs=1, BlockSize=256):
+    '''
+    Construct similarity matrix according to specified scheme and p value. Generalised Jaccard (GJ) matrices are
+    computed blockwise (BlockSize x BlockSize tiles of virus pairs, upper triangle only) on N_CPUs processes.
+    Gives the same matrix as the pair-by-pair loop it replaced (the reference in tests/test_similarity_matrix.py),
+    including its compounding of neighbourhood weights (see CompoundedWeights), and leaves PPHMMSignatureTable
+    weighted and thresholded in place as it did.
+    '''
     N_Viruses = PPHMMSignatureTable.shape[0]
     p = float(p)
 
@@ -16,181 +90,26 @@ def SimilarityMat_Constructor(PPHMMSignatureTable, GOMSignatureTable, PPHMMLocat
     PPHMMLocation_dCorMat = np.zeros((N_Viruses, N_Viruses))
     SPRSignature_SimMat = SPRSignatureTable
 
-    import pandas as pd
-    loc_df = pd.read_csv(fnames["PphmmLocs"], index_col=False)
-    trim_df = loc_df.iloc[:,1:]
-    trim_df = trim_df.apply(pd.to_numeric)
-    '''Replace non-hits with NaN so as to not mess up mean calculations'''
-    trim_df = trim_df.replace(0, np.nan)
-    means = trim_df.mean().to_list()
-    means_indices = np.argsort(means)
+    if "P" in SimilarityMeasurementScheme:
+        Weights = CompoundedWeights(np.asarray(PPHMMSignatureTable, dtype=float),
+                                    pphmm_neighbour_weight_table(fnames, pphmm_neighbourhood_weight),
+                                    pphmm_signature_score_threshold)
+        PPHMMSignature_GJMat = generalised_jaccard_matrix(PPHMMSignatureTable, Weights, N_CPUs, BlockSize)
+        PPHMMSignatureTable[:] = Weights.final_table(N_Viruses)
 
-    # TODO SWITCH DISTANCE TO SIG TABLE AS PPHMM DIST MAX MAY != SIG MAX
-    sig_df = pd.read_csv(fnames["PphmmAndGomSigs"], index_col=False)
-    sig_trim_df = sig_df.iloc[:,2:]
-    sig_trim_df = sig_trim_df.apply(pd.to_numeric)
-    sig_trim_df = sig_trim_df.replace(0, np.nan)
-
-    all_dists = []
-    for row in np.array(sig_trim_df): # WAS trim_df
-        dists = []
-        for i in range(row.shape[0]):
-            dists.append(round(np.abs(row[i] - means[i]), 4) if not row[i] == np.nan else 0)
-        all_dists.append(dists)
-    '''Rearrange matrix X to PPHMM loc order and Y to match GRAViTy heatmap (i.e. calculated tree)'''
-    distance_arr = np.nan_to_num(np.array(all_dists).T[means_indices].T, 0)
-
-    AMP_SINGLETONS = True
-    neighbourhoods = {}
-    for row_idx, row in enumerate(distance_arr):
-        neighbourhood = 0
-        for prof_idx, prof in enumerate(row):
-            if prof_idx == 0:
-                '''Skip first'''
-                continue
-
-            if prof != 0:
-                '''If current profile is a hit...'''
-                if AMP_SINGLETONS:
-                    neighbourhood += 1
-                else:
-                    if row[prof_idx-1] != 0:
-                        neighbourhood += 1
-                if prof_idx == len(row) - 1:
-                    '''If last entry and a hit'''
-                    if not row_idx in neighbourhoods:
-                        neighbourhoods[row_idx] = {}
-                    # RM TODO < If neigh == prof_idx (i.e. all), row[prof_idx-neighbourhood-1] == -1 which breaks everything TODO CHECK LOGIC
-                    # neighbourhoods[row_idx].update({prof_idx-neighbourhood: [neighbourhood+1, row[prof_idx-neighbourhood-1:prof_idx]]})
-                    neighbourhoods[row_idx].update({prof_idx-neighbourhood: [neighbourhood+1, row[prof_idx-neighbourhood:prof_idx]]})
-
-            else:
-                '''If current not a hit...'''
-                if neighbourhood == 0:
-                    '''But no prior hit, continue'''
-                    continue
-                else:
-                    '''If prior was a hit, sub dict: {start idx: [len, vals]}'''
-                    if not row_idx in neighbourhoods:
-                        neighbourhoods[row_idx] = {}
-                    neighbourhoods[row_idx].update({prof_idx-neighbourhood: [neighbourhood+1, row[prof_idx-neighbourhood-1:prof_idx]]})
-                    neighbourhood = 0
+    if "G" in SimilarityMeasurementScheme:
+        GOMSignature_GJMat = generalised_jaccard_matrix(GOMSignatureTable, N_CPUs=N_CPUs, BlockSize=BlockSize)
 
-    MIN_NEIGH_SIZE = 5
-    neigh_neg_weights = {}
-    neigh_pos_weights = {}
-    for row_key, row in neighbourhoods.items():
-        for nei_key, nei in row.items():
-            if nei[0] < MIN_NEIGH_SIZE:
-                continue
-            else:
-                if row_key not in neigh_neg_weights.keys():
-                    neigh_neg_weights[row_key] = []
-                idxs = [i+nei_key for i in range(len(nei[1]))]
-                '''Select largest parameter of neigh, select largest and non-largest'''
-                if not row_key in neigh_pos_weights.keys():
-                    neigh_pos_weights[row_key] = []
-                neigh_pos_weights[row_key] = neigh_pos_weights[row_key] + [np.argmax(nei[1]) + nei_key]
-                del idxs[np.argmax(nei[1])]                 # Delete largest number's idx
-                neigh_neg_weights[row_key] = neigh_neg_weights[row_key] + idxs
-
-    '''Reverse sort'''
-    reversed = np.argsort(means_indices)
-    unsort_neigh_neg_weights = {}
-    for row_idx, row in neigh_neg_weights.items():
-        '''Convert neg weight indices back to original'''
-        unsort_neigh_neg_weights[row_idx] = []
-        for prof in row:
-            unsort_neigh_neg_weights[row_idx].append(np.where(reversed == prof)[0][0])
-    unsort_neigh_pos_weights = {}
-    for row_idx, row in neigh_pos_weights.items():
-        '''Convert pos weight indices back to original'''
-        unsort_neigh_pos_weights[row_idx] = []
-        for prof in row:
-            unsort_neigh_pos_weights[row_idx].append(np.where(reversed == prof)[0][0])
-
-    try:
+    if "L" in SimilarityMeasurementScheme:
         for i in range(N_Viruses):
             for j in range(i, N_Viruses):
-                if "P" in SimilarityMeasurementScheme:
-                    PPHMMSignature_i = PPHMMSignatureTable[i]
-                    PPHMMSignature_j = PPHMMSignatureTable[j]
-
-                    '''Apply shared neighbourhood weights'''
-                    NEG_WEIGHT = 1 - pphmm_neighbourhood_weight
-                    POS_WEIGHT = 1 + pphmm_neighbourhood_weight
-
-                    # NEG_WEIGHT = 1 - 0.95
-                    # POS_WEIGHT = 1 + 0.2
-                    try:
-                        PPHMMSignature_i[unsort_neigh_neg_weights[i]] = PPHMMSignature_i[unsort_neigh_neg_weights[i]] * NEG_WEIGHT
-                        PPHMMSignature_i[unsort_neigh_pos_weights[i]] = PPHMMSignature_i[unsort_neigh_pos_weights[i]] * POS_WEIGHT
-                    except KeyError:
-                        """No neighbourhood for this genome"""
-                        ...
-                    try:
-                        PPHMMSignature_j[unsort_neigh_neg_weights[j]] = PPHMMSignature_j[unsort_neigh_neg_weights[j]] * NEG_WEIGHT
-                        PPHMMSignature_j[unsort_neigh_pos_weights[j]] = PPHMMSignature_j[unsort_neigh_pos_weights[j]] * POS_WEIGHT
-                    except KeyError:
-                        """No neighbourhood for this genome"""
-                        ...
-
-                    '''THRESHOLD'''
-                    PPHMMSignature_i[PPHMMSignature_i < pphmm_signature_score_threshold] = 0
-                    PPHMMSignature_j[PPHMMSignature_j < pphmm_signature_score_threshold] = 0
-
-                    # '''Apply absence weighting'''
-                    # ABS_WEIGHT = 0.999
-                    # n_matching = 0
-                    # i_missing = 0
-                    # j_missing = 0
-                    # for idx, val in enumerate(PPHMMSignature_i):
-                    #     if val != 0 and PPHMMSignature_j[idx] != 0:
-                    #         n_matching += 1
-                    #     elif val != 0 and PPHMMSignature_j[idx] == 0:
-                    #         j_missing += 1
-                    #     elif val == 0 and PPHMMSignature_j[idx] != 0:
-                    #         i_missing += 1
-                    # if sum(PPHMMSignature_i) > sum(PPHMMSignature_j):
-                    #     small_arr, small_arr_missing = PPHMMSignature_j, j_missing
-                    #     large_arr, large_arr_missing = PPHMMSignature_i, i_missing
-                    # else:
-                    #     small_arr, small_arr_missing = PPHMMSignature_i, i_missing
-                    #     large_arr, large_arr_missing = PPHMMSignature_j, j_missing
-                    # small_arr_hits, large_arr_hits = np.count_nonzero(small_arr), np.count_nonzero(large_arr)
-
-                    # # PPHMMSignature_GJMat[i, j] = np.sum(small_arr) - ((small_arr_missing * np.median(small_arr[small_arr > 0])) * ABS_WEIGHT) / np.sum(
-                    # #         large_arr) - ((large_arr_missing * np.median(large_arr[large_arr > 0])) * ABS_WEIGHT) if not np.sum(large_arr) == 0 else 0
-                    # PPHMMSignature_GJMat[i, j] = np.sum(small_arr) * (1 - (small_arr_missing/small_arr_hits) * ABS_WEIGHT) / np.sum(
-                    #         large_arr) * (1 - (large_arr_missing/large_arr_hits)* ABS_WEIGHT) if not np.sum(large_arr) == 0 else 0
-
-                    PPHMMSignature_GJMat[i, j] = np.sum(np.minimum(
-                        PPHMMSignature_i, PPHMMSignature_j))/np.sum(np.maximum(PPHMMSignature_i, PPHMMSignature_j)) if not np.sum(np.maximum(PPHMMSignature_i, PPHMMSignature_j)) == 0 else 0
-                    PPHMMSignature_GJMat[j, i] = PPHMMSignature_GJMat[i, j]
-
-
-                if "G" in SimilarityMeasurementScheme:
-                    GOMSignature_i = GOMSignatureTable[i]
-                    GOMSignature_j = GOMSignatureTable[j]
-                    GOMSignature_GJMat[i, j] = np.sum(np.minimum(
-                        GOMSignature_i, GOMSignature_j))/np.sum(np.maximum(GOMSignature_i, GOMSignature_j)) if not np.sum(np.maximum(GOMSignature_i, GOMSignature_j)) == 0 else 0
-                    GOMSignature_GJMat[j, i] = GOMSignature_GJMat[i, j]
-
-                if "L" in SimilarityMeasurementScheme:
-                    PPHMMLocation_i = PPHMMLocationTable[i]
-                    PPHMMLocation_j = PPHMMLocationTable[j]
-                    PresentPPHMM_IndexList = np.column_stack(
-                        (PPHMMLocation_i != 0, PPHMMLocation_j != 0)).any(axis=1)
-                    PPHMMLocation_dCorMat[i, j] = dcor(PPHMMLocation_i[PresentPPHMM_IndexList].reshape(
-                        -1, 1), PPHMMLocation_j[PresentPPHMM_IndexList].reshape(-1, 1))
-                    PPHMMLocation_dCorMat[j, i] = PPHMMLocation_dCorMat[i, j]
-
-
-
-    except ZeroDivisionError as ex:
-        raise SystemExit(f"{ex}\n"
-                         f"This usually means that there is no similarity between any of the sequences in your database, so we can't generate any stats or figures.\n"
-                         f"Check your input VMR: are there any entries, and do you expect them to be related? Check your input Genbank file: are there any sequences in it?")
+                PPHMMLocation_i = PPHMMLocationTable[i]
+                PPHMMLocation_j = PPHMMLocationTable[j]
+                PresentPPHMM_IndexList = np.column_stack(
+                    (PPHMMLocation_i != 0, PPHMMLocation_j != 0)).any(axis=1)
+                PPHMMLocation_dCorMat[i, j] = dcor(PPHMMLocation_i[PresentPPHMM_IndexList].reshape(
+                    -1, 1), PPHMMLocation_j[PresentPPHMM_IndexList].reshape(-1, 1))
+                PPHMMLocation_dCorMat[j, i] = PPHMMLocation_dCorMat[i, j]
     clean_stdout()
 
     sim_settings = {
@@ -0,0 +1,201 @@
+import json
+import os
+
+from app.utils.accession_index import normalise_accession
+from app.utils.hashing import str_digest, seq_digest_part
+
+'''Columns that place a genome in the taxonomy; a change in any of these only requires relabelling'''
+TAXONOMY_COLUMNS = ["BaltimoreList", "OrderList", "FamilyList", "SubFamList", "GenusList", "VirusNameList", "TaxoGroupingList"]
+'''Columns a changeset compares: taxonomy, plus what determines a genome's sequence'''
+COMPARED_COLUMNS = ["SeqIDLists", "TranslTableList"] + TAXONOMY_COLUMNS
+
+def accession_table(desc_table) -> dict:
+    '''{normalised accession: genome index} for every accession in a parsed VMR; accession-less genomes are skipped'''
+    return {normalise_accession(SeqID): GenomeIdx for GenomeIdx, SeqIDList in enumerate(desc_table["SeqIDLists"])
+            for SeqID in SeqIDList if SeqID != ""}
+
+def member_key(SeqIDList) -> str:
+    '''Key for a genome in per-genome results carried between runs (e.g. GOM database members)'''
+    return "/".join(SeqIDList)
+
+def desc_table_digest(desc_table) -> str:
+    '''Digest of the columns of a parsed VMR that a changeset compares (so equal digests == empty changeset)'''
+    return str_digest(*[[str(i) for i in desc_table[col]] for col in COMPARED_COLUMNS])
+
+def run_state(VmrDigest, SeqDigests) -> str:
+    '''Identify the inputs of a run: its parsed VMR (by desc_table_digest) and the sequence digests of its accessions'''
+    return str_digest(VmrDigest, json.dumps(SeqDigests, sort_keys=True))
+
+class VmrChangeset:
+    '''
+    Differences between two parses of a VMR, by accession:
+        added: in the new VMR only
+        removed: in the previous VMR only
+        retaxonomised: in both, but the genome's taxonomy (any of TAXONOMY_COLUMNS) changed
+        sequence_changed: in both, but the genome's translation table or segments changed, or the sequence itself
+            (by digest against the sequences the previous run used; see record_sequence_changes)
+    Accessions are listed in new VMR order (previous VMR order for removed). An accession can be both retaxonomised
+    and sequence_changed.
+    Stages that carry results over from the previous run update them from the changeset only if those results were
+    built from the run it is relative to: base_state, the run_state of the previous run (set once its sequence
+    digests are known; see record_sequence_changes and load_applicable_changeset).
+    '''
+    def __init__(self, added, removed, retaxonomised, sequence_changed, new_genome_idxs, N_Unchanged, previous_vmr=None, base_state=None) -> None:
+        self.added, self.removed, self.retaxonomised, self.sequence_changed = added, removed, retaxonomised, sequence_changed
+        self.new_genome_idxs = new_genome_idxs
+        self.N_Unchanged = N_Unchanged
+        self.previous_vmr, self.base_state = previous_vmr, base_state
+
+    @classmethod
+    def from_dict(cls, changeset, new_table):
+        '''Rebuild a saved changeset (see to_dict) against the parsed VMR it was computed for'''
+        return cls(changeset["added"], changeset["removed"], changeset["retaxonomised"], changeset["sequence_changed"],
+                   accession_table(new_table), changeset["n_unchanged"], changeset.get("previous_vmr"), changeset.get("base_state"))
+
+    def mark_sequence_changed(self, SeqIDs) -> int:
+        '''Add accessions whose sequence content changed (added accessions are skipped); return how many weren't already marked'''
+        Marked = set(self.added) | set(self.sequence_changed)
+        New = {SeqID for SeqID in SeqIDs if SeqID in self.new_genome_idxs and SeqID not in Marked}
+        self.N_Unchanged -= len(New - set(self.retaxonomised))
+        self.sequence_changed = [SeqID for SeqID in self.new_genome_idxs if SeqID in New or SeqID in Marked - set(self.added)]
+        return len(New)
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.retaxonomised or self.sequence_changed)
+
+    def genomes_to_recompute(self) -> list:
+        '''Indices (in the new VMR) of genomes whose ORFs and signatures must be regenerated'''
+        return sorted({self.new_genome_idxs[SeqID] for SeqID in self.added + self.sequence_changed})
+
+    def genomes_to_relabel(self) -> list:
+        '''Indices (in the new VMR) of genomes whose results stand, but whose taxonomy labels changed'''
+        return sorted({self.new_genome_idxs[SeqID] for SeqID in self.retaxonomised} - set(self.genomes_to_recompute()))
+
+    def changed_accessions(self) -> set:
+        return set(self.added) | set(self.removed) | set(self.retaxonomised) | set(self.sequence_changed)
+
+    def changed_member_keys(self, new_table, PreviousMemberKeys) -> set:
+        '''
+        member_keys, in the previous run's results and in the new VMR, of every genome with an added, removed,
+        re-taxonomised or sequence-changed accession: the genomes whose carried-over results must be replaced
+        '''
+        Changed = self.changed_accessions()
+        Keys = {Key for Key in PreviousMemberKeys if any(normalise_accession(SeqID) in Changed for SeqID in Key.split("/"))}
+        Keys |= {member_key(new_table["SeqIDLists"][GenomeIdx]) for GenomeIdx in self.genomes_to_recompute() + self.genomes_to_relabel()}
+        return Keys
+
+    def summary(self) -> str:
+        return (f"{len(self.added)} added, {len(self.removed)} removed, {len(self.retaxonomised)} re-taxonomised, "
+                f"{len(self.sequence_changed)} sequence-changed, {self.N_Unchanged} unchanged accessions")
+
+    def to_dict(self) -> dict:
+        return {"added": self.added, "removed": self.removed, "retaxonomised": self.retaxonomised,
+                "sequence_changed": self.sequence_changed, "genomes_to_recompute": self.genomes_to_recompute(),
+                "genomes_to_relabel": self.genomes_to_relabel(), "n_unchanged": self.N_Unchanged,
+                "previous_vmr": self.previous_vmr, "base_state": self.base_state}
+
+    def save(self, fname) -> None:
+        with open(fname, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+def compute_vmr_changeset(old_table, new_table) -> VmrChangeset:
+    '''
+    Compare two parsed VMRs (dicts of per-genome arrays, as in ReadGenomeDescTable.p or its snapshot). Accessions
+    are unversioned once parsed, so sequence revisions don't show here; record_sequence_changes adds them.
+    '''
+    OldIdxs, NewIdxs = accession_table(old_table), accession_table(new_table)
+
+    def genome_segments(table, GenomeIdx):
+        return sorted(normalise_accession(SeqID) for SeqID in table["SeqIDLists"][GenomeIdx] if SeqID != "")
+
+    Added, Retaxonomised, SequenceChanged, N_Unchanged = [], [], [], 0
+    for SeqID, NewIdx in NewIdxs.items():
+        if SeqID not in OldIdxs:
+            Added.append(SeqID)
+            continue
+        OldIdx = OldIdxs[SeqID]
+        Changed = False
+        if any(str(old_table[col][OldIdx]) != str(new_table[col][NewIdx]) for col in TAXONOMY_COLUMNS):
+            Retaxonomised.append(SeqID)
+            Changed = True
+        if (str(old_table["TranslTableList"][OldIdx]) != str(new_table["TranslTableList"][NewIdx])
+                or genome_segments(old_table, OldIdx) != genome_segments(new_table, NewIdx)):
+            SequenceChanged.append(SeqID)
+            Changed = True
+        N_Unchanged += not Changed
+    Removed = [SeqID for SeqID in OldIdxs if SeqID not in NewIdxs]
+    return VmrChangeset(Added, Removed, Retaxonomised, SequenceChanged, NewIdxs, N_Unchanged, desc_table_digest(old_table))
+
+def load_changeset(fname) -> dict:
+    '''Changeset saved by a previous run, as a dict (see VmrChangeset.to_dict), or None if there isn't one'''
+    if not os.path.isfile(fname):
+        return None
+    with open(fname) as f:
+        return json.load(f)
+
+def sequence_digests(desc_table, SeqStore) -> dict:
+    '''{normalised accession: sequence digest} for every accession of a parsed VMR found in a SequenceStore'''
+    return {SeqID: str_digest(seq_digest_part(SeqStore.seq(SeqID))) for SeqID in accession_table(desc_table) if SeqID in SeqStore}
+
+def record_sequence_changes(fnames, desc_table, SeqStore) -> None:
+    '''
+    Compare the sequences of a parsed VMR's accessions with those the experiment's previous run used (saved as
+    SequenceDigests.json), add any that changed to this run's changeset, then save this run's digests for the next.
+    The first check in a run also sets the changeset's base_state from the previous run's VMR and digests.
+    Safe to repeat within a run (e.g. once the sequence file has been downloaded or extended): digests saved
+    earlier in the run only differ for sequences that changed since.
+    '''
+    NewDigests = sequence_digests(desc_table, SeqStore)
+    changeset = load_changeset(fnames["VmrChangeset"])
+    if changeset is not None:
+        changeset, OldDigests, N_Changed = VmrChangeset.from_dict(changeset, desc_table), None, 0
+        if os.path.isfile(fnames["SequenceDigests"]):
+            with open(fnames["SequenceDigests"]) as f:
+                OldDigests = json.load(f)
+            N_Changed = changeset.mark_sequence_changed([SeqID for SeqID, Digest in NewDigests.items()
+                                                         if SeqID in OldDigests and OldDigests[SeqID] != Digest])
+            if N_Changed > 0:
+                print(f"- {N_Changed} accession(s) have revised sequences since the previous run: {changeset.summary()}")
+        if changeset.base_state is None:
+            '''First check this run, so digests on disk are the previous run's; "" if it saved none (matches no results)'''
+            changeset.base_state = run_state(changeset.previous_vmr, OldDigests) if OldDigests is not None and changeset.previous_vmr else ""
+        changeset.save(fnames["VmrChangeset"])
+    with open(fnames["SequenceDigests"], "w") as f:
+        json.dump(NewDigests, f)
+
+def current_run_state(fnames, desc_table) -> str:
+    '''run_state of this run, once its sequence digests have been recorded (else None)'''
+    if not os.path.isfile(fnames["SequenceDigests"]):
+        return None
+    with open(fnames["SequenceDigests"]) as f:
+        return run_state(desc_table_digest(desc_table), json.load(f))
+
+def load_applicable_changeset(fnames, desc_table, PreviousState):
+    '''
+    This run's changeset, if results carried over from a previous run were built from the run it is relative to
+    (PreviousState == its base_state); else None, and the results must be rebuilt or checked in full. Guards against
+    applying a changeset across a run that was interrupted before the stage saved its results.
+    '''
+    changeset = load_changeset(fnames["VmrChangeset"])
+    if changeset is None or PreviousState is None or changeset.get("base_state") != PreviousState:
+        return None
+    return VmrChangeset.from_dict(changeset, desc_table)
+
+def load_genome_keys(fname, fnames, desc_table) -> dict:
+    '''
+    {member_key: signature cache key} saved by the previous run (see save_genome_keys), for genomes this run's
+    changeset leaves unchanged, so their sequences needn't be re-read to find their cached signatures
+    '''
+    if not os.path.isfile(fname):
+        return {}
+    with open(fname) as f:
+        saved = json.load(f)
+    changeset = load_applicable_changeset(fnames, desc_table, saved["run_state"])
+    if changeset is None:
+        return {}
+    Changed = changeset.changed_member_keys(desc_table, saved["keys"])
+    return {Key: GenomeKey for Key, GenomeKey in saved["keys"].items() if Key not in Changed}
+
+def save_genome_keys(fname, State, KeysByMember) -> None:
+    with open(fname, "w") as f:
+        json.dump({"run_state": State, "keys": KeysByMember}, f)
@@ -0,0 +1,44 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
+import os
+
+from app.utils.hashing import file_digest, str_digest
+
+'''Bump if VMR parsing or the snapshot layout changes, to force re-parsing'''
+VMR_SNAPSHOT_VERSION = 1
+
+'''Per-genome columns of a parsed VMR, as stored in ReadGenomeDescTable.p'''
+VMR_COLUMNS = ["BaltimoreList", "OrderList", "FamilyList", "SubFamList", "GenusList", "VirusNameList",
+               "SeqIDLists", "SeqStatusList", "TaxoGroupingList", "TranslTableList"]
+
+def vmr_snapshot_fname(GenomeDescTableFile, payload, is_secondpass, snapshot_dir) -> str:
+    '''Snapshot file name, keyed by VMR content hash and every option that changes how it is parsed'''
+    key = str_digest(VMR_SNAPSHOT_VERSION, file_digest(GenomeDescTableFile), payload['TaxoGrouping_Header'],
+                     is_secondpass, payload['AnnotateIncompleteGenomes'])
+    return f"{snapshot_dir}/{key[:24]}.parquet"
+
+def save_vmr_snapshot(fname, desc_table, no_acc_cnt) -> None:
+    '''Write parsed VMR (dict of per-genome arrays) as one Parquet table. Written under temp name and renamed when complete'''
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    columns = {col: pa.array([list(i) for i in desc_table[col]] if col == "SeqIDLists" else desc_table[col].tolist())
+               for col in VMR_COLUMNS}
+    table = pa.table(columns, metadata={"no_acc_cnt": str(no_acc_cnt)})
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_fname)
+    os.replace(tmp_fname, fname)
+
+def load_vmr_snapshot(fname, columns=None):
+    '''
+    Read parsed VMR (or only the requested columns) as a dict of arrays in the same form as ReadGenomeDescTable.p,
+    plus the no-accession count. Return (desc_table, no_acc_cnt).
+    '''
+    table = pq.read_table(fname, columns=columns)
+    desc_table = {}
+    for col in table.column_names:
+        values = table.column(col).to_pylist()
+        '''Built exactly as when parsing, so SeqIDLists is a h list (i.e. not a v list), and str/num dtypes match'''
+        desc_table[col] = np.array(values, dtype="object") if col == "SeqIDLists" else np.array(values)
+    if columns is None:
+        desc_table["DatabaseList"] = np.array([])
+    return desc_table, int(table.schema.metadata[b"no_acc_cnt"])
@@ -0,0 +1,29 @@
+'''
+Time the univariate distance correlation (dcor_univariate, used by dcor for single-column inputs) against the
+distance-matrix reference (dcor_reference) on sparse (mostly-zero, like PPHMM location vectors) data as n grows.
+Agreement with the reference is checked in tests/test_dcor.py. Run from repo root:
+    python -m dev.benchmark_dcor
+'''
+import time
+import numpy as np
+
+from app.utils.dcor import dcor, dcor_reference
+from tests.test_dcor import random_pair
+
+def benchmark() -> None:
+    rng = np.random.default_rng(1)
+    for n in [20, 100, 500, 1000, 4000]:
+        X, Y = random_pair(rng, n, "sparse")
+        n_reps = max(1, 2000 // n)
+        ts = time.time()
+        for _ in range(n_reps):
+            dcor_reference(X, Y)
+        t_ref = (time.time() - ts) / n_reps
+        ts = time.time()
+        for _ in range(n_reps):
+            dcor(X, Y)
+        t_fast = (time.time() - ts) / n_reps
+        print(f"n = {n}: reference {1e3*t_ref:.2f} ms, univariate {1e3*t_fast:.2f} ms, {t_ref/t_fast:.1f}x")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,31 @@
+'''
+Benchmark first-pass VMR grouping (construct_first_pass_groupings) against the row-wise original
+(first_pass_grouping_reference, in tests/test_first_pass_filter.py) on synthetic VMRs with a realistic family/genus/species hierarchy, including
+genomes with no family or genus. Checks groupings are identical. The original is only timed up to 4k rows, as it
+is O(N^2). Run from repo root:
+    python -m dev.benchmark_first_pass_filter
+'''
+import time
+
+from app.utils.scrape_vmr import construct_first_pass_groupings
+from tests.test_first_pass_filter import THRESHOLD, first_pass_grouping_reference, synthetic_vmr
+
+def benchmark() -> None:
+    for n_rows in [1000, 2000, 4000, 16000, 160000]:
+        df = synthetic_vmr(n_rows)
+        ts = time.time()
+        new = construct_first_pass_groupings(df, THRESHOLD)
+        t_new = time.time() - ts
+        msg = f"{n_rows} rows: vectorised {t_new:.3f} s"
+        if n_rows <= 4000:
+            ts = time.time()
+            old = df.apply(lambda x: first_pass_grouping_reference(x, df, THRESHOLD), axis=1)
+            t_old = time.time() - ts
+            identical = new.astype(str).tolist() == old.astype(str).tolist()
+            msg += f", original {t_old:.2f} s, {t_old/t_new:.0f}x; identical output: {identical}"
+            if not identical:
+                raise SystemExit(f"Output mismatch at {n_rows} rows")
+        print(msg)
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,62 @@
+'''
+Check the top-k GOM candidate prefilter (candidate_gom_mask) on synthetic reference groups, each with its own PPHMM
+organisation, and query viruses drawn from them: recall of each query's true group among its candidates, agreement
+with CandidateMask=None of the scored pairs and of each query's nearest reference by PG similarity (as the
+classifier ranks them), and that queries sharing no PPHMMs with any reference keep every group as a candidate. Then
+time GOM scoring with and without the prefilter.
+Run from repo root:
+    python -m dev.benchmark_gom_candidates
+'''
+import time
+import numpy as np
+
+from app.utils.gom_candidates import candidate_gom_mask
+from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor
+from app.utils.gomdb_constructor import GOMDB_Constructor
+from app.utils.generalised_jaccard import tile_min_sums
+from tests.test_gom_candidates import synthetic_set
+
+def pg_nearest(QuerySignatureTable, QueryGOMTable, RefSignatureTable, RefGOMTable):
+    '''Each query's nearest reference by PG similarity, sqrt(GJ(PPHMM signatures) * GJ(GOM signatures))'''
+    def gj(X, Y):
+        MinSums = tile_min_sums(X, Y, True)
+        MaxSums = X.sum(axis=1)[:, None] + Y.sum(axis=1)[None, :] - MinSums
+        return np.divide(MinSums, MaxSums, out=np.zeros_like(MinSums), where=MaxSums > 0)
+    return np.argmax(np.sqrt(gj(QuerySignatureTable, RefSignatureTable) * gj(QueryGOMTable, RefGOMTable)), axis=1)
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    for N_GOMs, N_Refs, N_Queries, N_Orphans, TopK in [(60, 600, 400, 10, 5), (120, 1200, 800, 20, 10)]:
+        GOMIDList = [f"Group_{i}" for i in range(N_GOMs)]
+        RefSignatureTable, RefLocationTable, RefTaxoGroupingList, QuerySignatureTable, QueryLocationTable, QueryGroups = \
+            synthetic_set(rng, N_GOMs, N_Refs, N_Queries, N_Orphans)
+        GOMDB = GOMDB_Constructor(RefTaxoGroupingList, RefLocationTable, GOMIDList)
+
+        ts = time.time()
+        Full = GOMSignatureTable_Constructor(QueryLocationTable, GOMDB, GOMIDList)
+        t_full = time.time() - ts
+        ts = time.time()
+        Mask = candidate_gom_mask(QuerySignatureTable, RefSignatureTable, RefTaxoGroupingList, GOMIDList, TopK)
+        t_mask = time.time() - ts
+        ts = time.time()
+        Pruned = GOMSignatureTable_Constructor(QueryLocationTable, GOMDB, GOMIDList, CandidateMask=Mask)
+        t_pruned = time.time() - ts
+
+        Matched = slice(0, N_Queries - N_Orphans)
+        Recall = Mask[np.arange(N_Queries)[Matched], QueryGroups[Matched]].mean()
+        worst = np.nanmax(np.abs(Full[Mask] - Pruned[Mask]))
+        RefGOMTable = np.nan_to_num(GOMSignatureTable_Constructor(RefLocationTable, GOMDB, GOMIDList))
+        NearestFull = pg_nearest(QuerySignatureTable, np.nan_to_num(Full), RefSignatureTable, RefGOMTable)
+        NearestPruned = pg_nearest(QuerySignatureTable, np.nan_to_num(Pruned), RefSignatureTable, RefGOMTable)
+        NearestAgree = (NearestFull[Matched] == NearestPruned[Matched]).mean()
+        GroupAgree = (RefTaxoGroupingList[NearestFull[Matched]] == RefTaxoGroupingList[NearestPruned[Matched]]).mean()
+        OrphansAll = Mask[-N_Orphans:].all()
+        print(f"{N_Queries} queries x {N_GOMs} GOMs, top {TopK}: true group recall {Recall:.3f}, PG nearest reference agreement {NearestAgree:.3f} "
+              f"(its group {GroupAgree:.3f}), "
+              f"candidate pairs max abs difference {worst:.2e}, orphans keep all groups {OrphansAll}; "
+              f"all pairs {t_full:.2f} s, prefilter {t_mask:.2f} s + candidates {t_pruned:.2f} s, {t_full/(t_mask+t_pruned):.1f}x")
+        if worst > 1e-12 or not OrphansAll:
+            raise SystemExit("Candidate GOM scoring differs from scoring every GOM")
+
+if __name__ == "__main__":
+    main()
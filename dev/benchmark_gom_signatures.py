@@ -0,0 +1,30 @@
+'''
+Time GOMSignatureTable_Constructor (on the sparse GOMDB), serially and on the worker pool, against the original
+per-virus dcor loop (generate_gom_sigs, on the dense GOMDB) with a synthetic sparse PPHMM location table.
+Agreement with the loop is checked in tests/test_gom_signatures.py. Run from repo root:
+    python -m dev.benchmark_gom_signatures
+'''
+import time
+import numpy as np
+
+from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor
+from app.utils.gomdb_constructor import GOMDB_Constructor
+from tests.test_gom_signatures import generate_gom_sigs, synthetic_gomdb
+
+def main(N_CPUs=4) -> None:
+    rng = np.random.default_rng(0)
+    for N_Viruses, N_PPHMMs, N_GOMs in [(100, 80, 8), (400, 300, 20)]:
+        PPHMMLocationTable, TaxoGroupingList, GOMIDList = synthetic_gomdb(rng, N_Viruses, N_PPHMMs, N_GOMs)
+        DenseGOMDB = GOMDB_Constructor(TaxoGroupingList, PPHMMLocationTable, GOMIDList).dense()
+        ts = time.time()
+        reference = np.column_stack([generate_gom_sigs(GOMID, PPHMMLocationTable, DenseGOMDB) for GOMID in GOMIDList])
+        t_ref = time.time() - ts
+        for n in [1, N_CPUs]:
+            ts = time.time()
+            GOMDB = GOMDB_Constructor(TaxoGroupingList, PPHMMLocationTable, GOMIDList)
+            GOMSignatureTable_Constructor(PPHMMLocationTable, GOMDB, GOMIDList, N_CPUs=n)
+            t_new = time.time() - ts
+            print(f"{N_Viruses} viruses x {N_GOMs} GOMs, N_CPUs = {n}: reference loop {t_ref:.2f} s, new {t_new:.2f} s")
+
+if __name__ == "__main__":
+    main()
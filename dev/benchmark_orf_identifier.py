@@ -0,0 +1,46 @@
+'''
+Benchmark vectorised find_orfs against the original (find_orfs_scalar) on giant virus-sized genomes, and check
+outputs are identical. Run from repo root:
+    python -m dev.benchmark_orf_identifier [path/to/genomes.gb]
+With no GenBank file, random 1 Mb genomes (~giant virus size, with some ambiguous bases) are used.
+'''
+import random
+import sys
+import time
+from Bio import SeqIO
+from Bio.Seq import Seq
+
+from app.utils.orf_identifier import find_orfs, find_orfs_scalar
+
+def random_genomes(n_genomes=3, length=1000000):
+    random.seed(42)
+    return {f"Random_{i}": Seq("".join(random.choices("ACGT", weights=[0.35, 0.15, 0.15, 0.35], k=length-1000))
+                                 + "".join(random.choices("ACGTN", k=1000)))
+            for i in range(n_genomes)}
+
+def time_fn(fn, *args, **kwargs):
+    ts = time.time()
+    out = fn(*args, **kwargs)
+    return out, time.time() - ts
+
+def benchmark(genomes, protein_length_cutoff=100):
+    total_old, total_new = 0, 0
+    for seq_id, seq in genomes.items():
+        for call_locs in [False, True]:
+            new, t_new = time_fn(find_orfs, seq_id, seq, 1, protein_length_cutoff, call_locs=call_locs)
+            old, t_old = time_fn(find_orfs_scalar, seq_id, seq, 1, protein_length_cutoff, call_locs=call_locs)
+            identical = new[1] == old[1] and [str(i.seq) for i in new[0]] == [str(i.seq) for i in old[0]] and new[2] == old[2]
+            print(f"{seq_id} ({len(seq)/1e6:.2f} Mb, call_locs={call_locs}): {len(new[1])} ORFs; "
+                  f"original {t_old:.2f} s, vectorised {t_new:.2f} s ({t_old/t_new:.1f}x); identical output: {identical}")
+            if not identical:
+                raise SystemExit(f"Output mismatch for {seq_id}")
+            total_old += t_old
+            total_new += t_new
+    print(f"TOTAL: original {total_old:.2f} s, vectorised {total_new:.2f} s ({total_old/total_new:.1f}x)")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        genomes = {record.id: record.seq for record in SeqIO.parse(sys.argv[1], "gb")}
+    else:
+        genomes = random_genomes()
+    benchmark(genomes)
@@ -0,0 +1,40 @@
+'''
+Benchmark vectorised VMR ingestion (ReadGenomeDescTable.open_table) at 1x, 2x, 5x and 10x duplication of a VMR,
+to check that time per row stays flat (i.e. scaling is linear). Run from repo root:
+    python -m dev.benchmark_read_genome_desc_table [path/to/VMR.csv]
+With no VMR, the example VMR is tiled to roughly the size of the full ICTV VMR (~16k rows).
+'''
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+from app.src.read_genome_desc_table import ReadGenomeDescTable
+
+def parse(vmr_fname, exp_dir, is_secondpass):
+    reader = ReadGenomeDescTable({"TaxoGrouping_Header": "Taxonomic grouping", "Bootstrap": False}, vmr_fname, None, exp_dir, is_secondpass=is_secondpass)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ts = time.time()
+        reader.open_table()
+        return time.time() - ts
+
+def benchmark(vmr):
+    with tempfile.TemporaryDirectory() as exp_dir:
+        for n_copies in [1, 2, 5, 10]:
+            vmr_fname = f"{exp_dir}/vmr_x{n_copies}.csv"
+            pd.concat([vmr] * n_copies, ignore_index=True).to_csv(vmr_fname)
+            for is_secondpass in [False, True]:
+                elapsed = parse(vmr_fname, exp_dir, is_secondpass)
+                n_rows = vmr.shape[0] * n_copies
+                print(f"x{n_copies} ({n_rows} rows, second pass={is_secondpass}): {elapsed:.2f} s ({1e6*elapsed/n_rows:.1f} us/row)")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        vmr = pd.read_csv(sys.argv[1], index_col=0)
+    else:
+        vmr = pd.read_csv(os.path.join("data", "eval", "example_vmr.csv"), index_col=0)
+        vmr = pd.concat([vmr] * (16000 // vmr.shape[0]), ignore_index=True)
+    benchmark(vmr)
@@ -0,0 +1,45 @@
+'''
+Time SimilarityMat_Constructor (blockwise generalised Jaccard) against the pair-by-pair loop it replaced
+(similarity_matrix_reference, in tests/test_similarity_matrix.py, which checks the two agree) on synthetic PPHMM
+signature/location tables with neighbourhoods, for several neighbourhood weights and score thresholds. The
+neighbour weight table (pphmm_neighbour_weight_table) is first timed against the profile loop it replaced
+(pphmm_neighbourhood_weights_reference). Run from repo root:
+    python -m dev.benchmark_similarity_matrix
+'''
+import tempfile
+import time
+import numpy as np
+
+from app.utils.similarity_matrix_constructor import SimilarityMat_Constructor, pphmm_neighbour_weight_table
+from tests.test_similarity_matrix import pphmm_neighbourhood_weights_reference, similarity_matrix_reference, synthetic_tables
+
+def time_neighbour_weights(rng, tmp_dir, Weight=0.0125) -> None:
+    for N_Viruses, N_PPHMMs, density in [(60, 40, 0.2), (60, 40, 0.95), (200, 300, 0.5), (600, 300, 0.5)]:
+        _, _, _, fnames = synthetic_tables(rng, N_Viruses, N_PPHMMs, tmp_dir, density)
+        ts = time.time()
+        pphmm_neighbourhood_weights_reference(fnames)
+        t_ref = time.time() - ts
+        ts = time.time()
+        pphmm_neighbour_weight_table(fnames, Weight)
+        t_new = time.time() - ts
+        print(f"{N_Viruses} viruses x {N_PPHMMs} PPHMMs, density {density}: profile loop {t_ref:.2f} s, weight table {t_new:.3f} s")
+
+def main(N_CPUs=4, BlockSize=64) -> None:
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        time_neighbour_weights(rng, tmp_dir)
+        for N_Viruses, N_PPHMMs in [(150, 120), (600, 300)]:
+            PPHMMSignatureTable, GOMSignatureTable, PPHMMLocationTable, fnames = synthetic_tables(rng, N_Viruses, N_PPHMMs, tmp_dir)
+            for Weight, Threshold in [(0.0125, 0), (0.05, 20)]:
+                ts = time.time()
+                similarity_matrix_reference(PPHMMSignatureTable.copy(), GOMSignatureTable, PPHMMLocationTable, Weight, Threshold, "PG", 1.0, fnames)
+                t_ref = time.time() - ts
+                ts = time.time()
+                SimilarityMat_Constructor(PPHMMSignatureTable.copy(), GOMSignatureTable, PPHMMLocationTable, None, Weight, Threshold, "PG", 1.0, fnames,
+                                          N_CPUs=N_CPUs, BlockSize=BlockSize)
+                t_new = time.time() - ts
+                print(f"\n{N_Viruses} viruses x {N_PPHMMs} PPHMMs, weight {Weight}, threshold {Threshold}: "
+                      f"pair loop {t_ref:.2f} s, blockwise {t_new:.2f} s, {t_ref/t_new:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from Bio.SeqRecord import SeqRecord
+from Bio.Seq import Seq
+from Bio import SeqIO
+import urllib.parse
+import threading
+import hashlib
+import pickle
+import random
+import time
+import io
+import numpy as np
+import pytest
+
+from app.utils.parallel_sig_generator import PPHMMSignatureTable_Constructor, Pphmm_Sig_Gen
+
+N_PPHMMS = 12
+
+def genome_table(SeqIDLists, TranslTables=None):
+    '''Parsed-VMR style columns: SeqIDLists is a h list of lists'''
+    table = {"SeqIDLists": np.empty(len(SeqIDLists), dtype="object"),
+             "TranslTableList": np.array(TranslTables if TranslTables is not None else [1] * len(SeqIDLists))}
+    for GenomeIdx, SeqIDList in enumerate(SeqIDLists):
+        table["SeqIDLists"][GenomeIdx] = list(SeqIDList)
+    return table
+
+def write_fasta(fname, seqs) -> None:
+    with open(fname, "w") as f:
+        f.write("".join(f">{SeqID}.1\n{Seq}\n" for SeqID, Seq in seqs.items()))
+
+class SignatureRun:
+    '''
+    Drives PPHMMSignatureTable_Constructor over a small fasta, with the PPHMM scan replaced by a deterministic
+    function of each genome's sequence (so no HMMER is needed). Scanned genomes are recorded in self.scanned
+    (serial executor only; pool workers scan in their own processes).
+    '''
+    def __init__(self, tmp_path, monkeypatch) -> None:
+        self.tmp_path = tmp_path
+        self.scanned = []
+        self.fail_after = None
+        self.db_fname = f"{tmp_path}/pphmms.hmm"
+        self.write_db("PPHMM DB v1")
+        self.seq_fname = f"{tmp_path}/seqs.fasta"
+        self.fnames = {"HMMERDir": f"{tmp_path}/hmmer", "CacheDir": f"{tmp_path}/cache",
+                       "SignatureCacheDir": f"{tmp_path}/cache/pphmm_signatures", "SequenceStoreDir": f"{tmp_path}/cache/sequence_store",
+                       "OrfCatalogueDir": f"{tmp_path}/cache/orfs", "VmrChangeset": f"{tmp_path}/VmrChangeset.json",
+                       "SequenceDigests": f"{tmp_path}/SequenceDigests.json", "SignatureGenomeKeys": f"{tmp_path}/SignatureGenomeKeys.json"}
+        self.payload = {"N_CPUs": 1, "HMMER_C_EValue_Cutoff": 1e-3, "HMMER_HitScore_Cutoff": 0, "ProteinLength_Cutoff": 100,
+                        "SignatureExecutor": "serial", "UseCache": True}
+        run = self
+
+        def fake_generate_sigs_for_batch(clf, Job):
+            Results = []
+            for SeqIDList, TranslTable in Job:
+                if run.fail_after is not None and len(run.scanned) >= run.fail_after:
+                    raise RuntimeError("Interrupted")
+                run.scanned.append(tuple(SeqIDList))
+                Results.append((SeqIDList,) + fake_sig_rows(clf.SeqStore.concat_genome(SeqIDList)[1], TranslTable, clf.N_PPHMMs))
+            return Results
+        monkeypatch.setattr(Pphmm_Sig_Gen, "generate_sigs_for_batch", fake_generate_sigs_for_batch)
+
+    def write_db(self, content) -> None:
+        with open(self.db_fname, "w") as f:
+            f.write(content)
+        with open(f"{self.db_fname}_Summary.txt", "w") as f:
+            f.write("".join(f"line {i}\n" for i in range(N_PPHMMS + 1)))
+
+    def __call__(self, genomes, GenomeKeysFile=None, **payload):
+        self.scanned = []
+        return PPHMMSignatureTable_Constructor(genomes, {**self.payload, **payload}, self.fnames, self.seq_fname, self.db_fname,
+                                               GenomeKeysFile=GenomeKeysFile)
+
+def fake_sig_rows(GenomeSeq, TranslTable, N_PPHMMs):
+    '''(location, naive location, signature) rows determined by sequence and translation table, with a few hits'''
+    Seed = int(hashlib.sha256(GenomeSeq.tobytes() + str(TranslTable).encode()).hexdigest()[:8], 16)
+    rng = np.random.default_rng(Seed)
+    Hits = rng.random(N_PPHMMs) < 0.4
+    Naive = rng.random(N_PPHMMs) * 5000 * Hits
+    return Naive * rng.choice([-1, 1], N_PPHMMs), Naive, rng.random(N_PPHMMs) * 100 * Hits
+
+@pytest.fixture
+def signature_run(tmp_path, monkeypatch):
+    return SignatureRun(tmp_path, monkeypatch)
+
+EXAMPLE_VMR = "data/eval/example_vmr.csv"
+
+def read_vmr(tmp_path, GenomeDescTableFile=EXAMPLE_VMR, is_secondpass=False, **payload):
+    '''Run ReadGenomeDescTable for experiment tmp_path/exp (caches in tmp_path/cache); return (reader, saved pickle)'''
+    from app.src.read_genome_desc_table import ReadGenomeDescTable
+    payload = {"TaxoGrouping_Header": "Taxonomic grouping", "AnnotateIncompleteGenomes": False, "Bootstrap": False,
+               "CacheDir": f"{tmp_path}/cache", "UseCache": True, **payload}
+    reader = ReadGenomeDescTable(payload, GenomeDescTableFile, f"{tmp_path}/seqs.fasta", f"{tmp_path}/exp", is_secondpass=is_secondpass)
+    reader.entrypoint()
+    with open(reader.fnames["ReadGenomeDescTablePickle"], "rb") as f:
+        return reader, pickle.load(f)
+
+class StandInEfetch(BaseHTTPRequestHandler):
+    '''
+    Local stand-in for NCBI efetch: serve GenBank records for POSTed IDs, with or without version. Batches whose
+    first ID is a key of server.errors get those HTTP statuses first (one per request; 200 = truncated response);
+    any batch containing server.invalid_id gets a 400. Each request's ID list is logged in server.requests
+    '''
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        params = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        SeqIDs = params["id"][0].split(",")
+        with self.server.lock:
+            self.server.requests.append(SeqIDs)
+            self.server.request_times.append(time.monotonic())
+            Status = self.server.errors[SeqIDs[0]].pop(0) if self.server.errors.get(SeqIDs[0]) else None
+        if self.server.invalid_id in SeqIDs:
+            Status = 400
+        if Status not in [None, 200]:
+            self.send_response(Status)
+            self.end_headers()
+            return
+        body = "".join(self.server.records[SeqID if "." in SeqID else f"{SeqID}.1"] for SeqID in SeqIDs).encode()
+        if Status == 200:
+            body = body[:len(body) // 2]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def synthetic_genbank_records(N_Records, seed=0) -> dict:
+    '''{versioned accession: GenBank text}, in accession order'''
+    rng = random.Random(seed)
+    Records = {}
+    for i in range(N_Records):
+        SeqID = f"AB{100000 + i}.1"
+        record = SeqRecord(Seq("".join(rng.choice("ACGT") for _ in range(rng.randint(200, 600)))), id=SeqID, name=SeqID.split(".")[0], description="")
+        record.annotations["molecule_type"] = "DNA"
+        handle = io.StringIO()
+        SeqIO.write(record, handle, "genbank")
+        Records[SeqID] = handle.getvalue()
+    return Records
+
+@pytest.fixture
+def efetch_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInEfetch)
+    server.records, server.requests, server.request_times = synthetic_genbank_records(30), [], []
+    server.errors, server.invalid_id, server.lock = {}, None, threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_port}/efetch.fcgi"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
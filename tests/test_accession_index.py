@@ -0,0 +1,41 @@
+import os
+import pickle
+
+from app.utils.accession_index import AccessionIndex, normalise_accession
+
+def write_records(fname, records) -> None:
+    with open(fname, "w") as f:
+        f.write("".join(f">{SeqID}\n{Seq}\n" for SeqID, Seq in records))
+
+def test_round_trip(tmp_path):
+    fname = f"{tmp_path}/seqs.fasta"
+    write_records(fname, [("AB000001.1", "ATGAAATAA"), ("AB000002.2", "AUGCCCUAG"), ("AB000003.1", "ATGTTTTGA"),
+                          ("AB000001.2", "ATGGGGGGGTAA")])
+    index = AccessionIndex(fname, f"{tmp_path}/index")
+    '''Later duplicate replaces the earlier record but keeps its position'''
+    assert list(index.keys()) == ["AB000001", "AB000002", "AB000003"]
+    assert str(index.get_record("AB000001").seq) == "ATGGGGGGGTAA"
+    assert index.seq_length("AB000001") == 12
+    '''RNA is back-transcribed on read'''
+    assert str(index.records()["AB000002"].seq) == "ATGCCCTAG"
+    assert "AB000004" not in index.records()
+
+    '''Reopening reuses the index; a pickled copy (as sent to workers) reopens its own handles'''
+    mtime = os.path.getmtime(index.index_fname)
+    reopened = pickle.loads(pickle.dumps(AccessionIndex(fname, f"{tmp_path}/index")))
+    assert os.path.getmtime(reopened.index_fname) == mtime
+    assert str(reopened.get_record("AB000003").seq) == "ATGTTTTGA"
+
+def test_changed_input_is_reindexed(tmp_path):
+    fname = f"{tmp_path}/seqs.fasta"
+    write_records(fname, [("AB000001.1", "ATGAAATAA")])
+    old = AccessionIndex(fname, f"{tmp_path}/index")
+    write_records(fname, [("AB000001.2", "ATGCCCCCCTAA"), ("AB000005.1", "ATGTAA")])
+    new = AccessionIndex(fname, f"{tmp_path}/index")
+    assert new.index_fname != old.index_fname
+    assert list(new.keys()) == ["AB000001", "AB000005"]
+    assert str(new.get_record("AB000001").seq) == "ATGCCCCCCTAA"
+
+def test_normalise_accession():
+    assert normalise_accession("AB000001.3") == "AB000001"
+    assert normalise_accession("AB000001") == "AB000001"
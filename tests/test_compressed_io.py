@@ -0,0 +1,76 @@
+import gzip
+import os
+import pytest
+from Bio import bgzf
+
+from app.utils.accession_index import AccessionIndex
+from app.utils.compressed_io import is_gzipped, is_bgzf, strip_compression_ext, open_text, indexable_seq_file, append_file
+from app.utils.sequence_store import SequenceStore
+
+RECORDS = ">AB000001.1\nATGAAATAA\n>AB000002.1\nATGCCCTAG\n"
+EXTRA = ">AB000003.1\nATGGGGTGA\n"
+
+def write_seqs(fname, content, compression) -> None:
+    if compression == "gzip":
+        with gzip.open(fname, "wt") as f:
+            f.write(content)
+    elif compression == "bgzf":
+        with bgzf.BgzfWriter(fname, "wb") as f:
+            f.write(content.encode())
+    else:
+        with open(fname, "w") as f:
+            f.write(content)
+
+@pytest.mark.parametrize("compression", ["plain", "gzip", "bgzf"])
+def test_compression_detected_from_content(tmp_path, compression):
+    '''Extension deliberately doesn't say'''
+    fname = f"{tmp_path}/seqs.fasta"
+    write_seqs(fname, RECORDS, compression)
+    assert is_gzipped(fname) == (compression != "plain")
+    assert is_bgzf(fname) == (compression == "bgzf")
+    with open_text(fname) as f:
+        assert f.read() == RECORDS
+
+def test_strip_compression_ext():
+    assert strip_compression_ext("seqs.fasta.gz") == "seqs.fasta"
+    assert strip_compression_ext("seqs.gb.bgz") == "seqs.gb"
+    assert strip_compression_ext("seqs.fasta") == "seqs.fasta"
+
+def test_plain_gzip_recompressed_once_per_content(tmp_path):
+    plain, bgz, gz = f"{tmp_path}/a.fasta", f"{tmp_path}/b.fasta.bgz", f"{tmp_path}/c.fasta.gz"
+    write_seqs(plain, RECORDS, "plain")
+    write_seqs(bgz, RECORDS, "bgzf")
+    write_seqs(gz, RECORDS, "gzip")
+    assert indexable_seq_file(plain, f"{tmp_path}/bgzf") == plain
+    assert indexable_seq_file(bgz, f"{tmp_path}/bgzf") == bgz
+    copy = indexable_seq_file(gz, f"{tmp_path}/bgzf")
+    assert is_bgzf(copy)
+    with open_text(copy) as f:
+        assert f.read() == RECORDS
+    mtime = os.path.getmtime(copy)
+    assert indexable_seq_file(gz, f"{tmp_path}/bgzf") == copy and os.path.getmtime(copy) == mtime
+    write_seqs(gz, RECORDS + EXTRA, "gzip")
+    assert indexable_seq_file(gz, f"{tmp_path}/bgzf") != copy
+
+@pytest.mark.parametrize("compression", ["plain", "gzip", "bgzf"])
+def test_append_file_keeps_destination_format(tmp_path, compression):
+    dst, src = f"{tmp_path}/seqs.fasta.gz", f"{tmp_path}/new.fasta"
+    write_seqs(dst, RECORDS, compression)
+    write_seqs(src, EXTRA, "plain")
+    append_file(src, dst)
+    assert is_gzipped(dst) == (compression != "plain") and is_bgzf(dst) == (compression == "bgzf")
+    with open_text(dst) as f:
+        assert f.read() == RECORDS + EXTRA
+
+@pytest.mark.parametrize("compression", ["gzip", "bgzf"])
+def test_stores_read_compressed_inputs_and_pick_up_appends(tmp_path, compression):
+    fname, src = f"{tmp_path}/seqs.fasta.gz", f"{tmp_path}/new.fasta"
+    write_seqs(fname, RECORDS, compression)
+    index, store = AccessionIndex(fname, f"{tmp_path}/index"), SequenceStore(fname, f"{tmp_path}/store")
+    assert str(index.get_record("AB000002").seq) == store.seq_str("AB000002") == "ATGCCCTAG"
+
+    write_seqs(src, EXTRA, "plain")
+    append_file(src, fname)
+    index, store = AccessionIndex(fname, f"{tmp_path}/index"), SequenceStore(fname, f"{tmp_path}/store")
+    assert list(index.keys()) == list(store.keys()) == ["AB000001", "AB000002", "AB000003"]
+    assert str(index.get_record("AB000003").seq) == store.seq_str("AB000003") == "ATGGGGTGA"
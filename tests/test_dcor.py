@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from app.utils.dcor import UNIVARIATE_DIRECT_MAX_N, dcor, dcor_reference, dcor_univariate
+
+def random_pair(rng, n, kind):
+    x, y = rng.random(n), rng.random(n)
+    if kind == "tied":
+        x, y = np.round(x * 3), np.round(y * 2)
+    elif kind == "sparse":
+        '''Mostly zero, like PPHMM location vectors'''
+        x[rng.random(n) < 0.6], y[rng.random(n) < 0.6] = 0, 0
+    elif kind == "dependent":
+        y = 2 * x + rng.random(n) * 0.01
+    return x.reshape(-1, 1), y.reshape(-1, 1)
+
+SIZES = [2, 3, 17, UNIVARIATE_DIRECT_MAX_N - 1, UNIVARIATE_DIRECT_MAX_N, UNIVARIATE_DIRECT_MAX_N + 1, 2 * UNIVARIATE_DIRECT_MAX_N + 5, 600]
+
+@pytest.mark.parametrize("kind", ["random", "tied", "sparse", "dependent"])
+@pytest.mark.parametrize("n", SIZES)
+def test_univariate_matches_reference(n, kind):
+    rng = np.random.default_rng(n)
+    for _ in range(5):
+        X, Y = random_pair(rng, n, kind)
+        assert dcor_univariate(X, Y) == pytest.approx(dcor_reference(X, Y), abs=1e-10)
+        assert dcor(X, Y) == dcor_univariate(X, Y)
+
+@pytest.mark.parametrize("n", SIZES)
+def test_constant_vectors_have_zero_dcor(n):
+    rng = np.random.default_rng(n)
+    x, constant = rng.random((n, 1)), np.full((n, 1), 7.0)
+    for X, Y in [(x, constant), (constant, x), (constant, constant), (np.zeros((n, 1)), x)]:
+        assert dcor_reference(X, Y) == 0.0
+        assert dcor_univariate(X, Y) == 0.0
+
+def test_all_tied_but_one():
+    '''Heaviest case for the dominance sums: every pair but one has a zero distance in y'''
+    n = 3 * UNIVARIATE_DIRECT_MAX_N
+    rng = np.random.default_rng(0)
+    X, Y = rng.random((n, 1)), np.zeros((n, 1))
+    Y[n // 2] = 1.0
+    assert dcor_univariate(X, Y) == pytest.approx(dcor_reference(X, Y), abs=1e-10)
+
+def test_fewer_than_two_points():
+    assert dcor_univariate(np.zeros((0, 1)), np.zeros((0, 1))) == 0.0
+    assert dcor_univariate(np.ones((1, 1)), np.ones((1, 1))) == 0.0
+
+def test_multivariate_uses_reference():
+    rng = np.random.default_rng(0)
+    X, Y = rng.random((40, 3)), rng.random((40, 1))
+    assert dcor(X, Y) == dcor_reference(X, Y)
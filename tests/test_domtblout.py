@@ -0,0 +1,29 @@
+import pytest
+
+from app.utils.parallel_sig_generator import read_domtblout
+
+def domtbl_line(Target, Query, QueryLen, Score, C_EValue, Desc):
+    Fields = [Target, "-", "300", Query, "-", str(QueryLen), "1e-20", str(Score), "0.0", "1", "1", str(C_EValue), "1e-10",
+              "50.0", "0.0", "1", "100", "5", "105", "5", "105", "0.95", Desc]
+    return " ".join(Fields) + "\n"
+
+HEADER = "# target name accession tlen query name ...\n#-------\n"
+
+def test_hits_of_every_genome_in_batch_are_read(tmp_path):
+    fname = tmp_path / "out.txt"
+    fname.write_text(HEADER
+                     + domtbl_line("PPHMM_0", "0|AB000001_START3", 120, 55.2, 1e-12, "Polymerase|x y")
+                     + "\n"
+                     + domtbl_line("PPHMM_4", "1|AB000002_START9", 80, 21.0, 1e-5, "-")
+                     + "# [ok]\n")
+    assert read_domtblout(str(fname)) == [("PPHMM_0", "0|AB000001_START3", 120, 55.2, 1e-12, "Polymerase|x y"),
+                                          ("PPHMM_4", "1|AB000002_START9", 80, 21.0, 1e-5, "-")]
+
+def test_malformed_line_raises_rather_than_dropping_later_hits(tmp_path):
+    fname = tmp_path / "out.txt"
+    fname.write_text(HEADER
+                     + domtbl_line("PPHMM_0", "0|AB000001_START3", 120, 55.2, 1e-12, "Polymerase")
+                     + "PPHMM_2 - 300 0|AB000001_START3 - 120\n"
+                     + domtbl_line("PPHMM_4", "1|AB000002_START9", 80, 21.0, 1e-5, "-"))
+    with pytest.raises(SystemExit, match="Malformed hmmscan domain table line"):
+        read_domtblout(str(fname))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from app.utils.scrape_vmr import construct_first_pass_groupings
+
+THRESHOLD = 10
+
+def first_pass_grouping_reference(row, df, threshold):
+    '''Row-wise, O(N^2) grouping that construct_first_pass_groupings replaced'''
+    if df[df["Family"] == row["Family"]].shape[0] >= threshold:
+        return row["Family"]
+    else:
+        if df[df["Genus"] == row["Genus"]].shape[0] >= threshold:
+            return row["Genus"]
+        else:
+            return row["Species"]
+
+def synthetic_vmr(n_rows, seed=0) -> pd.DataFrame:
+    '''Realistic family/genus/species hierarchy, incl. genomes with no family or genus'''
+    rng = np.random.default_rng(seed)
+    genus = rng.zipf(1.5, n_rows) % max(1, n_rows // 8)
+    family = genus // 6
+    df = pd.DataFrame({"Family": [f"Family{i}viridae" for i in family],
+                       "Genus": [f"Genus{i}virus" for i in genus],
+                       "Species": [f"Species{i}" for i in range(n_rows)]})
+    df.loc[rng.random(n_rows) < 0.05, "Family"] = np.nan
+    df.loc[rng.random(n_rows) < 0.02, "Genus"] = np.nan
+    return df
+
+def test_matches_row_wise_reference():
+    for n_rows, seed in [(50, 0), (400, 1), (1500, 2)]:
+        df = synthetic_vmr(n_rows, seed)
+        reference = df.apply(lambda x: first_pass_grouping_reference(x, df, THRESHOLD), axis=1)
+        assert construct_first_pass_groupings(df, THRESHOLD).astype(str).tolist() == reference.astype(str).tolist()
+
+def test_threshold_boundary():
+    df = pd.DataFrame({"Family": ["F1"] * 3 + ["F2"] * 2 + [np.nan] * 2,
+                       "Genus": ["G1"] * 3 + ["G2", "G3"] + [np.nan, "G3"],
+                       "Species": [f"S{i}" for i in range(7)]})
+    assert construct_first_pass_groupings(df, 3).tolist() == ["F1", "F1", "F1", "S3", "S4", "S5", "S6"]
+    assert construct_first_pass_groupings(df, 2).tolist() == ["F1", "F1", "F1", "F2", "F2", "S5", "G3"]
@@ -0,0 +1,68 @@
+import os
+import pytest
+
+from app.utils.download_genbank_file import DownloadGenBankFile
+
+BATCH_SIZE = 4
+
+def download(server, fname, SeqIDs, **payload):
+    payload = {"UseCache": False, "EntrezBaseUrl": server.url, "GenBankBatchSize": BATCH_SIZE, "GenBankDownloadWorkers": 3,
+               "GenBankRetryBackoff": 0.001, "GenBankRateLimit": 200, **payload}
+    server.requests, server.request_times = [], []
+    DownloadGenBankFile(fname, [[SeqID] for SeqID in SeqIDs], "name@provider.com", payload)
+    with open(fname) as f:
+        return f.read()
+
+def test_batches_in_accession_order(tmp_path, efetch_server):
+    SeqIDs = list(efetch_server.records)
+    '''Duplicates and blanks dropped; unversioned accessions fetched as given'''
+    out = download(efetch_server, f"{tmp_path}/seqs.gb", [s.split(".")[0] for s in SeqIDs] + [SeqIDs[0].split(".")[0], " "])
+    assert out == "".join(efetch_server.records.values())
+    assert len(efetch_server.requests) == -(-len(SeqIDs) // BATCH_SIZE)
+    assert sorted(efetch_server.requests) == [[s.split(".")[0] for s in SeqIDs[i:i + BATCH_SIZE]] for i in range(0, len(SeqIDs), BATCH_SIZE)]
+    assert not os.path.exists(f"{tmp_path}/seqs.gb.parts")
+
+@pytest.mark.parametrize("statuses", [[429], [500, 503], [502, 504, 200]])
+def test_transient_failures_are_retried(tmp_path, efetch_server, statuses):
+    '''200 = truncated response, which must also be refetched'''
+    SeqIDs = list(efetch_server.records)
+    efetch_server.errors = {SeqIDs[BATCH_SIZE]: list(statuses), SeqIDs[3 * BATCH_SIZE]: [statuses[0]]}
+    out = download(efetch_server, f"{tmp_path}/seqs.gb", SeqIDs)
+    assert out == "".join(efetch_server.records.values())
+    assert [Batch[0] for Batch in efetch_server.requests].count(SeqIDs[BATCH_SIZE]) == len(statuses) + 1
+    assert len(efetch_server.requests) == -(-len(SeqIDs) // BATCH_SIZE) + len(statuses) + 1
+
+def test_retries_give_up(tmp_path, efetch_server):
+    SeqIDs = list(efetch_server.records)
+    efetch_server.errors = {SeqIDs[0]: [503] * 3}
+    with pytest.raises(SystemExit, match="after 3 attempts"):
+        download(efetch_server, f"{tmp_path}/seqs.gb", SeqIDs, GenBankMaxRetries=2)
+
+def test_interrupted_download_resumes_from_manifest(tmp_path, efetch_server):
+    '''A 400 isn't retried and stops the download; the next attempt only fetches batches not yet completed'''
+    SeqIDs = list(efetch_server.records)
+    N_Batches = -(-len(SeqIDs) // BATCH_SIZE)
+    efetch_server.invalid_id = SeqIDs[-1]
+    with pytest.raises(SystemExit, match="HTTP 400"):
+        download(efetch_server, f"{tmp_path}/seqs.gb", SeqIDs, GenBankDownloadWorkers=1)
+    assert len(efetch_server.requests) == N_Batches
+    assert os.path.isfile(f"{tmp_path}/seqs.gb.parts/manifest.json") and not os.path.exists(f"{tmp_path}/seqs.gb")
+
+    efetch_server.invalid_id = None
+    out = download(efetch_server, f"{tmp_path}/seqs.gb", SeqIDs)
+    assert efetch_server.requests == [SeqIDs[(N_Batches - 1) * BATCH_SIZE:]]
+    assert out == "".join(efetch_server.records.values())
+
+    '''A different accession list doesn't reuse the parts of another'''
+    efetch_server.invalid_id = SeqIDs[-1]
+    with pytest.raises(SystemExit):
+        download(efetch_server, f"{tmp_path}/other.gb", SeqIDs[1:], GenBankDownloadWorkers=1)
+    efetch_server.invalid_id = None
+    assert download(efetch_server, f"{tmp_path}/other.gb", SeqIDs[1:2]) == efetch_server.records[SeqIDs[1]]
+    assert len(efetch_server.requests) == 1
+
+def test_requests_respect_rate_limit(tmp_path, efetch_server):
+    SeqIDs = list(efetch_server.records)
+    download(efetch_server, f"{tmp_path}/seqs.gb", SeqIDs, GenBankRateLimit=25, GenBankDownloadWorkers=4)
+    Times = sorted(efetch_server.request_times)
+    assert Times[-1] - Times[0] >= 0.8 * (len(Times) - 1) / 25
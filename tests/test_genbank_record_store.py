@@ -0,0 +1,63 @@
+import itertools
+import os
+
+from app.utils import genbank_record_store
+from app.utils.genbank_record_store import GenBankRecordStore, get_genbank_record_store, SQLITE_MAX_VARIABLES
+from tests.test_genbank_download import download
+
+def genbank_record(AccVersion, Body="ORIGIN\n        1 acgt\n") -> str:
+    return f"LOCUS       {AccVersion.split('.')[0]}\nACCESSION   {AccVersion.split('.')[0]}\nVERSION     {AccVersion}\n{Body}//\n"
+
+def add_records(store, tmp_path, AccVersions, **kwargs) -> None:
+    fname = f"{tmp_path}/download.gb"
+    with open(fname, "w") as f:
+        f.write("".join(genbank_record(AccVersion, **kwargs) for AccVersion in AccVersions))
+    store.add_file(fname)
+
+def test_unversioned_accession_resolves_to_latest_version(tmp_path):
+    store = GenBankRecordStore(f"{tmp_path}/store", 1024 ** 3)
+    add_records(store, tmp_path, ["AB000001.2", "AB000001.10", "AB000001.9", "AB000002.1"])
+    assert store.find(["AB000001", "ab000001.2", "AB000001.3", "AB000002", "AB000003"]) == \
+        {"AB000001": "AB000001.10", "ab000001.2": "AB000001.2", "AB000002": "AB000002.1"}
+    assert store.missing(["AB000003", "AB000002", "AB000001.3"]) == ["AB000003", "AB000001.3"]
+
+def test_find_more_accessions_than_one_query_holds(tmp_path):
+    store = GenBankRecordStore(f"{tmp_path}/store", 1024 ** 3)
+    AccVersions = [f"AB{100000 + i}.1" for i in range(2 * SQLITE_MAX_VARIABLES + 50)]
+    add_records(store, tmp_path, AccVersions[::2])
+    Found = store.find([AccVersion.split(".")[0] for AccVersion in AccVersions])
+    assert list(Found.values()) == AccVersions[::2]
+
+def test_assemble_in_requested_order(tmp_path):
+    store = GenBankRecordStore(f"{tmp_path}/store", 1024 ** 3)
+    add_records(store, tmp_path, ["AB000001.1", "AB000002.1", "AB000003.1"])
+    add_records(store, tmp_path, ["AB000002.2"])
+    Missing = store.assemble(["AB000003", "AB000009", "AB000001.1", "AB000002"], f"{tmp_path}/seqs.gb")
+    assert Missing == ["AB000009"]
+    with open(f"{tmp_path}/seqs.gb") as f:
+        assert f.read() == genbank_record("AB000003.1") + genbank_record("AB000001.1") + genbank_record("AB000002.2")
+
+def test_lru_eviction_against_max_gb(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(genbank_record_store.time, "time", lambda: next(clock))
+    RecordSize = len(genbank_record("AB000001.1"))
+    store = get_genbank_record_store({"CacheDir": f"{tmp_path}/cache", "GenBankStoreMaxGB": 3 * RecordSize / 1024 ** 3})
+    add_records(store, tmp_path, ["AB000001.1", "AB000002.1", "AB000003.1", "AB000004.1", "AB000005.1"])
+    store.assemble(["AB000004", "AB000001"], f"{tmp_path}/a.gb")
+    store.assemble(["AB000002"], f"{tmp_path}/b.gb")
+    store.evict()
+    '''3 and 5 were used least recently'''
+    assert store.missing(["AB000001", "AB000002", "AB000003", "AB000004", "AB000005"]) == ["AB000003", "AB000005"]
+    assert not any(os.path.isfile(f"{store.store_dir}/{store.record_fname(AccVersion)}") for AccVersion in ["AB000003.1", "AB000005.1"])
+    store.evict()
+    assert store.missing(["AB000001", "AB000002", "AB000004"]) == []
+
+def test_download_only_fetches_records_not_in_store(tmp_path, efetch_server):
+    SeqIDs = list(efetch_server.records)
+    payload = {"UseCache": True, "CacheDir": f"{tmp_path}/cache"}
+    assert download(efetch_server, f"{tmp_path}/exp1.gb", SeqIDs[:20], **payload) == "".join(list(efetch_server.records.values())[:20])
+    out = download(efetch_server, f"{tmp_path}/exp2.gb", [SeqID.split(".")[0] for SeqID in SeqIDs[10:]], **payload)
+    assert out == "".join(list(efetch_server.records.values())[10:])
+    assert sorted(SeqID for Batch in efetch_server.requests for SeqID in Batch) == [SeqID.split(".")[0] for SeqID in SeqIDs[20:]]
+    download(efetch_server, f"{tmp_path}/exp3.gb", SeqIDs, **payload)
+    assert efetch_server.requests == []
@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.utils.gom_candidates import candidate_gom_mask
+from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor
+from app.utils.gomdb_constructor import GOMDB_Constructor
+
+def synthetic_viruses(rng, Templates, Groups, N_PPHMMs, drop=0.2, jitter=200):
+    '''Members of the given groups: their group's PPHMMs (some dropped), at jittered locations; signature score where present'''
+    LocationTable = np.zeros((len(Groups), N_PPHMMs))
+    for Virus_i, Group in enumerate(Groups):
+        PPHMMs, Locations = Templates[Group]
+        Kept = rng.random(len(PPHMMs)) > drop
+        LocationTable[Virus_i, PPHMMs[Kept]] = Locations[Kept] + rng.normal(0, jitter, Kept.sum())
+    LocationTable = np.abs(LocationTable)
+    SignatureTable = (LocationTable > 0) * (rng.random(LocationTable.shape) * 100 + 1)
+    return SignatureTable, LocationTable
+
+def synthetic_set(rng, N_GOMs, N_Refs, N_Queries, N_Orphans, N_PPHMMs=600, N_Shared=40, PPHMMsPerGroup=15):
+    '''
+    Each group draws its PPHMMs from the first N_PPHMMs - N_Shared columns plus a pool of N_Shared common ones;
+    orphan queries only hit the last columns, which no reference uses
+    '''
+    Templates = []
+    for _ in range(N_GOMs):
+        PPHMMs = np.unique(np.concatenate((rng.choice(N_PPHMMs - N_Shared - 20, PPHMMsPerGroup - 3, replace=False),
+                                           N_PPHMMs - N_Shared - 20 + rng.choice(N_Shared, 3, replace=False))))
+        Templates.append((PPHMMs, rng.random(len(PPHMMs)) * 10000 + 500))
+    RefGroups, QueryGroups = rng.integers(0, N_GOMs, N_Refs), rng.integers(0, N_GOMs, N_Queries)
+    RefSignatureTable, RefLocationTable = synthetic_viruses(rng, Templates, RefGroups, N_PPHMMs)
+    QuerySignatureTable, QueryLocationTable = synthetic_viruses(rng, Templates, QueryGroups, N_PPHMMs)
+    OrphanPPHMMs = np.arange(N_PPHMMs - 20, N_PPHMMs)
+    QuerySignatureTable[-N_Orphans:], QueryLocationTable[-N_Orphans:] = 0, 0
+    for Virus_i in range(N_Queries - N_Orphans, N_Queries):
+        Hits = rng.choice(OrphanPPHMMs, 5, replace=False)
+        QueryLocationTable[Virus_i, Hits], QuerySignatureTable[Virus_i, Hits] = rng.random(5) * 10000 + 1, rng.random(5) * 100 + 1
+    RefTaxoGroupingList = np.array([f"Group_{i}" for i in RefGroups])
+    return RefSignatureTable, RefLocationTable, RefTaxoGroupingList, QuerySignatureTable, QueryLocationTable, QueryGroups
+
+def test_orphans_keep_every_group_and_others_get_top_k():
+    rng = np.random.default_rng(0)
+    N_GOMs, N_Queries, N_Orphans, TopK = 20, 60, 6, 4
+    RefSignatureTable, _, RefTaxoGroupingList, QuerySignatureTable, _, QueryGroups = synthetic_set(rng, N_GOMs, 200, N_Queries, N_Orphans, N_PPHMMs=300)
+    GOMIDList = [f"Group_{i}" for i in range(N_GOMs)]
+    Mask = candidate_gom_mask(QuerySignatureTable, RefSignatureTable, RefTaxoGroupingList, GOMIDList, TopK)
+    assert Mask[-N_Orphans:].all()
+    Matched = slice(0, N_Queries - N_Orphans)
+    assert (Mask[Matched].sum(axis=1) >= TopK).all()
+    assert Mask[np.arange(N_Queries)[Matched], QueryGroups[Matched]].all()
+
+    '''Viruses with no hits at all have nothing to rank on either'''
+    NoHits = np.zeros((2, QuerySignatureTable.shape[1]))
+    assert candidate_gom_mask(NoHits, RefSignatureTable, RefTaxoGroupingList, GOMIDList, TopK).all()
+
+def test_top_k_at_least_n_groups_selects_all():
+    rng = np.random.default_rng(1)
+    RefSignatureTable, _, RefTaxoGroupingList, QuerySignatureTable, _, _ = synthetic_set(rng, 5, 40, 10, 2, N_PPHMMs=120)
+    GOMIDList = [f"Group_{i}" for i in range(5)]
+    assert candidate_gom_mask(QuerySignatureTable, RefSignatureTable, RefTaxoGroupingList, GOMIDList, 5).all()
+
+def test_candidate_pairs_scored_as_without_mask():
+    rng = np.random.default_rng(2)
+    N_GOMs = 15
+    RefSignatureTable, RefLocationTable, RefTaxoGroupingList, QuerySignatureTable, QueryLocationTable, _ = \
+        synthetic_set(rng, N_GOMs, 150, 40, 4, N_PPHMMs=300)
+    GOMIDList = [f"Group_{i}" for i in range(N_GOMs)]
+    GOMDB = GOMDB_Constructor(RefTaxoGroupingList, RefLocationTable, GOMIDList)
+    Mask = candidate_gom_mask(QuerySignatureTable, RefSignatureTable, RefTaxoGroupingList, GOMIDList, 3)
+    Full = GOMSignatureTable_Constructor(QueryLocationTable, GOMDB, GOMIDList)
+    Pruned = GOMSignatureTable_Constructor(QueryLocationTable, GOMDB, GOMIDList, CandidateMask=Mask)
+    np.testing.assert_array_equal(Pruned[Mask], Full[Mask])
+    assert (Pruned[~Mask] == 0).all()
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+
+from app.utils.dcor import dcor
+from app.utils.gom_signature_table_constructor import GOMSignatureTable_Constructor, GOMScoringPool
+from app.utils.gomdb_constructor import GOMDB_Constructor
+
+def generate_gom_sigs(GOM, PPHMMLocationTable, GOMDB):
+    '''Reference: the original per-virus dcor loop, over a dense {GOMID: location matrix} GOMDB'''
+    GOMSignatureList = []
+    for PPHMMLocation in PPHMMLocationTable:
+        RelevantPPHMMIndices = np.where(list(map(any, list(
+            zip(list(map(any, GOMDB[GOM].transpose() != 0)), PPHMMLocation != 0)))))[0]
+        GOMSignatureList.append(dcor(
+            GOMDB[GOM][:, RelevantPPHMMIndices].T, PPHMMLocation[RelevantPPHMMIndices].reshape(-1, 1)))
+    return GOMSignatureList
+
+def synthetic_gomdb(rng, N_Viruses, N_PPHMMs, N_GOMs, density=0.1):
+    PPHMMLocationTable = rng.random((N_Viruses, N_PPHMMs)) * 10000 * (rng.random((N_Viruses, N_PPHMMs)) < density)
+    TaxoGroupingList = np.array([f"Group_{i}" for i in rng.integers(0, N_GOMs, N_Viruses)])
+    GOMIDList = [f"Group_{i}" for i in range(N_GOMs)]
+    return PPHMMLocationTable, TaxoGroupingList, GOMIDList
+
+def reference_table(PPHMMLocationTable, GOMDB, GOMIDList):
+    DenseGOMDB = GOMDB.dense()
+    return np.column_stack([generate_gom_sigs(GOMID, PPHMMLocationTable, DenseGOMDB) for GOMID in GOMIDList])
+
+def assert_matches_reference(table, reference):
+    assert np.array_equal(np.isnan(table), np.isnan(reference))
+    np.testing.assert_allclose(np.nan_to_num(table), np.nan_to_num(reference), rtol=0, atol=1e-10)
+
+def test_serial_and_pool_match_reference():
+    rng = np.random.default_rng(0)
+    PPHMMLocationTable, TaxoGroupingList, GOMIDList = synthetic_gomdb(rng, 60, 50, 6)
+    GOMDB = GOMDB_Constructor(TaxoGroupingList, PPHMMLocationTable, GOMIDList)
+    reference = reference_table(PPHMMLocationTable, GOMDB, GOMIDList)
+    for N_CPUs in [1, 2]:
+        assert_matches_reference(GOMSignatureTable_Constructor(PPHMMLocationTable, GOMDB, GOMIDList, N_CPUs=N_CPUs), reference)
+
+def test_pool_and_scratch_dir_shared_across_calls_then_removed():
+    '''As across bootstrap replicates: each call's arrays replace the last's in one scratch dir'''
+    rng = np.random.default_rng(1)
+    PPHMMLocationTable, TaxoGroupingList, GOMIDList = synthetic_gomdb(rng, 50, 40, 5)
+    with GOMScoringPool(2) as GOMPool:
+        Pool, ScratchDir = GOMPool.pool, GOMPool.scratch_dir
+        for _ in range(3):
+            Columns = rng.choice(PPHMMLocationTable.shape[1], PPHMMLocationTable.shape[1])
+            Bootstrapped = PPHMMLocationTable[:, Columns]
+            GOMDB = GOMDB_Constructor(TaxoGroupingList, Bootstrapped, GOMIDList)
+            table = GOMSignatureTable_Constructor(Bootstrapped, GOMDB, GOMIDList, N_CPUs=2, GOMPool=GOMPool)
+            assert_matches_reference(table, reference_table(Bootstrapped, GOMDB, GOMIDList))
+            assert GOMPool.pool is Pool and GOMPool.scratch_dir == ScratchDir
+        assert GOMPool.n_calls == 3
+    assert GOMPool.pool is None and not os.path.exists(ScratchDir)
+
+def test_serial_pool_starts_nothing():
+    with GOMScoringPool(1) as GOMPool:
+        assert GOMPool.pool is None and GOMPool.scratch_dir is None
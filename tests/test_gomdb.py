@@ -0,0 +1,77 @@
+import numpy as np
+
+from app.utils.gomdb_constructor import GOMDB_Constructor
+
+def reference_set(rng, N_Viruses, N_PPHMMs=30, N_GOMs=5):
+    '''(TaxoGroupingList, PPHMMLocationTable, MemberKeys) of a synthetic reference set'''
+    TaxoGroupingList = np.array([f"Group_{i}" for i in rng.integers(0, N_GOMs, N_Viruses)])
+    PPHMMLocationTable = rng.random((N_Viruses, N_PPHMMs)) * 10000 * (rng.random((N_Viruses, N_PPHMMs)) < 0.2)
+    return TaxoGroupingList, PPHMMLocationTable, [f"AB{100000 + i}" for i in range(N_Viruses)]
+
+def assert_same_db(GOMDB, Rebuilt):
+    assert list(GOMDB.keys()) == list(Rebuilt.keys())
+    for GOMID in Rebuilt:
+        np.testing.assert_array_equal(GOMDB[GOMID].toarray(), Rebuilt[GOMID].toarray())
+        assert GOMDB.members[GOMID] == Rebuilt.members[GOMID] and GOMDB.digests[GOMID] == Rebuilt.digests[GOMID]
+
+def test_dense_matches_row_selection():
+    TaxoGroupingList, PPHMMLocationTable, _ = reference_set(np.random.default_rng(0), 40)
+    GOMIDList = ["Group_3", "Group_0", "Group_1"]
+    Dense = GOMDB_Constructor(TaxoGroupingList, PPHMMLocationTable, GOMIDList).dense()
+    assert list(Dense) == GOMIDList
+    for GOMID in GOMIDList:
+        np.testing.assert_array_equal(Dense[GOMID], PPHMMLocationTable[TaxoGroupingList == GOMID])
+
+def edited_set(rng, TaxoGroupingList, PPHMMLocationTable, MemberKeys):
+    '''Remove some genomes, move one to another group, revise one's locations, and append new ones'''
+    Keep = np.ones(len(MemberKeys), dtype=bool)
+    Keep[[2, 11, 25]] = False
+    TaxoGroupingList, PPHMMLocationTable = TaxoGroupingList[Keep].copy(), PPHMMLocationTable[Keep].copy()
+    MemberKeys = [Key for Key, Kept in zip(MemberKeys, Keep) if Kept]
+    TaxoGroupingList[5] = "Group_1" if TaxoGroupingList[5] != "Group_1" else "Group_2"
+    PPHMMLocationTable[8, :3] += 1.0
+    NewTaxo, NewLocations, _ = reference_set(rng, 4)
+    return (np.concatenate((TaxoGroupingList, NewTaxo)), np.vstack((PPHMMLocationTable, NewLocations)),
+            MemberKeys + [f"NEW{i}" for i in range(4)])
+
+def test_update_equals_rebuild_and_keeps_unchanged_groups():
+    rng = np.random.default_rng(1)
+    Old = reference_set(rng, 40)
+    GOMIDList = [f"Group_{i}" for i in range(5)]
+    GOMDB = GOMDB_Constructor(*Old[:2], GOMIDList, MemberKeys=Old[2])
+    Unchanged = dict(GOMDB.items())
+    New = edited_set(rng, *Old)
+    Rebuilt = GOMDB.update(*New[:2], GOMIDList + ["Group_9"], MemberKeys=New[2])
+    assert_same_db(GOMDB, GOMDB_Constructor(*New[:2], GOMIDList + ["Group_9"], MemberKeys=New[2]))
+    for GOMID in GOMIDList:
+        assert (GOMDB[GOMID] is Unchanged[GOMID]) == (GOMID not in Rebuilt)
+    assert GOMDB.update(*New[:2], GOMIDList + ["Group_9"], MemberKeys=New[2]) == []
+
+def test_remove_and_add_genomes_equal_rebuild():
+    rng = np.random.default_rng(2)
+    TaxoGroupingList, PPHMMLocationTable, MemberKeys = reference_set(rng, 40)
+    GOMIDList = [f"Group_{i}" for i in range(5)]
+    GOMDB = GOMDB_Constructor(TaxoGroupingList, PPHMMLocationTable, GOMIDList, MemberKeys=MemberKeys)
+    Removed = {MemberKeys[3], MemberKeys[17], MemberKeys[30]}
+    Changed = GOMDB.remove_genomes(Removed)
+    assert sorted(Changed) == sorted(set(TaxoGroupingList[[3, 17, 30]]))
+
+    '''Added genomes go to the end of their groups, as they would at the end of the table'''
+    NewTaxo, NewLocations, _ = reference_set(rng, 6)
+    NewKeys = [f"NEW{i}" for i in range(6)]
+    GOMDB.add_genomes(NewTaxo, NewLocations, NewKeys)
+    Keep = np.array([Key not in Removed for Key in MemberKeys])
+    assert_same_db(GOMDB, GOMDB_Constructor(np.concatenate((TaxoGroupingList[Keep], NewTaxo)), np.vstack((PPHMMLocationTable[Keep], NewLocations)),
+                                            GOMIDList, MemberKeys=[Key for Key, Kept in zip(MemberKeys, Keep) if Kept] + NewKeys))
+
+def test_apply_changes_equals_rebuild():
+    rng = np.random.default_rng(3)
+    Old = reference_set(rng, 40)
+    GOMIDList = [f"Group_{i}" for i in range(5)]
+    GOMDB = GOMDB_Constructor(*Old[:2], GOMIDList, MemberKeys=Old[2])
+    New = edited_set(rng, *Old)
+    ChangedKeys = {Old[2][2], Old[2][11], Old[2][25], New[2][5], New[2][8]} | set(New[2][-4:])
+    '''A group dropped from GOMIDList (e.g. now unclassified) goes too'''
+    NewGOMIDList = GOMIDList[1:]
+    GOMDB.apply_changes(*New[:2], NewGOMIDList, New[2], ChangedKeys)
+    assert_same_db(GOMDB, GOMDB_Constructor(*New[:2], NewGOMIDList, MemberKeys=New[2]))
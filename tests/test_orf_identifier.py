@@ -0,0 +1,25 @@
+import random
+from Bio.Seq import Seq
+
+from app.utils.orf_identifier import find_orfs, find_orfs_scalar
+
+def random_seq(seed, length, letters="ACGT"):
+    random.seed(seed)
+    return Seq("".join(random.choices("ACGT", weights=[0.35, 0.15, 0.15, 0.35], k=length - 200)) + "".join(random.choices(letters, k=200)))
+
+def as_tuples(out):
+    ProtList, ProtIDList, raw_nas = out
+    return [str(i.seq) for i in ProtList], [i.id for i in ProtList], ProtIDList, raw_nas
+
+def test_vectorised_matches_scalar():
+    '''Incl. ambiguity codes, lower case and a length that isn't a multiple of 3'''
+    for seed, letters, TranslTable in [(0, "ACGT", 1), (1, "ACGTNRY", 11), (2, "acgtn", 4), (3, "ACGT", 5)]:
+        seq = random_seq(seed, 20001, letters)
+        for call_locs in [False, True]:
+            assert as_tuples(find_orfs("AB000001", seq, TranslTable, 30, call_locs)) == \
+                as_tuples(find_orfs_scalar("AB000001", seq, TranslTable, 30, call_locs)), (seed, call_locs)
+
+def test_non_iupac_sequence_falls_back_to_scalar():
+    '''RNA letters aren't in IUPAC_DNA'''
+    seq = Seq(str(random_seq(4, 6000)).replace("T", "U", 50))
+    assert as_tuples(find_orfs("AB000002", seq, 1, 30)) == as_tuples(find_orfs_scalar("AB000002", seq, 1, 30))
@@ -0,0 +1,43 @@
+import gzip
+import pandas as pd
+from Bio import SeqIO
+
+from app.utils.process_fasta import fasta_to_genbank, get_vmr_cols
+
+FASTA = (">AB000001.1 Virus one, segment A\nATGAAACCCGGGTTTTAA\n"
+         ">AB000002.3 Virus two\nATGCCCAAAGGG\nTTTTAG\n"
+         ">AB000001.1 Virus one again\nATGTTTTAA\n"
+         ">AB000003 Virus three\nATGGGGTGA\n")
+
+def convert(tmp_path, fasta_fname):
+    payload = {"fasta_fname": fasta_fname, "genbank_fname": f"{tmp_path}/out.gb", "vmr_fname": f"{tmp_path}/vmr.csv"}
+    msg = fasta_to_genbank(payload)
+    with open(payload["genbank_fname"]) as f, open(payload["vmr_fname"]) as g:
+        return msg, f.read(), g.read()
+
+def test_streamed_conversion_drops_duplicate_accessions(tmp_path, capsys):
+    with open(f"{tmp_path}/in.fasta", "w") as f:
+        f.write(FASTA)
+    msg, genbank, vmr = convert(tmp_path, f"{tmp_path}/in.fasta")
+    assert msg == "Successfully converted 3 records"
+    assert "duplicate accession ID: AB000001.1" in capsys.readouterr().out
+
+    '''Renamed by position in the input, first of any duplicates kept'''
+    Records = list(SeqIO.parse(f"{tmp_path}/out.gb", "genbank"))
+    assert [record.name for record in Records] == ["Query_1_AB000001", "Query_2_AB000002", "Query_4_AB000003"]
+    assert [str(record.seq) for record in Records] == ["ATGAAACCCGGGTTTTAA", "ATGCCCAAAGGGTTTTAG", "ATGGGGTGA"]
+
+    '''VMR stub formatted exactly as pandas writes it'''
+    df = pd.DataFrame(columns=get_vmr_cols())
+    df["Virus GENBANK accession"] = df["Virus name(s)"] = [record.name for record in Records]
+    df["Genetic code table"] = 1
+    df["Virus isolate designation"] = ""
+    assert vmr == df.to_csv()
+
+def test_gzip_input(tmp_path):
+    with open(f"{tmp_path}/in.fasta", "w") as f:
+        f.write(FASTA)
+    with gzip.open(f"{tmp_path}/in.fasta.gz", "wt") as f:
+        f.write(FASTA)
+    plain = convert(tmp_path, f"{tmp_path}/in.fasta")
+    assert convert(tmp_path, f"{tmp_path}/in.fasta.gz") == plain
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from app.src.read_genome_desc_table import ReadGenomeDescTable
+from tests.conftest import read_vmr
+
+def reader(tmp_path, is_secondpass=False):
+    payload = {"TaxoGrouping_Header": "Genus", "AnnotateIncompleteGenomes": False, "Bootstrap": False, "CacheDir": f"{tmp_path}/cache"}
+    return ReadGenomeDescTable(payload, "vmr.csv", "seqs.fasta", f"{tmp_path}/exp", is_secondpass=is_secondpass)
+
+def test_transl_table_check(tmp_path, capsys):
+    df = pd.DataFrame({"Virus name(s)": ["a", "b", "c", "d"], "Genetic code table": [1, 11, 4, ""],
+                       "Genome coverage": ["Complete genome", "Complete coding genome", "Partial genome", "Partial genome"]})
+    r = reader(tmp_path)
+    assert r.transl_table_check(df).tolist() == [1, 1, 1, 1]
+    assert r.transl_table_errors == ["c", "d"]
+    assert "WARNING" not in capsys.readouterr().out
+
+    '''Missing columns: one warning naming the affected genomes'''
+    r = reader(tmp_path)
+    assert r.transl_table_check(df.drop(columns="Genome coverage")).tolist() == [1, 1, 1, 1]
+    out = capsys.readouterr().out
+    assert out.count("WARNING") == 1 and "3 genome(s) affected: b, c, d" in out
+    assert r.transl_table_check(df.drop(columns="Genetic code table")).tolist() == [1, 1, 1, 1]
+    assert "4 genome(s) affected" in capsys.readouterr().out
+    assert r.transl_table_errors == []
+
+def test_get_names_and_accessions(tmp_path):
+    df = pd.DataFrame({"Virus name(s)": ["Virus  one", "Virus (two)/", "Three"], "Family": ["Fam", "Fam", "Fam"],
+                       "Genus": ["Gen", "Gen", "Gen"],
+                       "Virus GENBANK accession": ["Seg1: AB000001; Seg2: AB000002", "", "unknown"]})
+    assert reader(tmp_path).get_names(df).tolist() == ["Virus one", "Virus/two", "Three"]
+    assert reader(tmp_path, is_secondpass=True).get_names(df).tolist() == ["AB000001_Fam_Gen_Virus_one", "_Fam_Gen_Virus/two", "_Fam_Gen_Three"]
+    r = reader(tmp_path)
+    assert r.get_accession(df).tolist() == ["AB000001, AB000002", "No_data_1", "unknown"]
+    assert r.no_acc_cnt == 3
+
+def test_example_vmr(tmp_path):
+    _, table = read_vmr(tmp_path)
+    assert len(table["VirusNameList"]) == 20
+    assert table["SeqIDLists"][0] == ["MZ209903"] and table["TaxoGroupingList"][0] == "Orinovirus"
+    assert set(table["TranslTableList"]) == {1}
@@ -0,0 +1,40 @@
+import os
+import pickle
+import numpy as np
+
+from app.utils.sequence_store import SequenceStore
+from tests.test_accession_index import write_records
+
+def test_round_trip(tmp_path):
+    fname = f"{tmp_path}/seqs.fasta"
+    write_records(fname, [("AB000001.1", "ATGAAATAA"), ("AB000002.1", "AUGCCCUAGCC"), ("AB000003.1", "GGGATGTTTTGA")])
+    store = SequenceStore(fname, f"{tmp_path}/store")
+    assert list(store.keys()) == ["AB000001", "AB000002", "AB000003"]
+    assert store.seq_str("AB000002") == "ATGCCCTAGCC"
+    assert store.seq("AB000001").dtype == np.uint8 and store.seq_id("AB000001") == "AB000001.1"
+
+    '''Segments concatenated longest first, named by unversioned accessions in the order given'''
+    GenomeID, GenomeSeq = store.concat_genome(["AB000001", "AB000003", "AB000002"])
+    assert GenomeID == "AB000001/AB000003/AB000002"
+    assert GenomeSeq.tobytes().decode() == "GGGATGTTTTGA" + "ATGCCCTAGCC" + "ATGAAATAA"
+
+    '''Reopened store reuses the packed file; a pickled copy (as sent to workers) maps it itself'''
+    mtime = os.path.getmtime(store.seq_fname)
+    reopened = pickle.loads(pickle.dumps(SequenceStore(fname, f"{tmp_path}/store")))
+    assert os.path.getmtime(reopened.seq_fname) == mtime
+    assert reopened.seq_str("AB000003") == "GGGATGTTTTGA"
+
+def test_changed_input_is_repacked(tmp_path):
+    fname = f"{tmp_path}/seqs.fasta"
+    write_records(fname, [("AB000001.1", "ATGAAATAA")])
+    old = SequenceStore(fname, f"{tmp_path}/store")
+    write_records(fname, [("AB000001.2", "ATGCCCCCCTAA")])
+    new = SequenceStore(fname, f"{tmp_path}/store")
+    assert new.seq_fname != old.seq_fname
+    assert new.seq_str("AB000001") == "ATGCCCCCCTAA" and new.seq_id("AB000001") == "AB000001.2"
+
+def test_empty_input(tmp_path):
+    fname = f"{tmp_path}/seqs.fasta"
+    write_records(fname, [])
+    store = SequenceStore(fname, f"{tmp_path}/store")
+    assert len(store) == 0 and len(store.buffer) == 0
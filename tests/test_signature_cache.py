@@ -0,0 +1,82 @@
+import numpy as np
+
+from app.utils.signature_cache import SignatureCache, pphmmdb_fingerprint
+from tests.conftest import genome_table, write_fasta
+
+SEQS = {"AB000001": "ATGAAACCCGGGTTTTAA" * 20, "AB000002": "ATGCCCAAAGGGTTTTAG" * 25,
+        "AB000003": "ATGGGGTTTCCCAAATGA" * 30, "AB000004": "ATGAAACCCGGGTTTTAA" * 20}
+
+def assert_tables_equal(a, b) -> None:
+    for table_a, table_b in zip(a, b):
+        np.testing.assert_array_equal(table_a, table_b)
+
+def test_cache_miss_then_hit(signature_run):
+    write_fasta(signature_run.seq_fname, SEQS)
+    genomes = genome_table([["AB000001"], ["AB000002"], ["AB000003"]])
+    first = signature_run(genomes)
+    assert sorted(signature_run.scanned) == [("AB000001",), ("AB000002",), ("AB000003",)]
+    second = signature_run(genomes)
+    assert signature_run.scanned == []
+    assert_tables_equal(first, second)
+
+def test_identical_genomes_under_different_accessions_share_entry(signature_run):
+    '''AB000004 has the same sequence as AB000001: scanned once, same rows'''
+    write_fasta(signature_run.seq_fname, SEQS)
+    tables = signature_run(genome_table([["AB000001"], ["AB000004"], ["AB000002"]]))
+    assert len(signature_run.scanned) == 2
+    for table in tables:
+        np.testing.assert_array_equal(table[0], table[1])
+
+    '''...including on a later run that only has the other accession'''
+    signature_run(genome_table([["AB000004"]]))
+    assert signature_run.scanned == []
+
+def test_translation_table_is_part_of_key(signature_run):
+    write_fasta(signature_run.seq_fname, SEQS)
+    signature_run(genome_table([["AB000001"]], [1]))
+    signature_run(genome_table([["AB000001"]], [11]))
+    assert signature_run.scanned == [("AB000001",)]
+
+def test_cache_invalidated_by_db_and_cutoffs(signature_run):
+    write_fasta(signature_run.seq_fname, SEQS)
+    genomes = genome_table([["AB000001"], ["AB000002"]])
+    signature_run(genomes)
+    for payload in [{"HMMER_C_EValue_Cutoff": 1e-5}, {"HMMER_HitScore_Cutoff": 10}, {"ProteinLength_Cutoff": 50}]:
+        signature_run(genomes, **payload)
+        assert len(signature_run.scanned) == 2, payload
+    signature_run.write_db("PPHMM DB v2")
+    signature_run(genomes)
+    assert len(signature_run.scanned) == 2
+
+def test_fingerprint_depends_on_db_and_cutoffs(tmp_path):
+    db = tmp_path / "db.hmm"
+    db.write_text("v1")
+    payload = {"HMMER_C_EValue_Cutoff": 1e-3, "HMMER_HitScore_Cutoff": 0, "ProteinLength_Cutoff": 100}
+    base = pphmmdb_fingerprint(str(db), payload, 10)
+    assert pphmmdb_fingerprint(str(db), payload, 10) == base
+    assert pphmmdb_fingerprint(str(db), payload, 11) != base
+    assert pphmmdb_fingerprint(str(db), {**payload, "HMMER_HitScore_Cutoff": 5}, 10) != base
+    db.write_text("v2")
+    assert pphmmdb_fingerprint(str(db), payload, 10) != base
+
+def test_cache_entry_round_trip_and_truncated_entry(tmp_path):
+    cache = SignatureCache(str(tmp_path), "f" * 64, 6)
+    rows = (np.array([0, -30.0, 0, 0, 12, 0]), np.array([0, 30.0, 0, 0, 12, 0]), np.array([0, 5.5, 0, 0, 7, 0]))
+    assert cache.get("ab" * 32) is None
+    cache.put("ab" * 32, *rows)
+    assert_tables_equal(cache.get("ab" * 32), rows)
+    with open(cache.entry_fname("ab" * 32), "r+b") as f:
+        f.truncate(10)
+    assert cache.get("ab" * 32) is None
+
+def test_pool_executor_matches_serial(signature_run):
+    '''Pool workers return rows to the main loop, which writes the cache and checkpoint'''
+    write_fasta(signature_run.seq_fname, SEQS)
+    genomes = genome_table([["AB000001"], ["AB000002"], ["AB000003"], ["AB000004"]])
+    serial = signature_run(genomes, UseCache=False)
+    for executor in ["pool", "batched"]:
+        assert_tables_equal(signature_run(genomes, UseCache=False, N_CPUs=2, SignatureExecutor=executor, SignatureBatchSize=2), serial)
+    pooled = signature_run(genomes, N_CPUs=2, SignatureExecutor="pool")
+    assert_tables_equal(pooled, serial)
+    signature_run(genomes)
+    assert signature_run.scanned == []
@@ -0,0 +1,50 @@
+import glob
+import os
+import numpy as np
+import pytest
+
+from app.utils.signature_cache import SignatureCheckpoint
+from tests.conftest import genome_table, write_fasta
+
+SEQS = {f"AB00000{i}": "ATG" + "ACGT"[i % 4] * (30 + 7 * i) + "TAA" for i in range(1, 7)}
+
+def checkpoint_fnames(signature_run):
+    return glob.glob(f"{signature_run.fnames['HMMERDir']}/hmmscan_*/checkpoint.p")
+
+def test_interrupted_run_resumes_with_identical_tables(signature_run):
+    '''Cache off, so finished genomes can only come back from the checkpoint'''
+    write_fasta(signature_run.seq_fname, SEQS)
+    genomes = genome_table([[SeqID] for SeqID in SEQS])
+    reference = signature_run(genomes, UseCache=False)
+
+    signature_run.fail_after = 4
+    with pytest.raises(RuntimeError):
+        signature_run(genomes, UseCache=False)
+    assert len(checkpoint_fnames(signature_run)) == 1
+
+    '''Killed mid-write: a truncated trailing record is dropped on load'''
+    with open(checkpoint_fnames(signature_run)[0], "ab") as f:
+        f.write(b"\x80\x04\x95partial")
+
+    signature_run.fail_after = None
+    resumed = signature_run(genomes, UseCache=False)
+    assert len(signature_run.scanned) == len(SEQS) - 4
+    for table_a, table_b in zip(reference, resumed):
+        np.testing.assert_array_equal(table_a, table_b)
+
+    '''Finished run removes its HMMER dir, checkpoint included'''
+    assert checkpoint_fnames(signature_run) == []
+    assert glob.glob(f"{signature_run.fnames['HMMERDir']}/hmmscan_*") == []
+
+def test_checkpoint_load_truncates_to_last_complete_record(tmp_path):
+    checkpoint = SignatureCheckpoint(f"{tmp_path}/checkpoint.p", 4)
+    rows = (np.array([0, 1.0, 0, 2.0]), np.array([0, 1.0, 0, 2.0]), np.array([0, 3.0, 0, 4.0]))
+    checkpoint.append("a", *rows)
+    checkpoint.append("b", *rows)
+    good_size = os.path.getsize(checkpoint.fname)
+    with open(checkpoint.fname, "ab") as f:
+        f.write(b"\x80\x04")
+    done = checkpoint.load()
+    assert sorted(done) == ["a", "b"]
+    assert os.path.getsize(checkpoint.fname) == good_size
+    np.testing.assert_array_equal(done["b"][2], rows[2])
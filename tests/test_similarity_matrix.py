@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.dcor import dcor
+from app.utils.similarity_matrix_constructor import SimilarityMat_Constructor, pphmm_neighbour_weight_table
+
+def synthetic_tables(rng, N_Viruses, N_PPHMMs, tmp_dir, density=0.2, Row0Score=None):
+    '''
+    Sparse signature table with a run of equal scores (a neighbourhood) in every third virus; locations where hit.
+    Row0Score, if given, is the first virus's score for every PPHMM (one neighbourhood, whose largest score is
+    weighted up; this virus's first thresholding follows two weightings)
+    '''
+    PPHMMSignatureTable = rng.random((N_Viruses, N_PPHMMs)) * 100 * (rng.random((N_Viruses, N_PPHMMs)) < density)
+    for Virus_i in range(0, N_Viruses, 3):
+        Start = rng.integers(0, N_PPHMMs - 10)
+        PPHMMSignatureTable[Virus_i, Start:Start + rng.integers(5, 10)] = rng.random() * 100 + 1
+    if Row0Score is not None:
+        PPHMMSignatureTable[0] = Row0Score
+    PPHMMLocationTable = rng.random((N_Viruses, N_PPHMMs)) * 5000 * (PPHMMSignatureTable > 0)
+    GOMSignatureTable = rng.random((N_Viruses, 10)) * (rng.random((N_Viruses, 10)) < 0.5)
+
+    Names, Header = [f"Virus_{i}" for i in range(N_Viruses)], ["Virus name"] + [f"PPHMM|{i}" for i in range(N_PPHMMs)]
+    fnames = {"PphmmLocs": f"{tmp_dir}/locs.csv", "PphmmAndGomSigs": f"{tmp_dir}/sigs.csv"}
+    pd.DataFrame(np.column_stack((Names, PPHMMLocationTable)), columns=Header).to_csv(fnames["PphmmLocs"], index=False)
+    pd.DataFrame(np.column_stack((Names, PPHMMSignatureTable)), columns=Header).to_csv(fnames["PphmmAndGomSigs"])
+    return PPHMMSignatureTable, GOMSignatureTable, PPHMMLocationTable, fnames
+
+def pphmm_neighbourhood_weights_reference(fnames):
+    '''
+    The profile loop pphmm_neighbour_weight_table replaced. Find neighbourhoods (runs of at least MIN_NEIGH_SIZE hits, in order of mean PPHMM location) in each virus's
+    PPHMM signature, from the PPHMM location and signature CSVs. Returns {virus: [PPHMM indices]} to be weighted
+    down (all but each neighbourhood's highest score) and up (each neighbourhood's highest score).
+    '''
+    loc_df = pd.read_csv(fnames["PphmmLocs"], index_col=False)
+    trim_df = loc_df.iloc[:,1:]
+    trim_df = trim_df.apply(pd.to_numeric)
+    '''Replace non-hits with NaN so as to not mess up mean calculations'''
+    trim_df = trim_df.replace(0, np.nan)
+    means = trim_df.mean().to_list()
+    means_indices = np.argsort(means)
+
+    # TODO SWITCH DISTANCE TO SIG TABLE AS PPHMM DIST MAX MAY != SIG MAX
+    sig_df = pd.read_csv(fnames["PphmmAndGomSigs"], index_col=False)
+    sig_trim_df = sig_df.iloc[:,2:]
+    sig_trim_df = sig_trim_df.apply(pd.to_numeric)
+    sig_trim_df = sig_trim_df.replace(0, np.nan)
+
+    all_dists = []
+    for row in np.array(sig_trim_df): # WAS trim_df
+        dists = []
+        for i in range(row.shape[0]):
+            dists.append(round(np.abs(row[i] - means[i]), 4) if not row[i] == np.nan else 0)
+        all_dists.append(dists)
+    '''Rearrange matrix X to PPHMM loc order and Y to match GRAViTy heatmap (i.e. calculated tree)'''
+    distance_arr = np.nan_to_num(np.array(all_dists).T[means_indices].T, 0)
+
+    AMP_SINGLETONS = True
+    neighbourhoods = {}
+    for row_idx, row in enumerate(distance_arr):
+        neighbourhood = 0
+        for prof_idx, prof in enumerate(row):
+            if prof_idx == 0:
+                '''Skip first'''
+                continue
+
+            if prof != 0:
+                '''If current profile is a hit...'''
+                if AMP_SINGLETONS:
+                    neighbourhood += 1
+                else:
+                    if row[prof_idx-1] != 0:
+                        neighbourhood += 1
+                if prof_idx == len(row) - 1:
+                    '''If last entry and a hit'''
+                    if not row_idx in neighbourhoods:
+                        neighbourhoods[row_idx] = {}
+                    # RM TODO < If neigh == prof_idx (i.e. all), row[prof_idx-neighbourhood-1] == -1 which breaks everything TODO CHECK LOGIC
+                    # neighbourhoods[row_idx].update({prof_idx-neighbourhood: [neighbourhood+1, row[prof_idx-neighbourhood-1:prof_idx]]})
+                    neighbourhoods[row_idx].update({prof_idx-neighbourhood: [neighbourhood+1, row[prof_idx-neighbourhood:prof_idx]]})
+
+            else:
+                '''If current not a hit...'''
+                if neighbourhood == 0:
+                    '''But no prior hit, continue'''
+                    continue
+                else:
+                    '''If prior was a hit, sub dict: {start idx: [len, vals]}'''
+                    if not row_idx in neighbourhoods:
+                        neighbourhoods[row_idx] = {}
+                    neighbourhoods[row_idx].update({prof_idx-neighbourhood: [neighbourhood+1, row[prof_idx-neighbourhood-1:prof_idx]]})
+                    neighbourhood = 0
+
+    MIN_NEIGH_SIZE = 5
+    neigh_neg_weights = {}
+    neigh_pos_weights = {}
+    for row_key, row in neighbourhoods.items():
+        for nei_key, nei in row.items():
+            if nei[0] < MIN_NEIGH_SIZE:
+                continue
+            else:
+                if row_key not in neigh_neg_weights.keys():
+                    neigh_neg_weights[row_key] = []
+                idxs = [i+nei_key for i in range(len(nei[1]))]
+                '''Select largest parameter of neigh, select largest and non-largest'''
+                if not row_key in neigh_pos_weights.keys():
+                    neigh_pos_weights[row_key] = []
+                neigh_pos_weights[row_key] = neigh_pos_weights[row_key] + [np.argmax(nei[1]) + nei_key]
+                del idxs[np.argmax(nei[1])]                 # Delete largest number's idx
+                neigh_neg_weights[row_key] = neigh_neg_weights[row_key] + idxs
+
+    '''Reverse sort'''
+    reversed = np.argsort(means_indices)
+    unsort_neigh_neg_weights = {}
+    for row_idx, row in neigh_neg_weights.items():
+        '''Convert neg weight indices back to original'''
+        unsort_neigh_neg_weights[row_idx] = []
+        for prof in row:
+            unsort_neigh_neg_weights[row_idx].append(np.where(reversed == prof)[0][0])
+    unsort_neigh_pos_weights = {}
+    for row_idx, row in neigh_pos_weights.items():
+        '''Convert pos weight indices back to original'''
+        unsort_neigh_pos_weights[row_idx] = []
+        for prof in row:
+            unsort_neigh_pos_weights[row_idx].append(np.where(reversed == prof)[0][0])
+
+    return unsort_neigh_neg_weights, unsort_neigh_pos_weights
+
+def generalised_jaccard(a, b):
+    return np.sum(np.minimum(a, b)) / np.sum(np.maximum(a, b)) if not np.sum(np.maximum(a, b)) == 0 else 0
+
+def similarity_matrix_reference(PPHMMSignatureTable, GOMSignatureTable, PPHMMLocationTable, pphmm_neighbourhood_weight,
+                                pphmm_signature_score_threshold, SimilarityMeasurementScheme, p, fnames):
+    '''
+    The pair-by-pair loop SimilarityMat_Constructor replaced. At every pair, both rows of PPHMMSignatureTable are
+    weighted by their neighbourhood weights and thresholded in place, so weights compound
+    '''
+    N_Viruses = PPHMMSignatureTable.shape[0]
+    PPHMMSignature_GJMat, GOMSignature_GJMat, PPHMMLocation_dCorMat = (np.zeros((N_Viruses, N_Viruses)) for _ in range(3))
+    NegWeights, PosWeights = pphmm_neighbourhood_weights_reference(fnames)
+    for i in range(N_Viruses):
+        for j in range(i, N_Viruses):
+            if "P" in SimilarityMeasurementScheme:
+                PPHMMSignature_i, PPHMMSignature_j = PPHMMSignatureTable[i], PPHMMSignatureTable[j]
+                for Virus_k, PPHMMSignature in [(i, PPHMMSignature_i), (j, PPHMMSignature_j)]:
+                    if Virus_k in NegWeights:
+                        PPHMMSignature[NegWeights[Virus_k]] = PPHMMSignature[NegWeights[Virus_k]] * (1 - pphmm_neighbourhood_weight)
+                        PPHMMSignature[PosWeights[Virus_k]] = PPHMMSignature[PosWeights[Virus_k]] * (1 + pphmm_neighbourhood_weight)
+                PPHMMSignature_i[PPHMMSignature_i < pphmm_signature_score_threshold] = 0
+                PPHMMSignature_j[PPHMMSignature_j < pphmm_signature_score_threshold] = 0
+                PPHMMSignature_GJMat[i, j] = PPHMMSignature_GJMat[j, i] = generalised_jaccard(PPHMMSignature_i, PPHMMSignature_j)
+            if "G" in SimilarityMeasurementScheme:
+                GOMSignature_GJMat[i, j] = GOMSignature_GJMat[j, i] = generalised_jaccard(GOMSignatureTable[i], GOMSignatureTable[j])
+            if "L" in SimilarityMeasurementScheme:
+                Present = (PPHMMLocationTable[i] != 0) | (PPHMMLocationTable[j] != 0)
+                PPHMMLocation_dCorMat[i, j] = PPHMMLocation_dCorMat[j, i] = dcor(PPHMMLocationTable[i][Present].reshape(-1, 1),
+                                                                                 PPHMMLocationTable[j][Present].reshape(-1, 1))
+    for Mat in (PPHMMSignature_GJMat, GOMSignature_GJMat, PPHMMLocation_dCorMat):
+        Mat[np.isnan(Mat) | (Mat < 0)] = 0
+    SimilarityMat = {"P": PPHMMSignature_GJMat, "G": GOMSignature_GJMat, "L": PPHMMLocation_dCorMat,
+                     "PG": (PPHMMSignature_GJMat * GOMSignature_GJMat) ** 0.5, "PL": PPHMMSignature_GJMat * PPHMMLocation_dCorMat}[SimilarityMeasurementScheme]
+    return SimilarityMat ** float(p)
+
+def neighbour_weight_factors_reference(fnames, N_Viruses, N_PPHMMs, Weight):
+    '''Factors the pair loop applies per use: 1 - weight on PPHMMs weighted down, then 1 + weight on those weighted up'''
+    NegWeights, PosWeights = pphmm_neighbourhood_weights_reference(fnames)
+    Factors = np.ones((N_Viruses, N_PPHMMs))
+    for row_idx in NegWeights:
+        Factors[row_idx, NegWeights[row_idx]] *= 1 - Weight
+        Factors[row_idx, PosWeights[row_idx]] *= 1 + Weight
+    return Factors
+
+@pytest.mark.parametrize("N_Viruses, N_PPHMMs, density", [(60, 40, 0.2), (60, 40, 0.7), (60, 40, 0.95), (200, 300, 0.5)])
+def test_neighbour_weight_table_matches_profile_loop(tmp_path, N_Viruses, N_PPHMMs, density):
+    '''Dense tables give adjacent neighbourhoods and runs reaching the last PPHMM, as well as isolated ones'''
+    rng = np.random.default_rng(N_Viruses + N_PPHMMs)
+    _, _, _, fnames = synthetic_tables(rng, N_Viruses, N_PPHMMs, tmp_path, density)
+    Weight = 0.0125
+    Table = pphmm_neighbour_weight_table(fnames, Weight)
+    Factors = np.ones((N_Viruses, N_PPHMMs))
+    Rows, Cols = Table.nonzero()
+    Factors[Rows, Cols] = Table[Rows, Cols]
+    np.testing.assert_allclose(Factors, neighbour_weight_factors_reference(fnames, N_Viruses, N_PPHMMs, Weight), rtol=0, atol=1e-12)
+    assert len(Rows) > 0 and not np.any(Table.data == 1)
+    assert pphmm_neighbour_weight_table(fnames, Weight) is Table
+
+@pytest.mark.parametrize("N_Viruses, N_PPHMMs, Row0Score, Weight, Threshold, Scheme, N_CPUs", [
+    pytest.param(30, 40, 18.5, 0.05, 20, "PG", 1, id="row0_weighted_twice_before_thresholding"),
+    (60, 50, None, 0.0125, 0, "PG", 1),
+    (60, 50, None, 0.05, 20, "P", 2),
+    (40, 30, None, 0.05, 10, "PL", 1),
+])
+def test_matches_pair_loop(tmp_path, N_Viruses, N_PPHMMs, Row0Score, Weight, Threshold, Scheme, N_CPUs):
+    rng = np.random.default_rng(N_Viruses + N_PPHMMs)
+    PPHMMSignatureTable, GOMSignatureTable, PPHMMLocationTable, fnames = synthetic_tables(rng, N_Viruses, N_PPHMMs, tmp_path, Row0Score=Row0Score)
+    RefTable, NewTable = PPHMMSignatureTable.copy(), PPHMMSignatureTable.copy()
+    reference = similarity_matrix_reference(RefTable, GOMSignatureTable, PPHMMLocationTable, Weight, Threshold, Scheme, 1.0, fnames)
+    SimMat = SimilarityMat_Constructor(NewTable, GOMSignatureTable, PPHMMLocationTable, None, Weight, Threshold, Scheme, 1.0, fnames,
+                                       N_CPUs=N_CPUs, BlockSize=16)
+    if Row0Score is not None:
+        '''Row 0 scores in [threshold/f**2, threshold/f) are kept by the pair loop if weighted up, as it is weighted twice before thresholding'''
+        assert RefTable[0].any(), "No weighted-up row 0 entry kept by the pair loop; case not exercised"
+    np.testing.assert_allclose(SimMat, reference, rtol=0, atol=1e-12)
+    '''The signature table is left weighted and thresholded in place, as the pair loop left it'''
+    np.testing.assert_allclose(NewTable, RefTable, rtol=1e-12, atol=0)
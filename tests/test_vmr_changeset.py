@@ -0,0 +1,131 @@
+import json
+import numpy as np
+
+from app.utils.gomdb_constructor import GOMDB_Constructor
+from app.utils.sequence_store import SequenceStore
+from app.utils.signature_cache import SignatureCache
+from app.utils.vmr_changeset import TAXONOMY_COLUMNS, compute_vmr_changeset, record_sequence_changes, load_applicable_changeset, \
+    current_run_state, member_key
+from tests.conftest import write_fasta
+
+def vmr_table(Genomes):
+    '''Parsed VMR from (SeqIDList, TaxoGrouping, TranslTable) rows'''
+    table = {col: np.array([""] * len(Genomes)) for col in TAXONOMY_COLUMNS}
+    table["TaxoGroupingList"] = np.array([Group for _, Group, _ in Genomes])
+    table["VirusNameList"] = np.array([f"Virus {member_key(SeqIDList)}" for SeqIDList, _, _ in Genomes])
+    table["TranslTableList"] = np.array([TranslTable for _, _, TranslTable in Genomes])
+    table["SeqIDLists"] = np.empty(len(Genomes), dtype="object")
+    for GenomeIdx, (SeqIDList, _, _) in enumerate(Genomes):
+        table["SeqIDLists"][GenomeIdx] = list(SeqIDList)
+    return table
+
+OLD = [(["AB000001"], "G1", 1), (["AB000002", "AB000003"], "G1", 1), (["AB000004"], "G2", 1), (["AB000005"], "G2", 1),
+       (["AB000006"], "G3", 1)]
+NEW = [(["AB000001"], "G1", 1), (["AB000002", "AB000003"], "G2", 1), (["AB000004"], "G2", 11), (["AB000005"], "G2", 1),
+       (["AB000007"], "G3", 1)]
+
+def test_compute_vmr_changeset():
+    changeset = compute_vmr_changeset(vmr_table(OLD), vmr_table(NEW))
+    assert changeset.added == ["AB000007"]
+    assert changeset.removed == ["AB000006"]
+    assert changeset.retaxonomised == ["AB000002", "AB000003"]
+    assert changeset.sequence_changed == ["AB000004"]
+    assert changeset.genomes_to_recompute() == [2, 4] and changeset.genomes_to_relabel() == [1]
+    assert changeset.summary() == "1 added, 1 removed, 2 re-taxonomised, 1 sequence-changed, 2 unchanged accessions"
+    assert compute_vmr_changeset(vmr_table(OLD), vmr_table(OLD)).is_empty()
+
+    '''Segments moved between genomes change both'''
+    moved = compute_vmr_changeset(vmr_table(OLD), vmr_table([(["AB000001", "AB000003"], "G1", 1), (["AB000002"], "G1", 1)] + OLD[2:]))
+    assert moved.sequence_changed == ["AB000001", "AB000003", "AB000002"] and moved.added == moved.removed == []
+
+SEQS = {f"AB00000{i}": "ATG" + "ACGT"[i % 4] * (30 + 7 * i) + "TAA" for i in range(1, 8)}
+
+def record_run(tmp_path, fnames, previous, table, seqs):
+    '''One run's ReadGenomeDescTable/PPHMMDB construction bookkeeping: changeset against previous parse, then sequence digests'''
+    fname = f"{tmp_path}/seqs_{len(list(tmp_path.glob('seqs_*')))}.fasta"
+    write_fasta(fname, seqs)
+    if previous is not None:
+        compute_vmr_changeset(previous, table).save(fnames["VmrChangeset"])
+    record_sequence_changes(fnames, table, SequenceStore(fname, f"{tmp_path}/store"))
+    if previous is None:
+        return None
+    with open(fnames["VmrChangeset"]) as f:
+        return json.load(f)
+
+def test_record_sequence_changes(tmp_path):
+    fnames = {"VmrChangeset": f"{tmp_path}/VmrChangeset.json", "SequenceDigests": f"{tmp_path}/SequenceDigests.json"}
+    old, new = vmr_table(OLD), vmr_table(NEW)
+    record_run(tmp_path, fnames, None, old, SEQS)
+    OldState = current_run_state(fnames, old)
+
+    '''Revised sequence of an otherwise unchanged accession; changeset is relative to the previous run'''
+    changeset = record_run(tmp_path, fnames, old, new, {**SEQS, "AB000001": SEQS["AB000001"] + "ACGT"})
+    assert changeset["sequence_changed"] == ["AB000001", "AB000004"]
+    assert changeset["genomes_to_recompute"] == [0, 2, 4] and changeset["n_unchanged"] == 1
+    assert changeset["base_state"] == OldState
+    assert load_applicable_changeset(fnames, new, OldState) is not None
+    assert load_applicable_changeset(fnames, new, "stale") is None
+
+    '''Repeated in the same run (e.g. after the sequence file is extended): base_state is kept, new revisions added'''
+    write_fasta(f"{tmp_path}/extended.fasta", {**SEQS, "AB000001": SEQS["AB000001"] + "ACGT", "AB000005": "ATGTAA"})
+    record_sequence_changes(fnames, new, SequenceStore(f"{tmp_path}/extended.fasta", f"{tmp_path}/store"))
+    with open(fnames["VmrChangeset"]) as f:
+        changeset = json.load(f)
+    assert changeset["sequence_changed"] == ["AB000001", "AB000004", "AB000005"] and changeset["base_state"] == OldState
+
+def test_changeset_not_applied_across_interrupted_run(tmp_path):
+    '''Results saved in run 1; run 2 parsed an edited VMR but stopped early; run 3's changeset is relative to run 2'''
+    fnames = {"VmrChangeset": f"{tmp_path}/VmrChangeset.json", "SequenceDigests": f"{tmp_path}/SequenceDigests.json"}
+    old, new = vmr_table(OLD), vmr_table(NEW)
+    record_run(tmp_path, fnames, None, old, SEQS)
+    SavedState = current_run_state(fnames, old)
+    record_run(tmp_path, fnames, old, new, SEQS)
+    record_run(tmp_path, fnames, new, new, SEQS)
+    assert load_applicable_changeset(fnames, new, SavedState) is None
+    assert load_applicable_changeset(fnames, new, current_run_state(fnames, new)) is not None
+
+def location_table(table, seed=0):
+    '''PPHMM locations per genome, determined by its member key (so unchanged genomes keep their row)'''
+    Rows = []
+    for SeqIDList, TranslTable in zip(table["SeqIDLists"], table["TranslTableList"]):
+        rng = np.random.default_rng(int(SignatureCache.genome_key(member_key(SeqIDList), TranslTable)[:8], 16) + seed)
+        Rows.append(rng.random(20) * (rng.random(20) < 0.4) * 5000)
+    return np.array(Rows)
+
+def test_gomdb_updated_from_changeset_equals_rebuild(tmp_path):
+    fnames = {"VmrChangeset": f"{tmp_path}/VmrChangeset.json", "SequenceDigests": f"{tmp_path}/SequenceDigests.json"}
+    old, new = vmr_table(OLD), vmr_table(NEW)
+    record_run(tmp_path, fnames, None, old, SEQS)
+    GOMDB = GOMDB_Constructor(old["TaxoGroupingList"], location_table(old), ["G1", "G2", "G3"],
+                              MemberKeys=[member_key(SeqIDList) for SeqIDList in old["SeqIDLists"]])
+    changeset = record_run(tmp_path, fnames, old, new, SEQS)
+
+    GOMIDList, MemberKeys = ["G1", "G2", "G3"], [member_key(SeqIDList) for SeqIDList in new["SeqIDLists"]]
+    Changed = load_applicable_changeset(fnames, new, changeset["base_state"]).changed_member_keys(
+        new, [Key for Members in GOMDB.members.values() for Key in Members])
+    assert Changed == {"AB000002/AB000003", "AB000004", "AB000006", "AB000007"}
+    Rebuilt = GOMDB.apply_changes(new["TaxoGroupingList"], location_table(new), GOMIDList, MemberKeys, Changed)
+    Reference = GOMDB_Constructor(new["TaxoGroupingList"], location_table(new), GOMIDList, MemberKeys=MemberKeys)
+    assert Rebuilt == ["G1", "G2", "G3"]
+    assert list(GOMDB.keys()) == list(Reference.keys())
+    for GOMID in GOMIDList:
+        assert GOMDB.members[GOMID] == Reference.members[GOMID] and GOMDB.digests[GOMID] == Reference.digests[GOMID]
+
+def test_signature_keys_reused_for_unchanged_genomes(signature_run, monkeypatch):
+    fnames = signature_run.fnames
+    old, new = vmr_table(OLD), vmr_table(NEW)
+    write_fasta(signature_run.seq_fname, SEQS)
+    record_sequence_changes(fnames, old, SequenceStore(signature_run.seq_fname, fnames["SequenceStoreDir"]))
+    signature_run(old, GenomeKeysFile=fnames["SignatureGenomeKeys"])
+
+    compute_vmr_changeset(old, new).save(fnames["VmrChangeset"])
+    record_sequence_changes(fnames, new, SequenceStore(signature_run.seq_fname, fnames["SequenceStoreDir"]))
+    Keyed = []
+    genome_key = SignatureCache.genome_key
+    monkeypatch.setattr(SignatureCache, "genome_key", staticmethod(lambda GenomeSeq, TranslTable: Keyed.append(TranslTable) or genome_key(GenomeSeq, TranslTable)))
+    incremental = signature_run(new, GenomeKeysFile=fnames["SignatureGenomeKeys"])
+    '''Only the sequence-changed (AB000004), added (AB000007) and re-taxonomised genomes are re-read'''
+    assert len(Keyed) == 3
+    assert sorted(signature_run.scanned) == [("AB000004",), ("AB000007",)]
+    for table_a, table_b in zip(incremental, signature_run(new, UseCache=False)):
+        np.testing.assert_array_equal(table_a, table_b)
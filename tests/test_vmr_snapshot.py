@@ -0,0 +1,52 @@
+import glob
+import numpy as np
+import pandas as pd
+
+from app.utils.vmr_snapshot import VMR_COLUMNS, vmr_snapshot_fname, load_vmr_snapshot
+from tests.conftest import EXAMPLE_VMR, read_vmr
+
+def assert_desc_tables_equal(a, b) -> None:
+    assert a.keys() == b.keys()
+    for col in a:
+        assert a[col].dtype == b[col].dtype and a[col].shape == b[col].shape, col
+        if col == "SeqIDLists":
+            assert [list(i) for i in a[col]] == [list(i) for i in b[col]]
+        else:
+            np.testing.assert_array_equal(a[col], b[col])
+
+def test_snapshot_round_trip(tmp_path, capsys):
+    reader, parsed = read_vmr(tmp_path)
+    snapshots = glob.glob(f"{tmp_path}/cache/vmr/*.parquet")
+    assert len(snapshots) == 1
+    _, restored = read_vmr(tmp_path)
+    assert "loading from snapshot" in capsys.readouterr().out
+    assert_desc_tables_equal(parsed, restored)
+
+    '''Columnar copy next to the pickle, readable a column at a time'''
+    columns, no_acc_cnt = load_vmr_snapshot(reader.fnames["ReadGenomeDescTableParquet"], columns=["GenusList", "SeqIDLists"])
+    assert list(columns) == ["GenusList", "SeqIDLists"] and no_acc_cnt == reader.no_acc_cnt
+    np.testing.assert_array_equal(columns["GenusList"], parsed["GenusList"])
+    assert set(VMR_COLUMNS) | {"DatabaseList"} == set(load_vmr_snapshot(snapshots[0])[0])
+
+def test_changed_vmr_or_options_are_reparsed(tmp_path, capsys):
+    _, parsed = read_vmr(tmp_path)
+    payload = {"TaxoGrouping_Header": "Taxonomic grouping", "AnnotateIncompleteGenomes": False}
+    base = vmr_snapshot_fname(EXAMPLE_VMR, payload, False, "vmr")
+    assert vmr_snapshot_fname(EXAMPLE_VMR, payload, True, "vmr") != base
+    assert vmr_snapshot_fname(EXAMPLE_VMR, {**payload, "AnnotateIncompleteGenomes": True}, False, "vmr") != base
+    assert vmr_snapshot_fname(EXAMPLE_VMR, {**payload, "TaxoGrouping_Header": "Genus"}, False, "vmr") != base
+
+    capsys.readouterr()
+    _, regrouped = read_vmr(tmp_path, TaxoGrouping_Header="Genus")
+    assert "loading from snapshot" not in capsys.readouterr().out
+    np.testing.assert_array_equal(regrouped["TaxoGroupingList"], parsed["GenusList"])
+
+    '''Edited VMR: new content hash, so new snapshot with the edit'''
+    df = pd.read_csv(EXAMPLE_VMR, index_col=0)
+    df.loc[df.index[2], "Genus"] = "Renamedvirus"
+    edited_fname = f"{tmp_path}/vmr.csv"
+    df.to_csv(edited_fname)
+    _, edited = read_vmr(tmp_path, edited_fname)
+    assert "loading from snapshot" not in capsys.readouterr().out
+    assert edited["GenusList"][2] == "Renamedvirus"
+    assert len(glob.glob(f"{tmp_path}/cache/vmr/*.parquet")) == 3